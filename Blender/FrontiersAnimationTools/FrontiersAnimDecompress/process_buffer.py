@@ -6,9 +6,50 @@ See bottom of file for struct of different byte streams
 """
 
 
-import bpy
 import io
+import os
 import ctypes
+import struct
+import numpy as np
+
+# Conversions stream_decode can apply, see DecompressStream.decode
+ORIENTATION_RAW = 0
+ORIENTATION_XZ = 1
+ORIENTATION_YX = 2
+ORIENTATION_ROOT_MOTION = 3
+
+LAYOUT_QVV = 0
+LAYOUT_MATRICES = 1
+LAYOUT_PLANES = 2
+LAYOUT_FLOATS = (12, 16, 10)  # Floats per track per frame of each layout
+
+# How a track's translation, rotation or scale is stored, see DecompressStream.track_types
+TRACK_DEFAULT = 0   # Identity, or the clip's default scale, on every frame
+TRACK_CONSTANT = 1  # Same value on every frame
+TRACK_ANIMATED = 2
+
+# ACL compression levels, slower levels search harder for the smallest bit rates within precision
+LEVEL_LOWEST = 0
+LEVEL_LOW = 1
+LEVEL_MEDIUM = 2
+LEVEL_HIGH = 3
+LEVEL_HIGHEST = 4
+
+
+class CompressSettings:
+    """
+    How compress_buffer compresses a raw buffer. precision is the largest error allowed on a bone in units, measured
+    shell_distance units away from it. track_precision and track_shell_distance optionally override them per track,
+    entries of 0 or less use the defaults. The defaults are what compress has always used.
+    """
+
+    def __init__(self, level=LEVEL_HIGHEST, precision=0.001, shell_distance=3.0, track_precision=None,
+                 track_shell_distance=None):
+        self.level = level
+        self.precision = precision
+        self.shell_distance = shell_distance
+        self.track_precision = track_precision
+        self.track_shell_distance = track_shell_distance
 
 
 class ACLCompressor:
@@ -16,37 +57,431 @@ class ACLCompressor:
         _fields_ = [("offset", ctypes.POINTER(ctypes.c_ubyte)),
                     ("size", ctypes.c_size_t)]
 
-    path = bpy.utils.user_resource('SCRIPTS', path='Addons\\FrontiersAnimationTools\\FrontiersAnimDecompress')
+    class StreamHeader(ctypes.Structure):
+        _fields_ = [("duration", ctypes.c_float),
+                    ("frame_rate", ctypes.c_float),
+                    ("frame_count", ctypes.c_uint32),
+                    ("track_count", ctypes.c_uint32)]
+
+    class DecodeOptions(ctypes.Structure):
+        _fields_ = [("orientation", ctypes.c_uint32),
+                    ("layout", ctypes.c_uint32),
+                    ("sanitize_scale", ctypes.c_uint32),
+                    ("root_track_count", ctypes.c_uint32),
+                    ("root_tracks", ctypes.c_void_p)]
+
+    class CompressOptions(ctypes.Structure):
+        _fields_ = [("level", ctypes.c_uint32),
+                    ("precision", ctypes.c_float),
+                    ("shell_distance", ctypes.c_float),
+                    ("track_setting_count", ctypes.c_uint32),
+                    ("track_precision", ctypes.c_void_p),
+                    ("track_shell_distance", ctypes.c_void_p)]
+
+    class ClipOptions(ctypes.Structure):
+        _fields_ = [("is_additive", ctypes.c_uint32),
+                    ("write_container", ctypes.c_uint32)]
+
+    # Nested classes can't see MemoryBuffer, so the fields are filled in from the class body
+    class ClipBuffers(ctypes.Structure):
+        pass
+
+    ClipBuffers._fields_ = [("main", MemoryBuffer),
+                            ("root", MemoryBuffer),
+                            ("error", ctypes.c_uint32)]
+
+    # DLL sits next to this file, found without bpy so the command-line converter can use it too
+    path = os.path.dirname(os.path.abspath(__file__))
     name = "FrontiersAnimDecompress.dll"
 
     def __init__(self):
-        self.dll = ctypes.CDLL(f"{self.path}\\{self.name}")
+        self.dll = ctypes.CDLL(os.path.join(self.path, self.name))
+        self.dll.decompress.argtypes = [ctypes.c_void_p]
         self.dll.decompress.restype = self.MemoryBuffer
+        self.dll.compress.argtypes = [ctypes.c_void_p]
         self.dll.compress.restype = self.MemoryBuffer
 
+        # DLLs built before free_buffer was exported leak their output buffers like they always did
+        self.can_free = hasattr(self.dll, "free_buffer")
+        if self.can_free:
+            self.dll.free_buffer.argtypes = [ctypes.POINTER(ctypes.c_ubyte)]
+            self.dll.free_buffer.restype = None
+
+        # Likewise for the streaming API, callers fall back to decompressing everything at once
+        self.can_stream = hasattr(self.dll, "stream_open")
+        if self.can_stream:
+            self.dll.stream_open.argtypes = [ctypes.c_void_p]
+            self.dll.stream_open.restype = ctypes.c_void_p
+            self.dll.stream_header.argtypes = [ctypes.c_void_p]
+            self.dll.stream_header.restype = self.StreamHeader
+            self.dll.stream_seek.argtypes = [ctypes.c_void_p, ctypes.c_uint32]
+            self.dll.stream_seek.restype = ctypes.c_uint32
+            self.dll.stream_decompress.argtypes = [ctypes.c_void_p, ctypes.c_uint32, ctypes.c_void_p, ctypes.c_size_t]
+            self.dll.stream_decompress.restype = ctypes.c_uint32
+            self.dll.stream_close.argtypes = [ctypes.c_void_p]
+            self.dll.stream_close.restype = None
+
+        self.can_sample = hasattr(self.dll, "stream_sample")
+        if self.can_sample:
+            self.dll.stream_sample.argtypes = [ctypes.c_void_p, ctypes.c_float, ctypes.c_void_p, ctypes.c_uint32,
+                                               ctypes.c_void_p, ctypes.c_size_t]
+            self.dll.stream_sample.restype = ctypes.c_uint32
+
+        self.can_decode = hasattr(self.dll, "stream_decode")
+        if self.can_decode:
+            self.dll.stream_decode.argtypes = [ctypes.c_void_p, ctypes.c_uint32, ctypes.POINTER(self.DecodeOptions),
+                                               ctypes.c_void_p, ctypes.c_size_t]
+            self.dll.stream_decode.restype = ctypes.c_uint32
+
+        self.can_report_types = hasattr(self.dll, "stream_track_types")
+        if self.can_report_types:
+            self.dll.stream_track_types.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t]
+            self.dll.stream_track_types.restype = ctypes.c_uint32
+
+        # Older DLLs always compress at the highest level with the same precision on every track
+        self.can_configure = hasattr(self.dll, "compress_with_options")
+        if self.can_configure:
+            self.dll.compress_with_options.argtypes = [ctypes.c_void_p, ctypes.POINTER(self.CompressOptions)]
+            self.dll.compress_with_options.restype = self.MemoryBuffer
+
+        # Main and root motion tracks in one call, optionally written straight into a PXD container
+        self.can_compress_clip = hasattr(self.dll, "compress_clip")
+        if self.can_compress_clip:
+            self.dll.compress_clip.argtypes = [ctypes.c_void_p, ctypes.c_void_p,
+                                               ctypes.POINTER(self.CompressOptions),
+                                               ctypes.POINTER(self.CompressOptions),
+                                               ctypes.POINTER(self.ClipOptions)]
+            self.dll.compress_clip.restype = self.ClipBuffers
+
+
+# Loading the DLL is slow compared to a single call, so keep one handle for the whole session
+_compressor = None
+
+
+def get_compressor():
+    global _compressor
+    if _compressor is None:
+        _compressor = ACLCompressor()
+    return _compressor
+
+
+class NativeBuffer:
+    """
+    Output buffer allocated by the DLL, readable without copying it into Python first.
+    Views returned by view() and array() point straight at native memory and must not be used after release().
+    """
+
+    def __init__(self, memory_buffer=None):
+        self._buffer = memory_buffer
+        self.size = memory_buffer.size if memory_buffer else 0
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+    def view(self):
+        if not self.size:
+            return memoryview(b"")
+        data = ctypes.cast(self._buffer.offset, ctypes.POINTER(ctypes.c_ubyte * self.size)).contents
+        return memoryview(data).cast('B')
+
+    def array(self, dtype=np.uint8, offset=0):
+        return np.frombuffer(self.view(), dtype=dtype, offset=offset)
+
+    def release(self):
+        if self._buffer is None:
+            return
+        comp = get_compressor()
+        if self.size and comp.can_free:
+            comp.dll.free_buffer(self._buffer.offset)
+        self._buffer = None
+        self.size = 0
+
+
+# ACL refuses compressed tracks that aren't 16 byte aligned
+INPUT_ALIGNMENT = 16
+
+
+# ctypes won't take memoryviews, mmaps or arrays as a c_void_p, so pass the address of the caller's memory instead.
+# Only copied when it isn't aligned, chunks of files mapped with PXDFile normally are.
+def _input_array(buffer):
+    array = np.frombuffer(buffer, dtype=np.uint8)
+    if array.ctypes.data % INPUT_ALIGNMENT:
+        aligned = np.empty(len(array) + INPUT_ALIGNMENT, dtype=np.uint8)
+        start = -aligned.ctypes.data % INPUT_ALIGNMENT
+        aligned = aligned[start:start + len(array)]
+        aligned[:] = array
+        array = aligned
+    return array
+
+
+def decompress_buffer(compressed_buffer):
+    if not len(compressed_buffer):
+        return NativeBuffer()
+    buffer_in = _input_array(compressed_buffer)
+    decompressed_buffer_ptr = get_compressor().dll.decompress(buffer_in.ctypes.data)
+    return NativeBuffer(decompressed_buffer_ptr)
+
+
+# Per-track settings padded to track_setting_count with 0, which stands for the default
+def _track_settings(values, track_setting_count):
+    array = np.zeros(track_setting_count, dtype=np.float32)
+    if values is not None:
+        array[:len(values)] = values
+    return array
+
+
+# CompressOptions for settings, None for the DLL's defaults.
+# Returns the options and the per-track arrays, which must stay referenced until the call returns.
+def _compress_options(settings):
+    if settings is None:
+        return None, ()
+    track_setting_count = max([len(values) for values in (settings.track_precision, settings.track_shell_distance)
+                               if values is not None], default=0)
+    track_precision = _track_settings(settings.track_precision, track_setting_count)
+    track_shell_distance = _track_settings(settings.track_shell_distance, track_setting_count)
+    options = ACLCompressor.CompressOptions(settings.level,
+                                            settings.precision,
+                                            settings.shell_distance,
+                                            track_setting_count,
+                                            track_precision.ctypes.data if track_setting_count else None,
+                                            track_shell_distance.ctypes.data if track_setting_count else None)
+    return options, (track_precision, track_shell_distance)
+
+
+# settings is an optional CompressSettings, ignored by DLLs that can't take them
+def compress_buffer(uncompressed_buffer, settings=None):
+    if not len(uncompressed_buffer):
+        return NativeBuffer()
+    buffer_in = _input_array(uncompressed_buffer)
+    comp = get_compressor()
+    if settings is None or not comp.can_configure:
+        return NativeBuffer(comp.dll.compress(buffer_in.ctypes.data))
+
+    options, track_arrays = _compress_options(settings)
+    return NativeBuffer(comp.dll.compress_with_options(buffer_in.ctypes.data, ctypes.byref(options)))
+
+
+# Errors compress_clip can report
+CLIP_OK = 0
+CLIP_MAIN_FAILED = 1
+CLIP_ROOT_FAILED = 2
+
+
+class CompressedClip:
+    """
+    Output of compress_clip. With container, main holds the whole .anm.pxd file and root is empty,
+    otherwise they hold the main and root motion chunks. Release them like any NativeBuffer.
+    """
+
+    def __init__(self, main=None, root=None, error=CLIP_OK):
+        self.main = main if main is not None else NativeBuffer()
+        self.root = root if root is not None else NativeBuffer()
+        self.error = error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def release(self):
+        self.main.release()
+        self.root.release()
+
+
+# Compress the main and root motion buffers of one clip in a single DLL call, which sets up the allocator once
+# and skips the root entirely when root_buffer is None. container writes the compressed PXD animation file
+# (see write_pxd_anim in pxd_anim.py) in native code too. Needs a DLL with can_compress_clip.
+def compress_clip(main_buffer, root_buffer=None, main_settings=None, root_settings=None, is_additive=False,
+                  container=False):
+    if not len(main_buffer):
+        return CompressedClip(error=CLIP_MAIN_FAILED)
+    main_in = _input_array(main_buffer)
+    root_in = _input_array(root_buffer) if root_buffer is not None else None
+    main_options, main_arrays = _compress_options(main_settings)
+    root_options, root_arrays = _compress_options(root_settings)
+    clip_options = ACLCompressor.ClipOptions(is_additive, container)
+
+    buffers = get_compressor().dll.compress_clip(main_in.ctypes.data,
+                                                 None if root_in is None else root_in.ctypes.data,
+                                                 None if main_options is None else ctypes.byref(main_options),
+                                                 None if root_options is None else ctypes.byref(root_options),
+                                                 ctypes.byref(clip_options))
+    return CompressedClip(NativeBuffer(buffers.main) if buffers.main.size else None,
+                          NativeBuffer(buffers.root) if buffers.root.size else None,
+                          buffers.error)
+
+
+class DecompressStream:
+    """
+    Compressed track list opened for reading a window of frames at a time into caller-owned arrays.
+    Frames come out as (frame, track, 12) float32, the same layout as the frames of a decompressed buffer.
+    """
+
+    def __init__(self, compressed_buffer):
+        self._stream = None
+        self.position = 0
+        comp = get_compressor()
+        if len(compressed_buffer):
+            self._stream = comp.dll.stream_open(_input_array(compressed_buffer).ctypes.data)
+        if not self._stream:
+            self.error = "Buffer failed to initialize"
+            return
+        header = comp.dll.stream_header(self._stream)
+        self.duration = header.duration
+        self.frame_rate = header.frame_rate
+        self.frame_count = header.frame_count
+        self.track_count = header.track_count
+        self.error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    # Native handle. Calls on a stream that failed to open or was closed raise instead of reaching the DLL
+    def _handle(self):
+        if not self._stream:
+            raise ValueError(getattr(self, "error", None) or "Stream is closed")
+        return self._stream
+
+    def seek(self, frame):
+        self.position = get_compressor().dll.stream_seek(self._handle(), frame)
+        return self.position
+
+    # Decompress frames [position, end) into out, or a new array if out is None, and move past them
+    def read(self, end=None, out=None):
+        stream = self._handle()
+        if end is None:
+            end = self.frame_count
+        end = min(end, self.frame_count)
+        if out is None:
+            out = np.empty((max(end - self.position, 0), self.track_count, 12), dtype=np.float32)
+        if out.dtype != np.float32 or not out.flags.c_contiguous:
+            raise ValueError("Output must be a contiguous float32 array")
+
+        frame_count = get_compressor().dll.stream_decompress(stream, end, out.ctypes.data, out.nbytes)
+        self.position += frame_count
+        return out[:frame_count]
+
+    # Like read, but with the DLL converting every transform on the way out instead of NumPy afterwards.
+    # orientation is one of the ORIENTATION_ constants, root_tracks lists the tracks of bones without a parent.
+    # layout picks the output: LAYOUT_QVV gives (frame, track, 12) tables like decode_pose_table in pose_arrays.py,
+    # LAYOUT_MATRICES (frame, track, 4, 4) matrices and LAYOUT_PLANES a (location, rotation, scale) tuple of arrays.
+    def decode(self, end=None, orientation=ORIENTATION_YX, root_tracks=(), layout=LAYOUT_QVV, sanitize_scale=True):
+        stream = self._handle()
+        if end is None:
+            end = self.frame_count
+        end = min(end, self.frame_count)
+        frame_count = max(end - self.position, 0)
+        out = np.empty(frame_count * self.track_count * LAYOUT_FLOATS[layout], dtype=np.float32)
+
+        root_list = np.ascontiguousarray(root_tracks, dtype=np.uint32)
+        options = ACLCompressor.DecodeOptions(orientation,
+                                              layout,
+                                              sanitize_scale,
+                                              len(root_list),
+                                              root_list.ctypes.data if len(root_list) else None)
+        frame_count = get_compressor().dll.stream_decode(stream, end, ctypes.byref(options),
+                                                         out.ctypes.data, out.nbytes)
+        self.position += frame_count
+
+        transform_count = frame_count * self.track_count
+        if layout == LAYOUT_PLANES:
+            location = out[:transform_count * 3].reshape(frame_count, self.track_count, 3)
+            rotation = out[transform_count * 3:transform_count * 7].reshape(frame_count, self.track_count, 4)
+            scale = out[transform_count * 7:transform_count * 10].reshape(frame_count, self.track_count, 3)
+            return location, rotation, scale
+        if layout == LAYOUT_MATRICES:
+            return out[:transform_count * 16].reshape(frame_count, self.track_count, 4, 4)
+        return out[:transform_count * 12].reshape(frame_count, self.track_count, 12)
+
+    # (track, 3) uint8 array of TRACK_ constants for the translation, rotation and scale of every track,
+    # the channel order of uncompressed PXD tracks
+    def track_types(self):
+        stream = self._handle()
+        types = np.empty((self.track_count, 3), dtype=np.uint8)
+        track_count = get_compressor().dll.stream_track_types(stream, types.ctypes.data, types.nbytes)
+        return types[:track_count]
+
+    # Pose at any time in seconds with ACL's interpolation between frames, as (track, 12) float32.
+    # tracks is an optional list of track indices, the output follows its order. The stream position is unchanged.
+    def sample(self, time, tracks=None, out=None):
+        stream = self._handle()
+        if tracks is None:
+            track_list = None
+            track_count = self.track_count
+        else:
+            track_list = np.ascontiguousarray(tracks, dtype=np.uint32)
+            track_count = len(track_list)
+        if out is None:
+            out = np.empty((track_count, 12), dtype=np.float32)
+        if out.dtype != np.float32 or not out.flags.c_contiguous:
+            raise ValueError("Output must be a contiguous float32 array")
+
+        written = get_compressor().dll.stream_sample(stream,
+                                                     time,
+                                                     None if track_list is None else track_list.ctypes.data,
+                                                     track_count,
+                                                     out.ctypes.data,
+                                                     out.nbytes)
+        return out[:written]
+
+    def close(self):
+        if self._stream:
+            get_compressor().dll.stream_close(self._stream)
+        self._stream = None
+
+
+# Yield (first frame, frame block) pairs covering frames [start, end) in blocks of at most block_size frames,
+# so long clips never need a table of every frame in memory. Blocks are (frame, track, 12) float32 arrays.
+def decompress_blocks(compressed_buffer, block_size=256, start=0, end=None):
+    if not get_compressor().can_stream:
+        with decompress_buffer(compressed_buffer) as buffer:
+            if not len(buffer):
+                return
+            duration, frame_rate, frame_count, track_count = struct.unpack_from('<ffII', buffer.view(), 0)
+            table = buffer.array(np.float32, offset=0x10).reshape(frame_count, track_count, 12)
+            end = frame_count if end is None else min(end, frame_count)
+            for block_start in range(start, end, block_size):
+                yield block_start, table[block_start:min(block_start + block_size, end)].copy()
+        return
+
+    with DecompressStream(compressed_buffer) as stream:
+        if stream.error:
+            return
+        end = stream.frame_count if end is None else min(end, stream.frame_count)
+        stream.seek(start)
+        while stream.position < end:
+            block_start = stream.position
+            block = stream.read(min(block_start + block_size, end))
+            # The position only moves when frames come out, stop instead of asking again forever
+            if not len(block):
+                raise ValueError(f"Failed to decompress frame {block_start}")
+            yield block_start, block
+
 
 def decompress(compressed_buffer):
-    comp = ACLCompressor()
-    if len(compressed_buffer):
-        decompressed_buffer_ptr = comp.dll.decompress(compressed_buffer)
-        if not decompressed_buffer_ptr.size:
-            return io.BytesIO()
-        decompressed_stream = bytes(decompressed_buffer_ptr.offset[:decompressed_buffer_ptr.size])
-        return io.BytesIO(decompressed_stream)
-    else:
-        return io.BytesIO()
-
-
-def compress(uncompressed_buffer):
-    comp = ACLCompressor()
-    if len(uncompressed_buffer):
-        compressed_buffer_ptr = comp.dll.compress(uncompressed_buffer)
-        if not compressed_buffer_ptr.size:
-            return io.BytesIO()
-        compressed_stream = bytes(compressed_buffer_ptr.offset[:compressed_buffer_ptr.size])
-        return io.BytesIO(compressed_stream)
-    else:
-        return io.BytesIO()
+    with decompress_buffer(compressed_buffer) as decompressed_buffer:
+        return io.BytesIO(decompressed_buffer.view())
+
+
+def compress(uncompressed_buffer, settings=None):
+    with compress_buffer(uncompressed_buffer, settings) as compressed_buffer:
+        return io.BytesIO(compressed_buffer.view())
 
 
 """
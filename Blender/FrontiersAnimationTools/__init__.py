@@ -1,14 +1,21 @@
-import bpy
-from bpy.props import (BoolProperty, FloatProperty)
+try:
+    import bpy
+except ModuleNotFoundError:
+    # Loaded outside of Blender by the command-line converter (python -m FrontiersAnimationTools)
+    bpy = None
 
-from .animation.anim_import import FrontiersAnimImport
-from .animation.anim_export import FrontiersAnimExport
-from .animation.batch_export import FrontiersAnimBatchExport
+if bpy:
+    from bpy.props import (BoolProperty, FloatProperty)
 
-from .skeleton.skeleton_export import HedgehogSkeletonExport
-from .skeleton.skeleton_import import HedgehogSkeletonImport
+    from .animation.anim_import import FrontiersAnimImport
+    from .animation.anim_export import FrontiersAnimExport
+    from .animation.batch_export import FrontiersAnimBatchExport
+    from .animation.anim_preview import FrontiersAnimPreview
 
-from .ui import side_panel
+    from .skeleton.skeleton_export import HedgehogSkeletonExport
+    from .skeleton.skeleton_import import HedgehogSkeletonImport
+
+    from .ui import side_panel
 
 
 bl_info = {
@@ -30,11 +37,13 @@ def register():
     bpy.utils.register_class(FrontiersAnimImport)
     bpy.utils.register_class(FrontiersAnimExport)
     bpy.utils.register_class(FrontiersAnimBatchExport)
+    bpy.utils.register_class(FrontiersAnimPreview)
 
     bpy.utils.register_class(HedgehogSkeletonImport)
     bpy.utils.register_class(HedgehogSkeletonExport)
 
     bpy.types.TOPBAR_MT_file_import.append(FrontiersAnimImport.menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.append(FrontiersAnimPreview.menu_func_import)
     bpy.types.TOPBAR_MT_file_export.append(FrontiersAnimExport.menu_func_export)
 
     bpy.types.TOPBAR_MT_file_import.append(HedgehogSkeletonImport.menu_func_import)
@@ -61,8 +70,8 @@ def register():
     )
     bpy.types.Action.pxd_compress = BoolProperty(
         name="Compress Animation",
-        description="Determines if animation gets compressed during batch export\n\n"
-        "(NOTE: Currently this setting is ignored and will always export compressed)",
+        description="Determines if animation gets compressed during batch export. "
+                    "Uncompressed animations export much faster and only store changed keyframes",
         default=True,
     )
     bpy.types.Action.pxd_additive = BoolProperty(
@@ -77,11 +86,13 @@ def unregister():
     bpy.utils.unregister_class(FrontiersAnimExport)
     bpy.utils.unregister_class(FrontiersAnimImport)
     bpy.utils.unregister_class(FrontiersAnimBatchExport)
+    bpy.utils.unregister_class(FrontiersAnimPreview)
 
     bpy.utils.unregister_class(HedgehogSkeletonImport)
     bpy.utils.unregister_class(HedgehogSkeletonExport)
 
     bpy.types.TOPBAR_MT_file_import.remove(FrontiersAnimImport.menu_func_import)
+    bpy.types.TOPBAR_MT_file_import.remove(FrontiersAnimPreview.menu_func_import)
     bpy.types.TOPBAR_MT_file_export.remove(FrontiersAnimExport.menu_func_export)
 
     bpy.types.TOPBAR_MT_file_import.remove(HedgehogSkeletonImport.menu_func_import)
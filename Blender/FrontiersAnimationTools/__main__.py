@@ -0,0 +1,171 @@
+"""
+Command-line converter for PXD animations, runs without Blender
+
+Usage (from the folder containing FrontiersAnimationTools):
+    python -m FrontiersAnimationTools to-raw     SOURCE DEST    # .anm.pxd -> .anm.raw
+    python -m FrontiersAnimationTools to-pxd     SOURCE DEST    # .anm.raw -> compressed .anm.pxd
+    python -m FrontiersAnimationTools compress   SOURCE DEST    # .anm.pxd -> compressed .anm.pxd
+    python -m FrontiersAnimationTools uncompress SOURCE DEST    # .anm.pxd -> uncompressed .anm.pxd
+
+SOURCE and DEST may both be directories, in which case every matching file under SOURCE is converted
+into the same relative path under DEST. See animation/pxd_anim.py for the raw pose format.
+Compressing commands take --profile fast, standard (default) or shipping, see animation/compress_profiles.py.
+Raw poses carry no bone names, so only the profile's level and precision apply, not its per-bone overrides.
+"""
+
+
+import argparse
+import os
+import struct
+import sys
+import time
+
+from .FrontiersAnimDecompress.process_buffer import compress_buffer
+from .animation.anim_load import load_anim
+from .animation.compress_profiles import PROFILES, compress_settings
+from .animation.pxd_anim import (RawPose,
+                                 densify_tracks,
+                                 raw_table_to_tracks,
+                                 raw_table_to_buffer,
+                                 write_pxd_anim,
+                                 write_pxd_anim_uncompressed,
+                                 write_raw_pose,
+                                 )
+
+PXD_EXT = ".anm.pxd"
+RAW_EXT = ".anm.raw"
+
+
+class PoseClip:
+    def __init__(self, duration, frame_rate, main_table, root_table=None, is_additive=False):
+        self.duration = duration
+        self.frame_rate = frame_rate
+        self.main_table = main_table
+        self.root_table = root_table
+        self.is_additive = is_additive
+
+
+def read_pxd(path):
+    loaded_anim = load_anim(path)
+    if loaded_anim.error:
+        raise ValueError(loaded_anim.error)
+    if loaded_anim.root_error:
+        raise ValueError(loaded_anim.root_error)
+    anim_param = loaded_anim.anim_param
+
+    if anim_param.is_compressed:
+        main_table = loaded_anim.main_table
+        root_table = loaded_anim.root_table
+    else:
+        main_table = densify_tracks(loaded_anim.main_tracks, anim_param.frame_count)
+        root_table = None
+        if loaded_anim.root_tracks is not None:
+            root_table = densify_tracks(loaded_anim.root_tracks, anim_param.frame_count)
+
+    return PoseClip(anim_param.duration, anim_param.frame_rate, main_table, root_table, anim_param.is_additive)
+
+
+def read_raw(path):
+    with open(path, "rb") as raw_file:
+        raw_pose = RawPose(raw_file)
+    if raw_pose.error:
+        raise ValueError(raw_pose.error)
+    return PoseClip(raw_pose.duration, raw_pose.frame_rate, raw_pose.main_table, raw_pose.root_table,
+                    raw_pose.is_additive)
+
+
+def compress_table(table, clip, settings=None):
+    with compress_buffer(raw_table_to_buffer(table, clip.duration, clip.frame_rate), settings) as buffer:
+        if not len(buffer):
+            raise ValueError("Buffer failed to compress")
+        return bytes(buffer.view())
+
+
+def write_compressed(path, clip, settings=None):
+    main_chunk = compress_table(clip.main_table, clip, settings)
+    root_chunk = compress_table(clip.root_table, clip, settings) if clip.root_table is not None else None
+    with open(path, "wb") as anim_file:
+        write_pxd_anim(anim_file, main_chunk, root_chunk, clip.duration, clip.main_table.shape[0],
+                       clip.main_table.shape[1], is_additive=clip.is_additive)
+
+
+def write_uncompressed(path, clip, settings=None):
+    main_tracks = raw_table_to_tracks(clip.main_table)
+    root_tracks = raw_table_to_tracks(clip.root_table) if clip.root_table is not None else None
+    with open(path, "wb") as anim_file:
+        write_pxd_anim_uncompressed(anim_file, main_tracks, root_tracks, clip.duration, clip.main_table.shape[0],
+                                    is_additive=clip.is_additive)
+
+
+def write_raw(path, clip, settings=None):
+    main_buffer = raw_table_to_buffer(clip.main_table, clip.duration, clip.frame_rate)
+    root_buffer = None
+    if clip.root_table is not None:
+        root_buffer = raw_table_to_buffer(clip.root_table, clip.duration, clip.frame_rate)
+    with open(path, "wb") as raw_file:
+        write_raw_pose(raw_file, main_buffer, root_buffer, is_additive=clip.is_additive)
+
+
+# command: (source extension, destination extension, reader, writer)
+COMMANDS = {
+    "to-raw": (PXD_EXT, RAW_EXT, read_pxd, write_raw),
+    "to-pxd": (RAW_EXT, PXD_EXT, read_raw, write_compressed),
+    "compress": (PXD_EXT, PXD_EXT, read_pxd, write_compressed),
+    "uncompress": (PXD_EXT, PXD_EXT, read_pxd, write_uncompressed),
+}
+
+
+# Pair every source file with its destination, mirroring directory layouts
+def collect_jobs(source, dest, source_ext, dest_ext):
+    if os.path.isfile(source):
+        if os.path.isdir(dest):
+            dest = os.path.join(dest, os.path.basename(source)[:-len(source_ext)] + dest_ext)
+        return [(source, dest)]
+
+    jobs = []
+    for root, dirs, files in os.walk(source):
+        for file_name in sorted(files):
+            if not file_name.endswith(source_ext):
+                continue
+            relative_dir = os.path.relpath(root, source)
+            dest_name = file_name[:-len(source_ext)] + dest_ext
+            jobs.append((os.path.join(root, file_name), os.path.normpath(os.path.join(dest, relative_dir, dest_name))))
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m FrontiersAnimationTools",
+                                     description="Convert Hedgehog Engine 2 PXD animations without Blender")
+    parser.add_argument("command", choices=COMMANDS.keys())
+    parser.add_argument("source", help="Source file or directory")
+    parser.add_argument("dest", help="Destination file or directory")
+    parser.add_argument("--profile", choices=[name[len("profile_"):] for name in PROFILES], default="standard",
+                        help="Compression profile of compressed output")
+    args = parser.parse_args(argv)
+
+    source_ext, dest_ext, reader, writer = COMMANDS[args.command]
+    settings = compress_settings(f"profile_{args.profile}")
+    jobs = collect_jobs(args.source, args.dest, source_ext, dest_ext)
+    if not jobs:
+        print(f"No {source_ext} files found in \"{args.source}\"")
+        return 1
+
+    start_time = time.time()
+    error_list = []
+    for i, (source_path, dest_path) in enumerate(jobs):
+        print(f"{i + 1} / {len(jobs)}\t{source_path}")
+        try:
+            clip = reader(source_path)
+            os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+            writer(dest_path, clip, settings)
+        except (OSError, ValueError, struct.error) as error:
+            print(f"{source_path}: {error}", file=sys.stderr)
+            error_list.append(source_path)
+
+    time_elapsed = time.time() - start_time
+    print(f"Converted {len(jobs) - len(error_list)} of {len(jobs)} animations in {round(time_elapsed, 2)} seconds.")
+    return 1 if error_list else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
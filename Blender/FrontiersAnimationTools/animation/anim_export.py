@@ -1,187 +1,105 @@
 import bpy
-import mathutils
-import math
-import struct
 import os
-import io
+import numpy as np
 from bpy_extras.io_utils import ExportHelper
 from bpy.props import (BoolProperty,
+                       EnumProperty,
+                       FloatProperty,
                        StringProperty,
                        CollectionProperty
                        )
-from ..FrontiersAnimDecompress.process_buffer import compress
+from .anim_write import ExportJob, write_anim
+from .compress_profiles import LEVEL_ITEMS, LEVELS, PROFILE_ITEMS, compress_settings, parse_overrides
+from .pose_arrays import encode_pose_table, encode_root_table, new_pose_buffer
+from .pose_sample import pose_sampler, preroll_frames
+from .skeleton_topology import SkeletonTopology
 
-RMS = 1 / math.sqrt(2)
-NULL = 0
 
+# Frames of pose matrices gathered before they're converted into the export buffer together
+SAMPLE_BLOCK_SIZE = 256
 
-# Function used by batch export, keep outside of operator class
-def anim_export(self_pass, filepath, arm_active, action_active, start_frame, end_frame, frame_rate):
+
+# Sample the action into raw buffers on Blender's thread, compression and writing is left to write_anim
+def sample_anim(self_pass, filepath, arm_active, action_active, start_frame, end_frame, frame_rate):
     frame_count = end_frame - start_frame + 1
     if frame_count > 1:
         duration = (frame_count - 1) / frame_rate
     else:
         duration = 0.0
-    bone_count = len(arm_active.pose.bones)
-
-    buffer_main = io.BytesIO()
-    buffer_root = io.BytesIO()
-
-    buffer_main.write(struct.pack('<f', duration))
-    buffer_main.write(struct.pack('<f', frame_rate))
-    buffer_main.write(struct.pack('<i', frame_count))
-    buffer_main.write(struct.pack('<i', bone_count))
+    pose_bones = arm_active.pose.bones
+    bone_count = len(pose_bones)
 
+    # Filled in place, then handed to compression as is
+    buffer_main, table_main = new_pose_buffer(duration, frame_rate, frame_count, bone_count)
+    buffer_root = None
     if self_pass.bool_root_motion:
-        buffer_root.write(struct.pack('<f', duration))
-        buffer_root.write(struct.pack('<f', frame_rate))
-        buffer_root.write(struct.pack('<i', frame_count))
-        buffer_root.write(struct.pack('<i', 1))
-
-    for frame in range(end_frame + 1):
-        if self_pass.bool_start_zero:
-            bpy.context.scene.frame_set(frame)
-            if frame < start_frame:
-                continue
-        elif frame >= start_frame:
-            bpy.context.scene.frame_set(frame)
-
-        # Build unscaled matrix map and separate scale map
-        matrix_map_temp = {}
-        scale_map_temp = {}
-        for pbone in arm_active.pose.bones:
-            tmp_loc, tmp_rot, tmp_scale = pbone.matrix.decompose()
-            tmp_matrix = mathutils.Matrix.LocRotScale(tmp_loc, tmp_rot, mathutils.Vector((1.0, 1.0, 1.0)))
-            matrix_map_temp.update({pbone.name: tmp_matrix})
-            scale_map_temp.update({pbone.name: pbone.scale.copy()})  # normal scale is different from matrix scale
-
-        # Negate unscaled parent matrices, write to buffer with actual scales
-        for pbone in arm_active.pose.bones:
-            if pbone.parent:
-                tmp_parent_matrix = matrix_map_temp[pbone.parent.name]
-                tmp_bone_length = pbone.length
-            else:
-                tmp_parent_matrix = mathutils.Matrix()
-                tmp_bone_length = 0.0
-            tmp_matrix = tmp_parent_matrix.inverted() @ matrix_map_temp[pbone.name]
-            tmp_loc, tmp_rot, tmp_scale = tmp_matrix.decompose()
-            tmp_scale = scale_map_temp[pbone.name]
-
-            if self_pass.bool_yx_skel:
-                if not pbone.parent:
-                    # Identity matrix to swap YX to XZ
-                    tmp_rot @= mathutils.Quaternion((0.5, 0.5, 0.5, 0.5))
-                buffer_main.write(struct.pack('<ffff', tmp_rot[2], tmp_rot[3], tmp_rot[1], tmp_rot[0]))
-                buffer_main.write(struct.pack('<fff', tmp_loc[1], tmp_loc[2], tmp_loc[0]))
-                buffer_main.write(struct.pack('<f', tmp_bone_length * tmp_scale[1]))
-                buffer_main.write(struct.pack('<fff', tmp_scale[1], tmp_scale[2], tmp_scale[0]))
-                buffer_main.write(struct.pack('<f', 1.0))
-            else:
-                buffer_main.write(struct.pack('<ffff', tmp_rot[1], tmp_rot[2], tmp_rot[3], tmp_rot[0]))
-                buffer_main.write(struct.pack('<fff', tmp_loc[0], tmp_loc[1], tmp_loc[2]))
-                buffer_main.write(struct.pack('<f', tmp_bone_length * tmp_scale[0]))
-                buffer_main.write(struct.pack('<fff', tmp_scale[0], tmp_scale[1], tmp_scale[2]))
-                buffer_main.write(struct.pack('<f', 1.0))
-
+        buffer_root, table_root = new_pose_buffer(duration, frame_rate, frame_count, 1)
+        root_loc = np.empty((frame_count, 3), dtype=np.float32)
+        root_rot = np.empty((frame_count, 4), dtype=np.float32)
+        root_scale = np.empty((frame_count, 3), dtype=np.float32)
+
+    parents = SkeletonTopology(arm_active).parents
+    lengths = np.empty(bone_count, dtype=np.float32)
+    pose_bones.foreach_get("length", lengths)
+    block_size = min(SAMPLE_BLOCK_SIZE, frame_count)
+    matrices = np.empty((block_size, bone_count, 4, 4), dtype=np.float32)
+    scales = np.empty((block_size, bone_count, 3), dtype=np.float32)
+
+    sampler, blocker = pose_sampler(arm_active, action_active, use_direct=self_pass.bool_fast_sampling)
+    if blocker:
+        self_pass.report({'INFO'}, f"Sampling {action_active.name} with scene updates: {blocker}")
+    for frame in preroll_frames(sampler, start_frame, self_pass.bool_start_zero):
+        sampler.preroll(frame)
+
+    for f, frame in enumerate(range(start_frame, end_frame + 1)):
+        sampler.sample(frame)
+        sampler.read_pose(matrices[f % block_size], scales[f % block_size])
         if self_pass.bool_root_motion:
-            tmp_loc = arm_active.location.copy()
-            tmp_rot = mathutils.Quaternion((RMS, -RMS, 0.0, 0.0)) @ arm_active.rotation_quaternion.copy()
-            tmp_scale = arm_active.scale.copy()
-
-            buffer_root.write(struct.pack('<ffff', tmp_rot[1], tmp_rot[2], tmp_rot[3], tmp_rot[0]))
-            buffer_root.write(struct.pack('<fff', tmp_loc[0], tmp_loc[2], -tmp_loc[1]))
-            buffer_root.write(struct.pack('<f', 0.0))
-            buffer_root.write(struct.pack('<fff', tmp_scale[0], tmp_scale[1], tmp_scale[2]))
-            buffer_root.write(struct.pack('<f', 1.0))
-
-    main_buffer_compressed = compress(buffer_main.getvalue())
-    if not len(main_buffer_compressed.getvalue()):
-        self_pass.report({'WARNING'}, f"{action_active.name} buffer failed to compress.")
-        return False
-
-    root_buffer_compressed = compress(buffer_root.getvalue())
-    if not len(root_buffer_compressed.getvalue()) and self_pass.bool_root_motion is True:
-        self_pass.report({'WARNING'}, f"{action_active.name} root buffer failed to compress.")
-        return False
+            root_loc[f] = sampler.location
+            root_rot[f] = sampler.rotation_quaternion
+            root_scale[f] = sampler.scale
 
-    del buffer_main
-    del buffer_root
+        # Convert a whole block of frames at once
+        if f % block_size == block_size - 1 or frame == end_frame:
+            block_start = f - f % block_size
+            count = f - block_start + 1
+            encode_pose_table(matrices[:count], scales[:count], parents, lengths, use_yx=self_pass.bool_yx_skel,
+                              out=table_main[block_start:f + 1])
 
-    with open(filepath, "wb") as file:
-        main_buffer_size = main_buffer_compressed.getbuffer().nbytes
-        root_buffer_size = root_buffer_compressed.getbuffer().nbytes
-
-        if self_pass.bool_root_motion and root_buffer_size:
-            main_chunk_size = main_buffer_size + 0x10 - main_buffer_size % 0x10
-            root_chunk_size = root_buffer_size + 4 - root_buffer_size % 4
-            file_size = 0x80 + main_chunk_size + root_chunk_size + 4
-        else:
-            file_size = 0x80 + main_buffer_size + 4 - main_buffer_size % 4 + 4
-
-        # BINA
-        bin_magic = bytes('BINA210L', 'ascii')
-        file.write(bin_magic)
-        file.write(struct.pack('<i', file_size))
-        file.write(struct.pack('<i', 1))
-
-        # DATA
-        data_magic = bytes('DATA', 'ascii')
-        file.write(data_magic)
-        file.write(struct.pack('<i', file_size - 0x10))
-        file.write(struct.pack('<i', file_size - 0x10 - 0x34))
-        file.write(struct.pack('<i', 0))
-
-        file.write(struct.pack('<i', 4))
-        file.write(struct.pack('<i', 0x18))
-        file.write(NULL.to_bytes(24, 'little'))
-
-        # PXAN
-        pxan_magic = bytes('NAXP', 'ascii')
-        file.write(pxan_magic)
-        file.write(struct.pack('<i', 0x200))
-        if self_pass.bool_additive:
-            file.write(struct.pack('<B', 1))
-        else:
-            file.write(struct.pack('<B', 0))
-
-        if self_pass.bool_compress:
-            file.write(struct.pack('<B', 8))
-        else:
-            file.write(struct.pack('<B', 0))
-
-        file.write(NULL.to_bytes(2, 'little'))
-        file.write(NULL.to_bytes(4, 'little'))
-
-        file.write(struct.pack('<i', 0x18))
-        file.write(struct.pack('<i', 0))
-        file.write(struct.pack('<f', duration))
-        file.write(struct.pack('<i', frame_count))
-
-        file.write(struct.pack('<i', bone_count))
-        file.write(struct.pack('<i', 0))
-        file.write(struct.pack('<q', 0x40))
+    if self_pass.bool_root_motion:
+        encode_root_table(root_loc, root_rot, root_scale, out=table_root)
+
+    return ExportJob(filepath,
+                     action_active.name,
+                     buffer_main,
+                     buffer_root,
+                     duration,
+                     frame_count,
+                     bone_count,
+                     is_additive=self_pass.bool_additive,
+                     is_compressed=self_pass.bool_compress,
+                     compress_settings=self_pass.compress_settings)
+
+
+# CompressSettings from an export operator's compression options, for the bones of arm_active.
+# Raises ValueError if the precision overrides can't be read.
+def get_compress_settings(self_pass, arm_active):
+    return compress_settings(self_pass.enum_compress_profile,
+                             [pbone.name for pbone in arm_active.pose.bones],
+                             parse_overrides(self_pass.string_precision_overrides),
+                             level=LEVELS[self_pass.enum_compress_level],
+                             precision=self_pass.float_compress_precision)
 
-        # Root offset
-        if root_buffer_size:
-            file.write(struct.pack('<q', main_buffer_size + 0x40 + 0x10 - main_buffer_size % 0x10))
-        else:
-            file.write(struct.pack('<q', 0))
-        file.write(struct.pack('<q', 0))
-
-        # Compressed track
-        file.write(main_buffer_compressed.getvalue())
-        if root_buffer_size:
-            file.write(NULL.to_bytes(0x10 - main_buffer_size % 0x10, 'little'))
-            # Root track
-            file.write(root_buffer_compressed.getvalue())
-            file.write(NULL.to_bytes(4 - root_buffer_size % 4, 'little'))
-            file.write(struct.pack('<i', 0x00424644))
-        else:
-            file.write(NULL.to_bytes(4 - main_buffer_size % 4, 'little'))
-            file.write(struct.pack('<i', 0x00004644))
 
+# Function used by batch export, keep outside of operator class
+def anim_export(self_pass, filepath, arm_active, action_active, start_frame, end_frame, frame_rate):
+    error = write_anim(sample_anim(self_pass, filepath, arm_active, action_active, start_frame, end_frame, frame_rate))
+    if error:
+        self_pass.report({'WARNING'}, error)
+        return False
     return True
 
+
 class FrontiersAnimExport(bpy.types.Operator, ExportHelper):
     bl_idname = "export_anim.frontiers_anim"
     bl_label = "Export"
@@ -215,8 +133,46 @@ class FrontiersAnimExport(bpy.types.Operator, ExportHelper):
 
     bool_compress: BoolProperty(
         name="Compress Animation",
-        description="ACL compress animation to reduce file size\n\n"
-        "(NOTE: Uncompressed animation export currently unsupported)",
+        description="ACL compress animation to reduce file size. Uncompressed animations are much quicker to export "
+                    "and only store the keyframes where a bone's transform changes",
+        default=True,
+    )
+
+    enum_compress_profile: EnumProperty(
+        items=PROFILE_ITEMS,
+        name="Compression Profile",
+        description="How hard ACL works on the file size, and how much error each bone may have",
+        default="profile_standard",
+    )
+
+    enum_compress_level: EnumProperty(
+        items=LEVEL_ITEMS,
+        name="Compression Level",
+        description="Compression level of the Custom profile",
+        default="level_highest",
+    )
+
+    float_compress_precision: FloatProperty(
+        name="Precision",
+        description="Largest error allowed on any bone with the Custom profile, in Blender units",
+        default=0.001,
+        min=0.00001,
+        soft_max=0.1,
+        precision=5,
+        step=0.01,
+    )
+
+    string_precision_overrides: StringProperty(
+        name="Precision Overrides",
+        description="Per-bone precision on top of the profile's, as comma separated bone name=precision pairs. "
+                    "Names may use * wildcards, such as \"*Finger*=0.005, Hips=0.0001\"",
+        default="",
+    )
+
+    bool_fast_sampling: BoolProperty(
+        name="Fast Sampling",
+        description="Evaluate the action's F-curves directly instead of updating the whole scene every frame. "
+                    "Rigs with constraints, drivers or NLA tracks are always sampled with scene updates",
         default=True,
     )
 
@@ -225,7 +181,9 @@ class FrontiersAnimExport(bpy.types.Operator, ExportHelper):
         description="Enable to start sampling the animation from frame 0 regardless of the specified frame range. "
                     "Will not affect output frame range.\n\n"
                     "(NOTE: Will take longer if animation starts in middle of timeline, but useful for advanced users "
-                    "using features such as physics simulations)",
+                    "using features such as physics simulations. Frames before the range are skipped for baked "
+                    "simulations. Unbaked simulations are run again from their start frame for every action, bake "
+                    "them to skip that)",
         default=False,
     )
 
@@ -238,12 +196,23 @@ class FrontiersAnimExport(bpy.types.Operator, ExportHelper):
         ui_root_row.prop(self, "bool_root_motion", )
         ui_zero_row = ui_scene_box.row()
         ui_zero_row.prop(self, "bool_start_zero", )
+        ui_fast_row = ui_scene_box.row()
+        ui_fast_row.prop(self, "bool_fast_sampling", )
         ui_additive_row = ui_scene_box.row()
         ui_additive_row.prop(self, "bool_additive", )
         ui_compress_row = ui_scene_box.row()
         ui_compress_row.prop(self, "bool_compress", )
-        # TODO: Implement uncompressed animation export
-        ui_compress_row.enabled = False
+        ui_compress_box = ui_scene_box.column()
+        ui_compress_box.enabled = self.bool_compress
+        ui_profile_row = ui_compress_box.row()
+        ui_profile_row.label(text="Compression:")
+        ui_profile_row.prop(self, "enum_compress_profile", text="")
+        ui_custom_row = ui_compress_box.row(align=True)
+        ui_custom_row.enabled = self.enum_compress_profile == "profile_custom"
+        ui_custom_row.prop(self, "enum_compress_level", text="")
+        ui_custom_row.prop(self, "float_compress_precision")
+        ui_overrides_row = ui_compress_box.row()
+        ui_overrides_row.prop(self, "string_precision_overrides", text="Overrides")
 
         ui_bone_box = layout.box()
         ui_bone_box.label(text="Armature Settings", icon='ARMATURE_DATA')
@@ -273,6 +242,11 @@ class FrontiersAnimExport(bpy.types.Operator, ExportHelper):
 
         action_active = arm_active.animation_data.action
         frame_rate = scene_active.render.fps / scene_active.render.fps_base
+        try:
+            self.compress_settings = get_compress_settings(self, arm_active)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
 
         if not anim_export(self,
                            self.filepath,
@@ -1,43 +1,39 @@
 import bpy
 import mathutils
-import math
-import struct
 import os
-import io
-import time
+import numpy as np
 from bpy_extras.io_utils import ImportHelper
 from bpy.props import (BoolProperty,
+                       FloatProperty,
+                       IntProperty,
                        StringProperty,
                        EnumProperty,
                        CollectionProperty
                        )
-from ..FrontiersAnimDecompress.process_buffer import decompress
+from .anim_load import PoseDecode, prefetch_anims
+from ..FrontiersAnimDecompress.process_buffer import TRACK_ANIMATED
+from .decode_cache import DecodeCache
+from .pxd_anim import densify_tracks, track_key_mask
+from .pose_arrays import (ROT, LOC, SCALE,
+                          compose_matrices,
+                          decode_pose_table,
+                          decode_root_table
+                          )
+from .skeleton_topology import SkeletonTopology
+from .track_map import TrackMap, find_skeleton, skeleton_track_map
 from .console_output import BatchProgress
+from .fcurve_write import write_pose_fcurves, write_object_fcurves
+from .key_reduction import reduce_pose_keys, static_key_mask
 
-RMS = 1 / math.sqrt(2)
 
-
-# Convert to global matrix with locations being unaffected by scale
-def get_matrix_map_global(obj, matrix_map_local, scale_map):
-    # Get global matrix of raw bone tracks, which are relative to parent track's local space.
-    # Location is assumed to be unaffected by scale. Parent bone scaling in Blender affects locations
-    # of child bones, so final position and rotation matrices must be calculated without scale first.
+# Build one frame's global matrices from SkeletonTopology.global_transforms output.
+# Locations are unaffected by parent scale, so the unscaled transform is combined with the accumulated scale.
+def get_matrix_map_global(topology, global_loc, global_rot, global_scale):
     matrix_map_global = {}
-    for pbone in obj.pose.bones:
-        matrix = mathutils.Matrix()
-        scale = scale_map[pbone.name].copy()
-
-        # Get final transform matrix and scale separately
-        for parent_bone in reversed(pbone.parent_recursive):
-            if parent_bone.name in matrix_map_local:
-                matrix @= matrix_map_local[parent_bone.name]
-                scale *= scale_map[parent_bone.name]
-        matrix @= matrix_map_local[pbone.name]
-
-        # Substitute proper scale in matrix with unscaled bone transform
-        tmp_loc, tmp_rot, tmp_scale = matrix.decompose()
-        matrix = mathutils.Matrix.LocRotScale(tmp_loc, tmp_rot, scale)
-        matrix_map_global.update({pbone.name: matrix})
+    for b, name in enumerate(topology.names):
+        matrix_map_global[name] = mathutils.Matrix.LocRotScale(mathutils.Vector(global_loc[b]),
+                                                               mathutils.Quaternion(global_rot[b]),
+                                                               mathutils.Vector(global_scale[b]))
     return matrix_map_global
 
 
@@ -98,108 +94,69 @@ def set_pose_matrices_global(obj, matrix_map_global, frame, keyframe_rules=None,
             rec(pbone, None)
 
 
-# Parse keyframes into nested list for uncompressed animations
-def get_uncompressed_frame_table(anim_file, frame_count, track_count, table_offset):
-    # track_table[frame index][track index][loc/rot/scale]
-    # avoid bones/dictionaries so function may be used for root motion
-    frame_table = []
-    for frame in range(frame_count):
-        tmp_track_table = []
-        for track in range(track_count):
-            tmp_track_table.append([None, None, None])  # Location, Rotation, Scale
-        frame_table.append(tmp_track_table)
-
-    for track in range(track_count):
-        anim_file.seek(table_offset + 0x48 * track)
-
-        loc_count = int.from_bytes(anim_file.read(8), byteorder='little')
-        loc_frame_offset = int.from_bytes(anim_file.read(8), byteorder='little') + 0x40
-        loc_data_offset = int.from_bytes(anim_file.read(8), byteorder='little') + 0x40
-
-        rot_count = int.from_bytes(anim_file.read(8), byteorder='little')
-        rot_frame_offset = int.from_bytes(anim_file.read(8), byteorder='little') + 0x40
-        rot_data_offset = int.from_bytes(anim_file.read(8), byteorder='little') + 0x40
-
-        scale_count = int.from_bytes(anim_file.read(8), byteorder='little')
-        scale_frame_offset = int.from_bytes(anim_file.read(8), byteorder='little') + 0x40
-        scale_data_offset = int.from_bytes(anim_file.read(8), byteorder='little') + 0x40
-
-        for i in range(loc_count):
-            anim_file.seek(loc_frame_offset + 0x2 * i)
-            tmp_frame = int.from_bytes(anim_file.read(2), byteorder='little')
-            anim_file.seek(loc_data_offset + 0x10 * i)
-            tmp_loc = struct.unpack('<fff', anim_file.read(0xC))
-            frame_table[tmp_frame][track][0] = tmp_loc
-
-        for i in range(rot_count):
-            anim_file.seek(rot_frame_offset + 0x2 * i)
-            tmp_frame = int.from_bytes(anim_file.read(2), byteorder='little')
-            anim_file.seek(rot_data_offset + 0x10 * i)
-            tmp_rot = struct.unpack('<ffff', anim_file.read(0x10))
-            frame_table[tmp_frame][track][1] = tmp_rot
-
-        for i in range(scale_count):
-            anim_file.seek(scale_frame_offset + 0x2 * i)
-            tmp_frame = int.from_bytes(anim_file.read(2), byteorder='little')
-            anim_file.seek(scale_data_offset + 0x10 * i)
-            tmp_scale = struct.unpack('<fff', anim_file.read(0xC))
-            frame_table[tmp_frame][track][2] = tmp_scale
-
-    return frame_table
-
-
-class PXDAnimParam:
-    def __init__(self, file):
-        self.name = str()
-        file.seek(8)
-        file_size = int.from_bytes(file.read(4), byteorder='little')
-
-        file.seek(0x40)
-        magic = file.read(4)
-        if magic != b'NAXP':
-            self.error = f"Not a valid PXD animation file"
-            return
-        version = int.from_bytes(file.read(4), byteorder='little')
-        if version != 512:
-            self.error = "Unsupported PXD version"
-            return
-        flag_additive = int.from_bytes(file.read(1), byteorder='little')
-        flag_compressed = int.from_bytes(file.read(1), byteorder='little')
-
-        if flag_additive == 1:
-            self.is_additive = True
-        else:
-            self.is_additive = False
+# Same conversion as set_pose_matrices_global, but collects the local matrices instead of writing them to the pose
+def get_pose_matrices_basis(obj, matrix_map_global):
+    matrix_map_basis = {}
 
-        if flag_compressed == 8:
-            self.is_compressed = True
+    def rec(pbone, parent_matrix):
+        if pbone.name in matrix_map_global:
+            matrix = matrix_map_global[pbone.name]
+            if pbone.parent:
+                matrix_basis = pbone.bone.convert_local_to_pose(matrix,
+                                                                pbone.bone.matrix_local,
+                                                                parent_matrix=parent_matrix,
+                                                                parent_matrix_local=pbone.parent.bone.matrix_local,
+                                                                invert=True)
+            else:
+                matrix_basis = pbone.bone.convert_local_to_pose(matrix,
+                                                                pbone.bone.matrix_local,
+                                                                invert=True)
         else:
-            self.is_compressed = False
+            matrix_basis = pbone.matrix_basis.copy()
+            if pbone.parent:
+                matrix = pbone.bone.convert_local_to_pose(matrix_basis,
+                                                          pbone.bone.matrix_local,
+                                                          parent_matrix=parent_matrix,
+                                                          parent_matrix_local=pbone.parent.bone.matrix_local)
+            else:
+                matrix = pbone.bone.convert_local_to_pose(matrix_basis, pbone.bone.matrix_local)
+        matrix_map_basis[pbone.name] = matrix_basis
+
+        for child in pbone.children:
+            rec(child, matrix)
+
+    for pbone in obj.pose.bones:
+        if not pbone.parent:
+            rec(pbone, None)
+    return matrix_map_basis
 
-        file.seek(0x58)
-        self.duration = struct.unpack('<f', file.read(4))[0]
-        self.frame_count = int.from_bytes(file.read(4), byteorder='little')
-        if self.duration != 0.0:
-            self.frame_rate = (self.frame_count - 1) / self.duration
-        else:
-            self.frame_rate = 30.0
-        self.track_count = int.from_bytes(file.read(8), byteorder='little')
-        self.main_offset = int.from_bytes(file.read(8), byteorder='little')
-        if self.main_offset:
-            self.main_offset += 0x40
-        else:
-            self.main_offset = None
 
-        self.root_offset = int.from_bytes(file.read(8), byteorder='little')
-        if self.root_offset:
-            self.root_offset += 0x40
+# Store local matrices of one frame into (frame, bone, n) arrays for write_pose_fcurves, bones ordered like names
+def store_pose_matrices_basis(names, matrix_map_basis, frame, loc, rot, scale):
+    for b, name in enumerate(names):
+        tmp_loc, tmp_rot, tmp_scale = matrix_map_basis[name].decompose()
+        loc[frame, b] = tmp_loc
+        rot[frame, b] = tmp_rot
+        scale[frame, b] = tmp_scale
 
-        # Animations compressed with old FrontiersAnimDecompress had non-existent root chunk offsets beyond EOF
-        if (self.root_offset > (file_size - 0x40)) or (not self.root_offset):
-            self.root_offset = None
 
-        file.seek(0)
-        self.error = None
+# TrackMap from an operator's enum_track_mapping and string_skeleton_path, for anim_path's skeleton.
+# Errors are reported through self_pass and give None.
+def get_track_map(self_pass, arm_active, topology, anim_path):
+    if self_pass.enum_track_mapping != "map_names":
+        return TrackMap.by_order(len(topology))
+
+    skeleton_path = bpy.path.abspath(self_pass.string_skeleton_path) if self_pass.string_skeleton_path else find_skeleton(anim_path)
+    if not skeleton_path:
+        self_pass.report({'ERROR'}, "No skeleton to match track names with. Please pick the animations' .skl.pxd.")
+        return None
+    track_map = skeleton_track_map(skeleton_path, topology.names)
+    if track_map.error:
+        self_pass.report({'ERROR'}, f"{os.path.basename(skeleton_path)}: {track_map.error}")
+        return None
+    if track_map.unmatched_count:
+        self_pass.report({'INFO'}, f"{track_map.unmatched_count} bones of \"{arm_active.data.name}\" have no track in {os.path.basename(skeleton_path)} and are left at their rest pose.")
+    return track_map
 
 
 class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
@@ -227,12 +184,113 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
         default=True,
     )
 
+    bool_fast_keying: BoolProperty(
+        name="Fast Keyframe Writing",
+        description="Compute every frame first and write whole F-curves at once instead of inserting keyframes one by one",
+        default=True,
+    )
+
+    int_prefetch_workers: IntProperty(
+        name="Decompression Workers",
+        description="Number of background processes that read and decompress upcoming files while the current one is "
+                    "keyed. Only used when importing more than one file, 0 loads every file on Blender's thread",
+        default=4,
+        min=0,
+        soft_max=32,
+    )
+
+    int_decode_cache_size: IntProperty(
+        name="Decode Cache Size (MB)",
+        description="Disk space kept for decompressed animations, so files imported again load without being "
+                    "decompressed. Least recently used files are removed first, 0 disables the cache",
+        default=256,
+        min=0,
+        soft_max=4096,
+    )
+
     bool_keyframe_needed: BoolProperty(
         name="Insert Needed Keyframes Only",
-        description="Refrains from inserting keyframes if values are exact same as previous frame (not working)",
+        description="Leave out keyframes that linear interpolation between the remaining ones reproduces within "
+                    "the tolerance. Channels that never move get a single keyframe",
         default=False,
     )
 
+    float_key_tolerance: FloatProperty(
+        name="Tolerance",
+        description="Largest difference from the original animation allowed when leaving out keyframes, "
+                    "in Blender units for location and in raw values for rotation and scale",
+        default=0.0001,
+        min=0.0,
+        soft_max=0.01,
+        precision=5,
+        step=0.001,
+    )
+
+    bool_frame_range: BoolProperty(
+        name="Limit Frame Range",
+        description="Only decompress and key the frames between Start and End. Keyframes keep their frame numbers "
+                    "from the file, so they line up with the full animation",
+        default=False,
+    )
+
+    int_frame_start: IntProperty(
+        name="Start",
+        description="First frame of the animation to import",
+        default=0,
+        min=0,
+    )
+
+    int_frame_end: IntProperty(
+        name="End",
+        description="Last frame of the animation to import, clamped to the animation's last frame",
+        default=0,
+        min=0,
+    )
+
+    enum_bone_subset: EnumProperty(
+        items=[
+            ("bones_all", "All", "Key every bone of the armature", 1),
+            ("bones_names", "Names", "Key the bones listed in Bone Names", 2),
+            ("bones_collection", "Collection", "Key the bones in a bone collection", 3),
+            ("bones_selected", "Selected", "Key the selected bones", 4),
+        ],
+        name="Bones",
+        description="Bones that get keyframes. Bones above them in the hierarchy are still read to place them, "
+                    "but aren't keyed",
+        default="bones_all",
+    )
+
+    string_bone_names: StringProperty(
+        name="Bone Names",
+        description="Comma separated names of the bones to key",
+        default="",
+    )
+
+    string_bone_collection: StringProperty(
+        name="Bone Collection",
+        description="Bone collection whose bones are keyed",
+        default="",
+    )
+
+    enum_track_mapping: EnumProperty(
+        items=[
+            ("map_order", "Bone Order", "Track order matches the armature's bone order, like armatures imported from a .skl.pxd", 1),
+            ("map_names", "Bone Names", "Match tracks to bones by name, using the bone names of the animation's .skl.pxd. "
+                                        "Bones without a track of the same name are left at their rest pose", 2),
+        ],
+        name="Track Mapping",
+        description="How animation tracks are matched to the armature's bones",
+        default="map_order",
+    )
+
+    string_skeleton_path: StringProperty(
+        name="Skeleton",
+        description="The .skl.pxd the animations were made for. "
+                    "When empty, the only .skl.pxd in the animations' folder is used",
+        subtype='FILE_PATH',
+        default="",
+    )
+
     enum_loop_check: EnumProperty(
         items=[
             ("loop_auto", "Auto", "Pad the animation if \"_loop\" is in the file name", 1),
@@ -251,6 +309,8 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
         self.bool_skel_conv = False
         self.keyframe_rules = set()
         self.frame_count_loop = 0
+        self.frame_start = 0
+        self.frame_end = 0
         self.pad_loop = False
 
     def draw(self, context):
@@ -265,9 +325,27 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
         ui_scene_row_root_motion = ui_scene_box.row()
         ui_scene_row_root_motion.prop(self, "bool_root_motion", )
 
-        # Currently not working as expected, meant to only insert keyframes if local transform is different
-        # ui_scene_row_needed = ui_scene_box.row()
-        # ui_scene_row_needed.prop(self, "bool_keyframe_needed")
+        ui_scene_row_fast = ui_scene_box.row()
+        ui_scene_row_fast.prop(self, "bool_fast_keying", )
+
+        ui_scene_row_workers = ui_scene_box.row()
+        ui_scene_row_workers.prop(self, "int_prefetch_workers", )
+
+        ui_scene_row_cache = ui_scene_box.row()
+        ui_scene_row_cache.prop(self, "int_decode_cache_size", )
+
+        ui_scene_row_needed = ui_scene_box.row()
+        ui_scene_row_needed.prop(self, "bool_keyframe_needed")
+        ui_scene_row_tolerance = ui_scene_box.row()
+        ui_scene_row_tolerance.enabled = self.bool_keyframe_needed
+        ui_scene_row_tolerance.prop(self, "float_key_tolerance")
+
+        ui_scene_row_range = ui_scene_box.row()
+        ui_scene_row_range.prop(self, "bool_frame_range")
+        ui_scene_row_frames = ui_scene_box.row(align=True)
+        ui_scene_row_frames.enabled = self.bool_frame_range
+        ui_scene_row_frames.prop(self, "int_frame_start")
+        ui_scene_row_frames.prop(self, "int_frame_end")
 
         ui_bone_box = layout.box()
         ui_bone_box.label(text="Armature Settings", icon='ARMATURE_DATA')
@@ -275,6 +353,24 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
         ui_orientation_row = ui_bone_box.row()
         ui_orientation_row.prop(self, "bool_yx_skel", )
 
+        ui_bone_row_mapping = ui_bone_box.row()
+        ui_bone_row_mapping.label(text="Track Mapping:")
+        ui_bone_row_mapping.prop(self, "enum_track_mapping", text="")
+        if self.enum_track_mapping == "map_names":
+            ui_bone_box.row().prop(self, "string_skeleton_path")
+
+        ui_bone_row_subset = ui_bone_box.row()
+        ui_bone_row_subset.label(text="Bones:")
+        ui_bone_row_subset.prop(self, "enum_bone_subset", text="")
+        if self.enum_bone_subset == "bones_names":
+            ui_bone_box.row().prop(self, "string_bone_names", text="")
+        elif self.enum_bone_subset == "bones_collection":
+            obj = context.active_object
+            if obj and obj.type == 'ARMATURE':
+                ui_bone_box.row().prop_search(self, "string_bone_collection", obj.data, "collections_all", text="")
+            else:
+                ui_bone_box.row().prop(self, "string_bone_collection", text="")
+
     @classmethod
     def poll(cls, context):
         obj = context.active_object
@@ -283,6 +379,26 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
         else:
             return False
 
+    # Sorted pose.bones indices of the bones picked by enum_bone_subset, None for every bone
+    def get_bone_subset(self, arm_active):
+        if self.enum_bone_subset == "bones_names":
+            names = [name.strip() for name in self.string_bone_names.split(",") if name.strip()]
+            missing = [name for name in names if name not in self.topology.index]
+            if missing:
+                self.report({'WARNING'}, f"Bones not found in \"{arm_active.data.name}\": {', '.join(missing)}")
+            bones = [self.topology.index[name] for name in names if name in self.topology.index]
+        elif self.enum_bone_subset == "bones_collection":
+            collection = arm_active.data.collections_all.get(self.string_bone_collection)
+            if collection is None:
+                self.report({'WARNING'}, f"Bone collection \"{self.string_bone_collection}\" not found in \"{arm_active.data.name}\"")
+                return np.empty(0, dtype=np.int32)
+            bones = [self.topology.index[bone.name] for bone in collection.bones]
+        elif self.enum_bone_subset == "bones_selected":
+            bones = [b for b, bone in enumerate(arm_active.pose.bones) if bone.bone.select]
+        else:
+            return None
+        return np.unique(np.array(bones, dtype=np.int32))
+
     def execute(self, context):
         # Scene check and setup
         arm_active = context.active_object
@@ -299,25 +415,79 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
         bone_count = len(arm_active.pose.bones)
         for bone in arm_active.data.bones:
             bone.inherit_scale = 'ALIGNED'
+        self.topology = SkeletonTopology(arm_active)
+
+        frame_range = None
+        if self.bool_frame_range:
+            if self.int_frame_end < self.int_frame_start:
+                self.report({'ERROR'}, f"Frame range end ({self.int_frame_end}) is before its start ({self.int_frame_start}).")
+                return {'CANCELLED'}
+            frame_range = (self.int_frame_start, self.int_frame_end + 1)
+
+        # Bones are worked out on the smallest topology that can place the keyed ones
+        bone_subset = self.get_bone_subset(arm_active)
+        if bone_subset is None:
+            self.bone_topology = self.topology
+            self.keyed_bones = np.ones(bone_count, dtype=bool)
+            self.key_table = None
+        elif not len(bone_subset):
+            self.report({'ERROR'}, "No bones to import. Please pick at least one bone.")
+            return {'CANCELLED'}
+        else:
+            self.bone_topology = self.topology.subset(bone_subset)
+            self.keyed_bones = np.isin(self.bone_topology.bones, bone_subset)
+            keyed_names = {self.topology.names[b] for b in bone_subset}
+            self.key_table = {name: [name in keyed_names] * 3 for name in self.topology.names}
+
+        self.track_map = get_track_map(self, arm_active, self.topology, self.filepath)
+        if self.track_map is None:
+            return {'CANCELLED'}
 
         # Status logging
         self.progress = BatchProgress(self, num_items=len(self.files), method='IMPORT')
 
-        for f, file in enumerate(self.files):
+        # Reading, parsing and decompression of upcoming files runs in worker processes while this thread keys
+        filepaths = [os.path.join(os.path.dirname(self.filepath), file.name) for file in self.files]
+        # Compressed tracks come out of the DLL already in Blender's convention, the tracks of bones without parents
+        # get the YX root correction
+        root_tracks = self.track_map.bones[self.topology.roots]
+        decode = PoseDecode(self.bool_yx_skel, root_tracks[root_tracks >= 0])
+        decode_cache = DecodeCache(max_size=self.int_decode_cache_size * 1024 * 1024) if self.int_decode_cache_size else None
+        loaded_anims = prefetch_anims(filepaths,
+                                      load_root=self.bool_root_motion,
+                                      workers=self.int_prefetch_workers,
+                                      decode=decode,
+                                      cache=decode_cache,
+                                      frame_range=frame_range)
+
+        for f, (file, loaded_anim) in enumerate(zip(self.files, loaded_anims)):
             # Begin import
-            anim_file = open(os.path.join(os.path.dirname(self.filepath), file.name), "rb")
-            anim_param = PXDAnimParam(anim_file)
-            self.progress.update_frame_count(anim_param.frame_count)
+            anim_param = loaded_anim.anim_param
             self.progress.resume(frame_num=-1, name=file.name, item_num=f)
 
-            if (not anim_param) or anim_param.error:
-                self.progress.update_error(name=file_name, error=anim_param.error)
+            if (not anim_param) or loaded_anim.error:
+                self.progress.update_error(name=file.name, error=loaded_anim.error)
                 continue
 
+            # Same clamping as the frames decompressed by load_anim
+            self.frame_start, self.frame_end = 0, anim_param.frame_count
+            if frame_range:
+                self.frame_start = min(frame_range[0], anim_param.frame_count)
+                self.frame_end = min(frame_range[1], anim_param.frame_count)
+                if self.frame_start >= self.frame_end:
+                    self.progress.update_error(name=file.name, error=f"Frame range starts after the last frame ({anim_param.frame_count - 1})")
+                    continue
+            self.progress.update_frame_count(self.frame_end - self.frame_start)
+
             scene_active.render.fps = int(round(anim_param.frame_rate))
             scene_active.render.fps_base = scene_active.render.fps / anim_param.frame_rate
 
-            if bone_count != anim_param.track_count:
+            if self.enum_track_mapping == "map_names" and self.track_map.track_count != anim_param.track_count:
+                self.report(
+                    {'WARNING'},
+                    f"Track count of the skeleton ({self.track_map.track_count}) does not match track count of \"{file.name}\" ({anim_param.track_count}). Results may not turn out as expected."
+                )
+            elif self.enum_track_mapping == "map_order" and bone_count != anim_param.track_count:
                 self.report(
                     {'WARNING'},
                     f"Bone count of \"{arm_active.data.name}\" ({bone_count}) does not match track count of \"{file.name}\" ({anim_param.track_count}). Results may not turn out as expected."
@@ -333,8 +503,12 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
             action_active.use_frame_range = True
 
             self.keyframe_rules = set()
+            # Keyframes inserted one at a time rely on Blender's own check instead
+            if self.bool_keyframe_needed and not self.bool_fast_keying:
+                self.keyframe_rules.add('INSERTKEY_NEEDED')
 
-            if self.enum_loop_check == "loop_yes" or (self.enum_loop_check == "loop_auto" and "_loop" in anim_name):
+            # Padding copies the whole clip, it doesn't combine with a frame range
+            if frame_range is None and (self.enum_loop_check == "loop_yes" or (self.enum_loop_check == "loop_auto" and "_loop" in anim_name)):
                 self.pad_loop = True
 
             # frame_count_loop used ubiquitously in case of padding
@@ -346,9 +520,9 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
                 # action_active.frame_end = self.frame_count_loop - anim_param.frame_count
                 action_active.use_cyclic = True
             else:
-                self.frame_count_loop = anim_param.frame_count
-                scene_active.frame_start = action_active.frame_start = 0
-                scene_active.frame_end = action_active.frame_end = self.frame_count_loop - 1
+                self.frame_count_loop = self.frame_end - self.frame_start
+                scene_active.frame_start = action_active.frame_start = self.frame_start
+                scene_active.frame_end = action_active.frame_end = self.frame_end - 1
 
             action_active.pxd_export = True
             action_active.pxd_fps = anim_param.frame_rate
@@ -357,19 +531,20 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
             action_active.pxd_additive = anim_param.is_additive
 
             if anim_param.is_compressed:
-                import_action = self.import_compressed(arm_active, anim_file, anim_param)
+                import_action = self.import_compressed(arm_active, loaded_anim)
             else:
-                import_action = self.import_uncompressed(arm_active, anim_file, anim_param)
-            anim_file.close()
-            del anim_file
+                import_action = self.import_uncompressed(arm_active, loaded_anim)
+            del loaded_anim
             if not import_action:
                 self.progress.update_error(error=f"{file.name} compressed animation import couldn't be processed. File skipped.")
                 continue
 
             # Mainly for uncompressed actions, doesn't really affect actions where every possible keyframe is filled
-            for fcurve in action_active.fcurves:
-                for point in fcurve.keyframe_points:
-                    point.interpolation = 'LINEAR'
+            # Fast keying already writes linear keyframes
+            if not self.bool_fast_keying:
+                for fcurve in action_active.fcurves:
+                    for point in fcurve.keyframe_points:
+                        point.interpolation = 'LINEAR'
 
             # Keyframes become invisible if this is set earlier than anim import.
             if self.pad_loop and anim_param.is_compressed:
@@ -380,229 +555,250 @@ class FrontiersAnimImport(bpy.types.Operator, ImportHelper):
 
         return {'FINISHED'}
 
-    def import_compressed(self, arm_active, anim_file, anim_data):
-        frame_count = anim_data.frame_count
+    def import_compressed(self, arm_active, loaded_anim):
+        anim_data = loaded_anim.anim_param
         track_count = anim_data.track_count
-        bone_count = len(arm_active.data.bones)
-        main_offset = anim_data.main_offset
-        root_offset = anim_data.root_offset
-
-        anim_file.seek(main_offset)
-        main_buffer_length = int.from_bytes(anim_file.read(4), byteorder='little')
-        anim_file.seek(main_offset)
-        main_buffer_compressed = anim_file.read(main_buffer_length)
-        main_buffer = decompress(main_buffer_compressed)
-        if not len(main_buffer.getvalue()):
-            self.progress.update_error(error=f"{anim_data.name} buffer failed to initialize. File skipped.")
-            return False
-        del main_buffer_compressed
-
-        if self.bool_root_motion and (root_offset is not None):
-            anim_file.seek(root_offset, 0)
-            root_buffer_length = int.from_bytes(anim_file.read(4), byteorder='little')
-            anim_file.seek(root_offset, 0)
-            root_buffer_compressed = anim_file.read(root_buffer_length)
-            root_buffer = decompress(root_buffer_compressed)
-            if not len(root_buffer.getvalue()):
-                self.report({'WARNING'},f"{anim_data.name} root buffer failed to initialize. Importing without root motion.")
-                root_buffer = None
-            del root_buffer_compressed
+        topology = self.bone_topology
+        keyed_bones = self.keyed_bones
+
+        if loaded_anim.root_error:
+            self.report({'WARNING'}, f"{anim_data.name} root buffer failed to initialize. Importing without root motion.")
+
+        # Only the imported frame range was decoded while loading, every track of it
+        main_table = loaded_anim.main_pose
+        frame_count = len(main_table)
+
+        # Global transforms of the whole range, bones without a track keep an identity local transform.
+        # Each bone's track is gathered from the decoded tracks in one go.
+        bone_tracks = self.track_map.tracks(topology.bones, track_count)
+        tracked = bone_tracks >= 0
+        tracks = bone_tracks[tracked]
+        local_loc, local_rot, local_scale = topology.identity_pose(frame_count)
+        local_loc[:, tracked] = main_table[:, tracks, LOC]
+        local_rot[:, tracked] = main_table[:, tracks, ROT]
+        local_scale[:, tracked] = main_table[:, tracks, SCALE]
+        global_loc, global_rot, global_scale = topology.global_transforms(local_loc, local_rot, local_scale)
+
+        if loaded_anim.root_pose is not None:
+            root_table = loaded_anim.root_pose[:, 0]
         else:
-            root_buffer = None
-
-        # Nice for sanity check, but not necessary
-        duration_acl = struct.unpack('<f', main_buffer.read(0x4))[0]
-        frame_rate_acl = struct.unpack('<f', main_buffer.read(0x4))[0]
-        frame_count_acl = int.from_bytes(main_buffer.read(4), byteorder='little')
-        track_count_acl = int.from_bytes(main_buffer.read(4), byteorder='little')
-
-        for frame in range(self.frame_count_loop):
-            self.progress.resume(frame_num=frame)
-            if self.pad_loop:
-                main_buffer.seek(0x10 + (0x30 * track_count * (frame % (frame_count - 1))))
+            root_table = None
+
+        if self.pad_loop:
+            frame_indices = np.arange(self.frame_count_loop) % (frame_count - 1)
+        else:
+            frame_indices = np.arange(self.frame_count_loop)
+        # Keyframes keep their frame number in the file
+        frames = self.frame_start + np.arange(self.frame_count_loop)
+
+        keyed_frames = range(self.frame_count_loop)
+        if self.bool_fast_keying and topology.supports_basis_transforms:
+            # Local transforms of the whole clip in one go, the pose is never touched
+            global_matrices = compose_matrices(global_loc, global_rot, global_scale)
+            pose_loc, pose_rot, pose_scale = (channel[frame_indices]
+                                              for channel in topology.basis_transforms(global_matrices))
+            keyed_frames = range(0)
+        elif self.bool_fast_keying:
+            pose_loc = np.zeros((self.frame_count_loop, len(topology), 3), dtype=np.float32)
+            pose_rot = np.zeros((self.frame_count_loop, len(topology), 4), dtype=np.float32)
+            pose_scale = np.zeros((self.frame_count_loop, len(topology), 3), dtype=np.float32)
+
+        if self.bool_root_motion and root_table is None:
+            self.report({'INFO'}, "No root motion chunk found.")
+
+        for i in keyed_frames:
+            self.progress.resume(frame_num=i)
+            frame = int(frames[i])
+            frame_index = frame_indices[i]
+            matrix_map_global = get_matrix_map_global(topology,
+                                                      global_loc[frame_index],
+                                                      global_rot[frame_index],
+                                                      global_scale[frame_index])
+            if self.bool_fast_keying:
+                matrix_map_basis = get_pose_matrices_basis(arm_active, matrix_map_global)
+                store_pose_matrices_basis(topology.names, matrix_map_basis, i, pose_loc, pose_rot, pose_scale)
+                continue
+
+            if self.key_table is None:
+                set_pose_matrices_global(arm_active, matrix_map_global, frame, keyframe_rules=self.keyframe_rules, is_compressed=True)
             else:
-                main_buffer.seek(0x10 + (0x30 * track_count * frame))
-
-            matrix_map_local = {}
-            scale_map = {}
-
-            for i in range(bone_count):
-                pbone = arm_active.pose.bones[i]
-                if i in range(track_count):
-                    r0, r1, r2, r3 = struct.unpack('<ffff', main_buffer.read(0x10))
-                    p0, p1, p2 = struct.unpack('<fff', main_buffer.read(0xC))
-                    main_buffer.read(4)  # Float: Bone length
-                    s0, s1, s2 = struct.unpack('<fff', main_buffer.read(0xC))
-                    main_buffer.read(4)  # Float: 1.0
-
-                    if self.bool_yx_skel:
-                        tmp_rot = mathutils.Quaternion((r3, r2, r0, r1))
-                        tmp_loc = mathutils.Vector((p2, p0, p1))
-                        if not pbone.parent:
-                            tmp_rot @= mathutils.Quaternion((0.5, -0.5, -0.5, -0.5))
-                    else:
-                        tmp_rot = mathutils.Quaternion((r3, r0, r1, r2))
-                        tmp_loc = mathutils.Vector((p0, p1, p2))
-
-                    matrix = mathutils.Matrix.LocRotScale(tmp_loc, tmp_rot, mathutils.Vector((1.0, 1.0, 1.0)))
-                    matrix_map_local.update({pbone.name: matrix})
-
-                    if (s0, s1, s2) != (0.0, 0.0, 0.0):
-                        if self.bool_yx_skel:
-                            tmp_scale = mathutils.Vector((s2, s0, s1))
-                        else:
-                            tmp_scale = mathutils.Vector((s0, s1, s2))
-                    else:
-                        tmp_scale = mathutils.Vector((1.0, 1.0, 1.0))
-
-                    scale_map.update({pbone.name: tmp_scale})
-                else:
-                    matrix_map_local.update({pbone.name: mathutils.Matrix()})
-                    scale_map.update({pbone.name: mathutils.Vector((1.0, 1.0, 1.0))})
-
-            matrix_map_global = get_matrix_map_global(arm_active, matrix_map_local, scale_map)
-            set_pose_matrices_global(arm_active, matrix_map_global, frame, keyframe_rules=self.keyframe_rules, is_compressed=True)
-
-            if root_buffer:
-                if self.pad_loop:
-                    root_buffer.seek(0x10 + (0x30 * (frame % (frame_count - 1))))
-                else:
-                    root_buffer.seek(0x10 + (0x30 * frame))
-
-                r0, r1, r2, r3 = struct.unpack('<ffff', root_buffer.read(0x10))
-                p0, p1, p2 = struct.unpack('<fff', root_buffer.read(0xC))
-                root_buffer.read(4)  # Float: Bone length
-                s0, s1, s2 = struct.unpack('<fff', root_buffer.read(0xC))
-                root_buffer.read(4)  # Float: 1.0
-
-                tmp_rot = mathutils.Quaternion((RMS, RMS, 0.0, 0.0))
-                tmp_rot @= mathutils.Quaternion((r3, r0, r1, r2))
-                tmp_loc = mathutils.Vector((p0, -p2, p1))
-                if (s0, s1, s2) != (0.0, 0.0, 0.0):
-                    tmp_scale = mathutils.Vector((s0, s1, s2))
-                else:
-                    tmp_scale = mathutils.Vector((1.0, 1.0, 1.0))
-
-                arm_active.rotation_quaternion = tmp_rot
-                arm_active.location = tmp_loc
-                arm_active.scale = tmp_scale
+                set_pose_matrices_global(arm_active, matrix_map_global, frame, keyframe_rules=self.keyframe_rules, truth_table=self.key_table)
+
+            if root_table is not None:
+                root_track = root_table[frame_index]
+
+                arm_active.rotation_quaternion = mathutils.Quaternion(root_track[ROT])
+                arm_active.location = mathutils.Vector(root_track[LOC])
+                arm_active.scale = mathutils.Vector(root_track[SCALE])
 
                 arm_active.keyframe_insert('rotation_quaternion', frame=frame, options=self.keyframe_rules)
                 arm_active.keyframe_insert('location', frame=frame, options=self.keyframe_rules)
                 arm_active.keyframe_insert('scale', frame=frame, options=self.keyframe_rules)
 
-            elif self.bool_root_motion and not root_buffer:
-                self.report({'INFO'}, "No root motion chunk found.")
+        if self.bool_fast_keying:
+            action_active = arm_active.animation_data.action
+            cyclic = 'INSERTKEY_CYCLE_AWARE' in self.keyframe_rules
+
+            # Bones above the keyed ones were only needed to place them
+            pose_loc = pose_loc[:, keyed_bones]
+            pose_rot = pose_rot[:, keyed_bones]
+            pose_scale = pose_scale[:, keyed_bones]
+
+            # Channels the compressed clip stores as default or constant get a single keyframe
+            pose_key_mask = None
+            if loaded_anim.main_track_types is not None:
+                static = np.zeros((len(topology), 3), dtype=bool)
+                static[tracked] = loaded_anim.main_track_types[tracks] != TRACK_ANIMATED
+                pose_key_mask = static_key_mask(static[keyed_bones], pose_loc, pose_rot, pose_scale)
+            if self.bool_keyframe_needed:
+                pose_key_mask = reduce_pose_keys(frames, pose_loc, pose_rot, pose_scale, self.float_key_tolerance,
+                                                 key_mask=pose_key_mask)
+            write_pose_fcurves(action_active, arm_active, frames, pose_loc, pose_rot, pose_scale,
+                               key_mask=pose_key_mask, cyclic=cyclic, bones=topology.bones[keyed_bones])
+            if root_table is not None:
+                root_frames = root_table[frame_indices]
+                root_key_mask = None
+                if loaded_anim.root_track_types is not None:
+                    root_key_mask = static_key_mask(loaded_anim.root_track_types[:1] != TRACK_ANIMATED,
+                                                    root_frames[:, None, LOC],
+                                                    root_frames[:, None, ROT],
+                                                    root_frames[:, None, SCALE])
+                if self.bool_keyframe_needed:
+                    root_key_mask = reduce_pose_keys(frames,
+                                                     root_frames[:, None, LOC],
+                                                     root_frames[:, None, ROT],
+                                                     root_frames[:, None, SCALE],
+                                                     self.float_key_tolerance,
+                                                     key_mask=root_key_mask)
+                if root_key_mask is not None:
+                    root_key_mask = root_key_mask[:, 0]
+                write_object_fcurves(action_active,
+                                     frames,
+                                     root_frames[:, LOC],
+                                     root_frames[:, ROT],
+                                     root_frames[:, SCALE],
+                                     key_mask=root_key_mask,
+                                     cyclic=cyclic)
         return True
 
-    def import_uncompressed(self, arm_active, anim_file, anim_data):
+    def import_uncompressed(self, arm_active, loaded_anim):
+        anim_data = loaded_anim.anim_param
         frame_count = anim_data.frame_count
         track_count = anim_data.track_count
-        bone_count = len(arm_active.data.bones)
-        main_offset = anim_data.main_offset
-        root_offset = anim_data.root_offset
-
-        # Carry over local transformation if there's no new keyframe.
+        topology = self.bone_topology
+        keyed_bones = self.keyed_bones
+        window = slice(self.frame_start, self.frame_end)
+        window_count = self.frame_end - self.frame_start
+        has_root = self.bool_root_motion and loaded_anim.root_tracks is not None
+        if self.bool_root_motion and not has_root:
+            self.report({'INFO'}, "No root motion chunk found. Skipping root motion import")
+
+        # Tracks hold their last keyframe until the next one.
         # Needed for global transformation conversion to correct locations as a result of scaling.
-        matrix_basis_carry = {}
-        for pbone in arm_active.pose.bones:
-            matrix_basis_carry[pbone.name] = mathutils.Matrix()
-
-        frame_table = get_uncompressed_frame_table(anim_file, frame_count, track_count, main_offset)
+        bone_tracks = self.track_map.tracks(topology.bones, track_count)
+        tracked = bone_tracks >= 0
+        tracks = [loaded_anim.main_tracks[t] for t in bone_tracks[tracked]]
+        root_tracks = np.flatnonzero(topology.parents[tracked] < 0)
+        main_table = decode_pose_table(densify_tracks(tracks, frame_count), self.bool_yx_skel, root_tracks)
+        track_keys = track_key_mask(tracks, frame_count)
+
+        # Until their first rotation key, bones without parents keep an identity rotation, not the YX root correction
+        if self.bool_yx_skel and root_tracks.size:
+            unkeyed = ~np.logical_or.accumulate(track_keys[:, root_tracks, 1], axis=0)
+            root_rot = main_table[:, root_tracks, ROT]
+            root_rot[unkeyed] = (1.0, 0.0, 0.0, 0.0)
+            main_table[:, root_tracks, ROT] = root_rot
+        main_table = main_table[window]
+
+        clip_loc, clip_rot, clip_scale = topology.identity_pose(window_count)
+        clip_loc[:, tracked] = main_table[..., LOC]
+        clip_rot[:, tracked] = main_table[..., ROT]
+        clip_scale[:, tracked] = main_table[..., SCALE]
+
+        # Only frames with a keyframe in the file get keyed, bones without a track get none.
+        # The first frame of the range also gets the keys held over from before it.
+        pose_key_mask = np.zeros((window_count, len(topology), 3), dtype=bool)
+        pose_key_mask[:, tracked] = track_keys[window]
+        pose_key_mask[0, tracked] = np.any(track_keys[:self.frame_start + 1], axis=0)
+        pose_key_mask[:, ~keyed_bones] = False
+
+        if has_root:
+            root_table = decode_root_table(densify_tracks(loaded_anim.root_tracks, frame_count))[window, 0]
+            root_keys = track_key_mask(loaded_anim.root_tracks, frame_count)[:, 0]
+            root_key_mask = root_keys[window]
+            root_key_mask[0] = np.any(root_keys[:self.frame_start + 1], axis=0)
+
+        frames = self.frame_start + np.arange(window_count)
+        batched_basis = self.bool_fast_keying and topology.supports_basis_transforms
+        if batched_basis:
+            global_matrices = compose_matrices(*topology.global_transforms(clip_loc, clip_rot, clip_scale))
+            pose_loc, pose_rot, pose_scale = topology.basis_transforms(global_matrices)
+            keyed_frames = range(0)
+        else:
+            global_loc, global_rot, global_scale = topology.global_transforms(clip_loc, clip_rot, clip_scale)
+            keyed_frames = range(window_count)
+            if self.bool_fast_keying:
+                pose_loc = np.zeros((window_count, len(topology), 3), dtype=np.float32)
+                pose_rot = np.zeros((window_count, len(topology), 4), dtype=np.float32)
+                pose_scale = np.zeros((window_count, len(topology), 3), dtype=np.float32)
+
+        for i in keyed_frames:
+            self.progress.resume(frame_num=i)
+            frame = int(frames[i])
+            matrix_map_global = get_matrix_map_global(topology,
+                                                      global_loc[i],
+                                                      global_rot[i],
+                                                      global_scale[i])
+            if self.bool_fast_keying:
+                matrix_map_basis = get_pose_matrices_basis(arm_active, matrix_map_global)
+                store_pose_matrices_basis(topology.names, matrix_map_basis, i, pose_loc, pose_rot, pose_scale)
+                continue
 
-        root_basis_carry = mathutils.Matrix() @ mathutils.Quaternion((RMS, RMS, 0.0, 0.0)).to_matrix().to_4x4()
-        if self.bool_root_motion:
-            if root_offset:
-                root_frame_table = get_uncompressed_frame_table(anim_file, frame_count, 1, root_offset)
-            else:
-                self.report({'INFO'}, "No root motion chunk found. Skipping root motion import")
-
-        for frame in range(frame_count):
-            self.progress.resume(frame_num=frame)
-            track_table = frame_table[frame]
-            if self.bool_root_motion and root_offset:
-                root_table = root_frame_table[frame][0]
-            matrix_map_local = {}
-            scale_map = {}
-
-            # Need track_table status as dictionary for set_pose_matrices_global function.
-            truth_table = {}
-            for pbone in arm_active.pose.bones:
-                truth_table[pbone.name] = [False, False, False]
-
-            for i in range(bone_count):
-                pbone = arm_active.pose.bones[i]
-                if i in range(track_count):
-                    bone_table = track_table[i]
-                    bone_key = truth_table[pbone.name]
-                    tmp_loc, tmp_rot, tmp_scale = matrix_basis_carry[pbone.name].decompose()
-
-                    if bone_table[0]:  # Location
-                        p0, p1, p2 = bone_table[0]
-                        if self.bool_yx_skel:
-                            tmp_loc = mathutils.Vector((p2, p0, p1))
-                        else:
-                            tmp_loc = mathutils.Vector((p0, p1, p2))
-                        bone_key[0] = True
-
-                    if bone_table[1]:  # Rotation
-                        r0, r1, r2, r3 = bone_table[1]
-                        if self.bool_yx_skel:
-                            tmp_rot = mathutils.Quaternion((r3, r2, r0, r1))
-                            if not pbone.parent:
-                                tmp_rot @= mathutils.Quaternion((0.5, -0.5, -0.5, -0.5))
-                        else:
-                            tmp_rot = mathutils.Quaternion((r3, r0, r1, r2))
-                        bone_key[1] = True
-
-                    if bone_table[2]:  # Scale
-                        s0, s1, s2 = bone_table[2]
-                        if (s0, s1, s2) != (0.0, 0.0, 0.0):
-                            if self.bool_yx_skel:
-                                tmp_scale = mathutils.Vector((s2, s0, s1))
-                            else:
-                                tmp_scale = mathutils.Vector((s0, s1, s2))
-                        else:
-                            tmp_scale = mathutils.Vector((1.0, 1.0, 1.0))
-                        bone_key[2] = True
-
-                    matrix_basis_carry[pbone.name] = mathutils.Matrix.LocRotScale(tmp_loc, tmp_rot, tmp_scale)
-                    matrix = mathutils.Matrix.LocRotScale(tmp_loc, tmp_rot, mathutils.Vector((1.0, 1.0, 1.0)))
-                    matrix_map_local[pbone.name] = matrix
-                    scale_map[pbone.name] = tmp_scale
-                else:
-                    matrix_map_local.update({pbone.name: mathutils.Matrix()})
-                    scale_map.update({pbone.name: mathutils.Vector((1.0, 1.0, 1.0))})
-
-            matrix_map_global = get_matrix_map_global(arm_active, matrix_map_local, scale_map)
+            # Need keyframe status as dictionary for set_pose_matrices_global function.
+            truth_table = {name: [False] * 3 for name in self.topology.names}
+            for b, name in enumerate(topology.names):
+                truth_table[name] = pose_key_mask[i, b].tolist()
             set_pose_matrices_global(arm_active, matrix_map_global, frame, truth_table=truth_table)
 
-            if self.bool_root_motion and root_offset:
+            if has_root:
                 # Always reorient for Z-up space, should work regardless if pose-space of skeleton is Y-up or Z-up
-                tmp_loc, tmp_rot, tmp_scale = root_basis_carry.decompose()
-                if root_table[0]:  # Location
-                    p0, p1, p2 = root_table[0]
-                    tmp_loc = mathutils.Vector((p0, -p2, p1))
-                    arm_active.location = tmp_loc
+                root_track = root_table[i]
+                loc_key, rot_key, scale_key = root_key_mask[i]
+                if loc_key:
+                    arm_active.location = mathutils.Vector(root_track[LOC])
                     arm_active.keyframe_insert('location', frame=frame, options=self.keyframe_rules)
-
-                if root_table[1]:  # Rotation
-                    r0, r1, r2, r3 = root_table[1]
-                    tmp_rot = mathutils.Quaternion((RMS, RMS, 0.0, 0.0))
-                    tmp_rot @= mathutils.Quaternion((r3, r0, r1, r2))
-                    arm_active.rotation_quaternion = tmp_rot
+                if rot_key:
+                    arm_active.rotation_quaternion = mathutils.Quaternion(root_track[ROT])
                     arm_active.keyframe_insert('rotation_quaternion', frame=frame, options=self.keyframe_rules)
-
-                if root_table[2]:  # Scale
-                    s0, s1, s2 = root_table[2]
-                    if (s0, s1, s2) != (0.0, 0.0, 0.0):
-                        tmp_scale = mathutils.Vector((s0, s1, s2))
-                    else:
-                        tmp_scale = mathutils.Vector((1.0, 1.0, 1.0))
-                        arm_active.scale = tmp_scale
+                if scale_key:
+                    arm_active.scale = mathutils.Vector(root_track[SCALE])
                     arm_active.keyframe_insert('scale', frame=frame, options=self.keyframe_rules)
 
-                root_basis_carry = mathutils.Matrix.LocRotScale(tmp_loc, tmp_rot, tmp_scale)
+        if self.bool_fast_keying:
+            action_active = arm_active.animation_data.action
+            pose_loc = pose_loc[:, keyed_bones]
+            pose_rot = pose_rot[:, keyed_bones]
+            pose_scale = pose_scale[:, keyed_bones]
+            pose_key_mask = pose_key_mask[:, keyed_bones]
+            if self.bool_keyframe_needed:
+                pose_key_mask = reduce_pose_keys(frames, pose_loc, pose_rot, pose_scale, self.float_key_tolerance,
+                                                 key_mask=pose_key_mask)
+                if has_root:
+                    root_key_mask = reduce_pose_keys(frames,
+                                                     root_table[:, None, LOC],
+                                                     root_table[:, None, ROT],
+                                                     root_table[:, None, SCALE],
+                                                     self.float_key_tolerance,
+                                                     key_mask=root_key_mask[:, None])[:, 0]
+            write_pose_fcurves(action_active, arm_active, frames, pose_loc, pose_rot, pose_scale, key_mask=pose_key_mask,
+                               bones=topology.bones[keyed_bones])
+            if has_root:
+                write_object_fcurves(action_active,
+                                     frames,
+                                     root_table[:, LOC],
+                                     root_table[:, ROT],
+                                     root_table[:, SCALE],
+                                     key_mask=root_key_mask)
 
         return True
 
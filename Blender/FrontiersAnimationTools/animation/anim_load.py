@@ -0,0 +1,301 @@
+"""
+File reading, parsing and ACL decompression for the animation importer
+Kept free of bpy so the work can be handed to worker processes while Blender keys the previous file
+"""
+
+
+import collections
+import multiprocessing
+import struct
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ..FrontiersAnimDecompress.process_buffer import (ORIENTATION_ROOT_MOTION,
+                                                       ORIENTATION_XZ,
+                                                       ORIENTATION_YX,
+                                                       DecompressStream,
+                                                       decompress_buffer,
+                                                       get_compressor
+                                                       )
+from .pose_arrays import TRACK_STRIDE, decode_pose_table, decode_root_table, read_pose_table, sample_pose_table
+from .decode_cache import chunk_digest
+from .pxd_anim import PXDFile, densify_tracks
+
+
+# How load_anim converts compressed tracks to Blender's convention, see decode_pose_table.
+# root_tracks are the tracks of bones without a parent, which get the YX root correction.
+class PoseDecode:
+    def __init__(self, use_yx=True, root_tracks=()):
+        self.use_yx = use_yx
+        self.root_tracks = np.asarray(root_tracks, dtype=np.uint32)
+
+
+class LoadedAnim:
+    def __init__(self, filepath, anim_param=None, error=None):
+        self.filepath = filepath
+        self.anim_param = anim_param
+        self.error = error
+        self.root_error = None
+
+        # Compressed animations: raw (frame_count, track_count, 12) tables, see pose_arrays.py
+        self.main_table = None
+        self.root_table = None
+
+        # Compressed animations loaded with a PoseDecode: decoded tables instead of raw ones
+        self.main_pose = None
+        self.root_pose = None
+
+        # Compressed animations: (track, 3) TRACK_ constants for translation, rotation and scale, see
+        # DecompressStream.track_types. None if the DLL can't report them.
+        self.main_track_types = None
+        self.root_track_types = None
+
+        # Uncompressed animations: sparse key channels from read_uncompressed_tracks
+        self.main_tracks = None
+        self.root_tracks = None
+
+
+# Decompress frames [start, end) of an ACL chunk into an owned raw table, every frame if end is None. With a
+# streaming DLL only those frames are decompressed, straight into the table, otherwise the DLL's buffer is copied
+# and freed straight away.
+def decompress_chunk(compressed_chunk, start=0, end=None):
+    if get_compressor().can_stream:
+        with DecompressStream(compressed_chunk) as stream:
+            if stream.error:
+                return None
+            end = stream.frame_count if end is None else min(end, stream.frame_count)
+            stream.seek(min(start, end))
+            table = np.empty((end - stream.position, stream.track_count, TRACK_STRIDE), dtype=np.float32)
+            stream.read(end, out=table)
+            return table
+
+    with decompress_buffer(compressed_chunk) as buffer:
+        if not len(buffer):
+            return None
+        return np.array(read_pose_table(buffer.view())[start:end])
+
+
+# Decompress an ACL chunk and convert it to Blender's convention, by the DLL if it can, otherwise in NumPy.
+# Only frames [start, end) are decompressed, every frame if end is None.
+def decode_chunk(compressed_chunk, orientation, root_tracks=(), start=0, end=None):
+    if get_compressor().can_decode:
+        with DecompressStream(compressed_chunk) as stream:
+            if stream.error:
+                return None
+            stream.seek(start)
+            return stream.decode(end, orientation=orientation, root_tracks=root_tracks)
+
+    table = decompress_chunk(compressed_chunk, start, end)
+    if table is None:
+        return None
+    if orientation == ORIENTATION_ROOT_MOTION:
+        return decode_root_table(table)
+    root_tracks = np.asarray(root_tracks, dtype=np.intp)
+    return decode_pose_table(table, orientation == ORIENTATION_YX, root_tracks[root_tracks < table.shape[1]])
+
+
+# Which sub-tracks of an ACL chunk are default, constant or animated, None if the DLL can't tell
+def read_track_types(compressed_chunk):
+    if not get_compressor().can_report_types:
+        return None
+    with DecompressStream(compressed_chunk) as stream:
+        if stream.error:
+            return None
+        return stream.track_types()
+
+
+# Decompress the chunks of a compressed file into loaded, raw or decoded with decode.
+# frame_range is an optional (start, end) pair, only frames [start, end) are decompressed then.
+# With a DecodeCache, files loaded the same way before are read back from it instead.
+def load_compressed(loaded, pxd_file, load_root=True, decode=None, cache=None, frame_range=None):
+    load_root = load_root and (pxd_file.root_chunk is not None)
+    start, end = frame_range if frame_range else (0, None)
+    if decode is None:
+        variant = f"table|{load_root}"
+    else:
+        variant = f"pose|{load_root}|{decode.use_yx}|{decode.root_tracks.tolist()}"
+    if frame_range:
+        variant += f"|{start}|{end}"
+
+    cached = None
+    if cache is not None:
+        digest = chunk_digest(pxd_file)
+        cached = cache.load(loaded.filepath, digest, variant)
+
+    if cached is not None:
+        main, root = cached
+    else:
+        # Chunks are handed to the DLL straight from the mapping
+        root = None
+        if decode is not None:
+            orientation = ORIENTATION_YX if decode.use_yx else ORIENTATION_XZ
+            main = decode_chunk(pxd_file.main_chunk, orientation, decode.root_tracks, start, end)
+            if main is not None and load_root:
+                root = decode_chunk(pxd_file.root_chunk, ORIENTATION_ROOT_MOTION, start=start, end=end)
+        else:
+            main = decompress_chunk(pxd_file.main_chunk, start, end)
+            if main is not None and load_root:
+                root = decompress_chunk(pxd_file.root_chunk, start, end)
+
+        if main is None:
+            loaded.error = "Buffer failed to initialize"
+            return
+        if load_root and root is None:
+            loaded.root_error = "Root buffer failed to initialize"
+        elif cache is not None:
+            cache.store(loaded.filepath, digest, variant, main, root)
+
+    if decode is None:
+        loaded.main_table, loaded.root_table = main, root
+    else:
+        loaded.main_pose, loaded.root_pose = main, root
+
+    # Only read from the compressed headers, nothing is decompressed for these
+    loaded.main_track_types = read_track_types(pxd_file.main_chunk)
+    if load_root:
+        loaded.root_track_types = read_track_types(pxd_file.root_chunk)
+
+
+# Load and decompress an animation. Compressed tracks are kept raw, or decoded as they're decompressed with decode.
+# frame_range limits decompression to frames [start, end), uncompressed tracks are always read whole.
+def load_anim(filepath, load_root=True, decode=None, cache=None, frame_range=None):
+    try:
+        with PXDFile(filepath) as pxd_file:
+            anim_param = pxd_file.anim_param
+            if anim_param.error:
+                return LoadedAnim(filepath, anim_param, error=anim_param.error)
+            loaded = LoadedAnim(filepath, anim_param)
+
+            if anim_param.is_compressed:
+                load_compressed(loaded, pxd_file, load_root, decode, cache, frame_range)
+            else:
+                # Copied out, the mapping is closed before the keys are used
+                loaded.main_tracks = pxd_file.tracks(anim_param.track_count, anim_param.main_offset, copy=True)
+                if load_root and anim_param.root_offset:
+                    loaded.root_tracks = pxd_file.tracks(1, anim_param.root_offset, copy=True)
+            return loaded
+    except OSError as error:
+        return LoadedAnim(filepath, error=str(error))
+    except (struct.error, ValueError) as error:
+        # Truncated or corrupt, reported and skipped like an unreadable file
+        return LoadedAnim(filepath, error=f"File is truncated or corrupt: {error}")
+
+
+# Yield a LoadedAnim for every path in order. With workers, up to prefetch files ahead of the
+# consumer are loaded in a process pool, so parsing and decompression overlap with keying.
+def prefetch_anims(filepaths, load_root=True, workers=0, prefetch=None, decode=None, cache=None, frame_range=None):
+    if workers < 1 or len(filepaths) < 2:
+        for filepath in filepaths:
+            try:
+                loaded = load_anim(filepath, load_root, decode, cache, frame_range)
+            except Exception as error:
+                loaded = LoadedAnim(filepath, error=str(error))
+            yield loaded
+        return
+
+    if prefetch is None:
+        prefetch = 2 * workers
+
+    # Spawned workers import this package without bpy, see __init__.py
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    pending = collections.deque()  # (filepath, future)
+    next_path = 0
+    try:
+        while next_path < len(filepaths) and len(pending) < prefetch:
+            filepath = filepaths[next_path]
+            pending.append((filepath, pool.submit(load_anim, filepath, load_root, decode, cache, frame_range)))
+            next_path += 1
+
+        while pending:
+            filepath, future = pending.popleft()
+            if next_path < len(filepaths):
+                next_file = filepaths[next_path]
+                pending.append((next_file, pool.submit(load_anim, next_file, load_root, decode, cache, frame_range)))
+                next_path += 1
+            try:
+                loaded = future.result()
+            except BrokenProcessPool:
+                # Worker couldn't start or died, finish the rest on this thread
+                break
+            except Exception as error:
+                # Reported and skipped like a file that couldn't be read, the other files still load
+                loaded = LoadedAnim(filepath, error=str(error))
+            yield loaded
+        else:
+            return
+
+        for _, future in pending:
+            future.cancel()
+        yield from prefetch_anims(filepaths[next_path - len(pending) - 1:], load_root, 0, None, decode, cache,
+                                  frame_range)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Random access to the raw pose of a file at any frame, for previews that only need one pose.
+# Compressed chunks are sampled by the DLL when it supports it, everything else is interpolated from a raw table.
+class AnimSampler:
+    def __init__(self, filepath, load_root=True):
+        self.filepath = filepath
+        self.error = None
+        self.anim_param = None
+        self._main = None   # DecompressStream or raw table
+        self._root = None
+
+        try:
+            with PXDFile(filepath) as pxd_file:
+                anim_param = pxd_file.anim_param
+                if anim_param.error:
+                    self.error = anim_param.error
+                    return
+                self.anim_param = anim_param
+
+                # Streams keep their own copy of the chunk
+                if anim_param.is_compressed and get_compressor().can_sample:
+                    self._main = DecompressStream(pxd_file.main_chunk)
+                    if self._main.error:
+                        self.error = self._main.error
+                        return
+                    if load_root and pxd_file.root_chunk is not None:
+                        self._root = DecompressStream(pxd_file.root_chunk)
+                        if self._root.error:
+                            self._root = None
+                    return
+
+            loaded = load_anim(filepath, load_root)
+            if loaded.error:
+                self.error = loaded.error
+            elif anim_param.is_compressed:
+                self._main = loaded.main_table
+                self._root = loaded.root_table
+            else:
+                self._main = densify_tracks(loaded.main_tracks, anim_param.frame_count)
+                if loaded.root_tracks is not None:
+                    self._root = densify_tracks(loaded.root_tracks, anim_param.frame_count)
+        except OSError as error:
+            self.error = str(error)
+
+    @property
+    def has_root(self):
+        return self._root is not None
+
+    def _sample(self, source, frame, tracks):
+        if isinstance(source, DecompressStream):
+            return source.sample(frame / self.anim_param.frame_rate, tracks)
+        return sample_pose_table(source, frame, tracks)
+
+    # Raw (track, 12) pose at a fractional frame, for every track or only the listed ones
+    def sample(self, frame, tracks=None):
+        return self._sample(self._main, frame, tracks)
+
+    # Raw (1, 12) root motion pose at a fractional frame
+    def sample_root(self, frame):
+        return self._sample(self._root, frame, None)
+
+    def close(self):
+        for source in (self._main, self._root):
+            if isinstance(source, DecompressStream):
+                source.close()
+        self._main = None
+        self._root = None
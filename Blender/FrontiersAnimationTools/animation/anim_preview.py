@@ -0,0 +1,178 @@
+import bpy
+import mathutils
+import os
+import numpy as np
+from bpy_extras.io_utils import ImportHelper
+from bpy.props import (BoolProperty,
+                       EnumProperty,
+                       FloatProperty,
+                       StringProperty,
+                       )
+from .anim_import import get_matrix_map_global, get_pose_matrices_basis, get_track_map
+from .anim_load import AnimSampler
+from .pose_arrays import (ROT, LOC, SCALE,
+                          compose_matrices,
+                          decode_pose_table,
+                          decode_root_table
+                          )
+from .skeleton_topology import SkeletonTopology
+
+# Last previewed file, kept open so dragging the frame slider in the redo panel only samples one pose
+_preview_sampler = None
+
+
+def get_preview_sampler(filepath, load_root):
+    global _preview_sampler
+    stamp = (filepath, os.path.getmtime(filepath), load_root)
+    if _preview_sampler is None or _preview_sampler[0] != stamp:
+        if _preview_sampler is not None:
+            _preview_sampler[1].close()
+        _preview_sampler = (stamp, AnimSampler(filepath, load_root))
+    return _preview_sampler[1]
+
+
+# Set a pose bone's rotation in whichever rotation mode it uses, so rigs aren't changed just to be previewed
+def set_bone_rotation(pbone, rotation):
+    rotation = mathutils.Quaternion(rotation)
+    if pbone.rotation_mode == 'QUATERNION':
+        pbone.rotation_quaternion = rotation
+    elif pbone.rotation_mode == 'AXIS_ANGLE':
+        axis, angle = rotation.to_axis_angle()
+        pbone.rotation_axis_angle = (angle, *axis)
+    else:
+        pbone.rotation_euler = rotation.to_euler(pbone.rotation_mode, pbone.rotation_euler)
+
+
+class FrontiersAnimPreview(bpy.types.Operator, ImportHelper):
+    bl_idname = "import_anim.frontiers_anim_preview"
+    bl_label = "Preview"
+    bl_description = "Poses the active armature at one frame of a Hedgehog Engine 2 PXD animation without " \
+                     "importing it. Change the frame in the Adjust Last Operation panel to scrub through the clip"
+    bl_options = {'REGISTER', 'UNDO'}
+    filename_ext = ".anm.pxd"
+    filter_glob: StringProperty(
+        default="*.anm.pxd",
+        options={'HIDDEN'},
+    )
+    filepath: StringProperty(subtype='FILE_PATH', )
+
+    float_frame: FloatProperty(
+        name="Frame",
+        description="Frame of the animation to show, fractional frames are interpolated",
+        default=0.0,
+        min=0.0,
+    )
+
+    bool_yx_skel: BoolProperty(
+        name="Use YX Bone Orientation",
+        description="Enable if your skeleton was reoriented for Blender's YX orientation instead of HE2's XZ",
+        default=True,
+    )
+
+    bool_root_motion: BoolProperty(
+        name="Preview Root Motion",
+        description="Enable to move the armature object by the animation's root motion",
+        default=False,
+    )
+
+    enum_track_mapping: EnumProperty(
+        items=[
+            ("map_order", "Bone Order", "Track order matches the armature's bone order, like armatures imported from a .skl.pxd", 1),
+            ("map_names", "Bone Names", "Match tracks to bones by name, using the bone names of the animation's .skl.pxd. "
+                                        "Bones without a track of the same name are left at their rest pose", 2),
+        ],
+        name="Track Mapping",
+        description="How animation tracks are matched to the armature's bones",
+        default="map_order",
+    )
+
+    string_skeleton_path: StringProperty(
+        name="Skeleton",
+        description="The .skl.pxd the animation was made for. "
+                    "When empty, the only .skl.pxd in the animation's folder is used",
+        subtype='FILE_PATH',
+        default="",
+    )
+
+    def draw(self, context):
+        layout = self.layout
+        ui_scene_box = layout.box()
+        ui_scene_box.label(text="Animation Settings", icon='ACTION')
+        ui_scene_box.row().prop(self, "float_frame", )
+        ui_scene_box.row().prop(self, "bool_root_motion", )
+
+        ui_bone_box = layout.box()
+        ui_bone_box.label(text="Armature Settings", icon='ARMATURE_DATA')
+        ui_bone_box.row().prop(self, "bool_yx_skel", )
+        ui_bone_row_mapping = ui_bone_box.row()
+        ui_bone_row_mapping.label(text="Track Mapping:")
+        ui_bone_row_mapping.prop(self, "enum_track_mapping", text="")
+        if self.enum_track_mapping == "map_names":
+            ui_bone_box.row().prop(self, "string_skeleton_path")
+
+    @classmethod
+    def poll(cls, context):
+        obj = context.active_object
+        if obj and obj.type == 'ARMATURE':
+            return True
+        else:
+            return False
+
+    def execute(self, context):
+        arm_active = context.active_object
+        try:
+            sampler = get_preview_sampler(self.filepath, self.bool_root_motion)
+        except OSError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+        if sampler.error:
+            self.report({'ERROR'}, f"{os.path.basename(self.filepath)}: {sampler.error}")
+            return {'CANCELLED'}
+
+        anim_param = sampler.anim_param
+        frame = min(self.float_frame, anim_param.frame_count - 1)
+        topology = SkeletonTopology(arm_active)
+        track_map = get_track_map(self, arm_active, topology, self.filepath)
+        if track_map is None:
+            return {'CANCELLED'}
+
+        # Only the tracks that have a bone are sampled, in the order of the bones they go to
+        bone_tracks = track_map.tracks(topology.bones, anim_param.track_count)
+        tracked = bone_tracks >= 0
+        raw_pose = sampler.sample(frame, bone_tracks[tracked])
+        root_rows = np.flatnonzero(topology.parents[tracked] < 0)
+        pose = decode_pose_table(raw_pose[None], self.bool_yx_skel, root_rows)[0]
+
+        local_loc, local_rot, local_scale = (channel[0] for channel in topology.identity_pose(1))
+        local_loc[tracked] = pose[:, LOC]
+        local_rot[tracked] = pose[:, ROT]
+        local_scale[tracked] = pose[:, SCALE]
+        global_transforms = topology.global_transforms(local_loc, local_rot, local_scale)
+
+        if topology.supports_basis_transforms:
+            basis_loc, basis_rot, basis_scale = topology.basis_transforms(compose_matrices(*global_transforms))
+        else:
+            matrix_map_basis = get_pose_matrices_basis(arm_active, get_matrix_map_global(topology, *global_transforms))
+            basis_loc, basis_rot, basis_scale = zip(*(matrix_map_basis[name].decompose() for name in topology.names))
+
+        # Posed directly, the armature's action and keyframes are left alone
+        for pbone, loc, rot, scale in zip(arm_active.pose.bones, basis_loc, basis_rot, basis_scale):
+            pbone.location = loc
+            set_bone_rotation(pbone, rot)
+            pbone.scale = scale
+
+        if self.bool_root_motion and sampler.has_root:
+            root_pose = decode_root_table(sampler.sample_root(frame)[None])[0, 0]
+            arm_active.rotation_mode = 'QUATERNION'
+            arm_active.location = root_pose[LOC]
+            arm_active.rotation_quaternion = root_pose[ROT]
+            arm_active.scale = root_pose[SCALE]
+
+        return {'FINISHED'}
+
+    def menu_func_import(self, context):
+        self.layout.operator(
+            FrontiersAnimPreview.bl_idname,
+            text="Hedgehog Engine 2 Animation Preview (.anm.pxd)",
+            icon='HIDE_OFF',
+        )
@@ -0,0 +1,182 @@
+"""
+ACL compression and file writing for the animation exporter
+Kept free of bpy so batch exports can hand it to worker processes while Blender samples the next action
+"""
+
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ..FrontiersAnimDecompress.process_buffer import (CLIP_OK,
+                                                       CLIP_ROOT_FAILED,
+                                                       CompressSettings,
+                                                       compress_buffer,
+                                                       compress_clip,
+                                                       get_compressor
+                                                       )
+from .pose_arrays import read_pose_table
+from .pxd_anim import raw_table_to_tracks, write_pxd_anim, write_pxd_anim_uncompressed
+
+
+class ExportJob:
+    def __init__(self, filepath, name, main_buffer, root_buffer, duration, frame_count, bone_count, is_additive=False,
+                 is_compressed=True, compress_settings=None):
+        self.filepath = filepath
+        self.name = name
+        self.main_buffer = main_buffer      # Raw buffer, see process_buffer.py
+        self.root_buffer = root_buffer      # Raw buffer with a track count of 1, None without root motion
+        self.duration = duration
+        self.frame_count = frame_count
+        self.bone_count = bone_count
+        self.is_additive = is_additive
+        self.is_compressed = is_compressed  # Otherwise written as uncompressed key tables, only changed keys kept
+        self.compress_settings = compress_settings  # CompressSettings for the main buffer, None for the defaults
+
+
+def compress_chunk(buffer, settings=None):
+    with compress_buffer(buffer, settings) as compressed_buffer:
+        if not len(compressed_buffer):
+            return None
+        return bytes(compressed_buffer.view())
+
+
+# Write one sampled action without compression, returns an error message or None
+def write_anim_uncompressed(job):
+    try:
+        main_tracks = raw_table_to_tracks(read_pose_table(job.main_buffer))
+        root_tracks = None
+        if job.root_buffer is not None:
+            root_tracks = raw_table_to_tracks(read_pose_table(job.root_buffer))
+    except ValueError as error:
+        return f"{job.name}: {error}"
+
+    try:
+        with open(job.filepath, "wb") as file:
+            write_pxd_anim_uncompressed(file, main_tracks, root_tracks, job.duration, job.frame_count,
+                                        is_additive=job.is_additive)
+    except OSError as error:
+        return f"{job.name}: {error}"
+    return None
+
+
+# Compress and write one sampled action, returns an error message or None
+def write_anim(job):
+    if not job.is_compressed:
+        return write_anim_uncompressed(job)
+
+    settings = job.compress_settings
+    # Same level and precision, per-bone overrides don't apply to the root motion track
+    root_settings = None
+    if settings is not None:
+        root_settings = CompressSettings(settings.level, settings.precision, settings.shell_distance)
+
+    if get_compressor().can_compress_clip:
+        return write_anim_native(job, root_settings)
+
+    main_chunk = compress_chunk(job.main_buffer, settings)
+    if main_chunk is None:
+        return f"{job.name} buffer failed to compress."
+
+    root_chunk = None
+    if job.root_buffer is not None:
+        root_chunk = compress_chunk(job.root_buffer, root_settings)
+        if root_chunk is None:
+            return f"{job.name} root buffer failed to compress."
+
+    try:
+        with open(job.filepath, "wb") as file:
+            write_pxd_anim(file, main_chunk, root_chunk, job.duration, job.frame_count, job.bone_count,
+                           is_additive=job.is_additive)
+    except OSError as error:
+        return f"{job.name}: {error}"
+    return None
+
+
+# Compress both buffers and build the whole file in one DLL call, then write it out as is
+def write_anim_native(job, root_settings):
+    with compress_clip(job.main_buffer, job.root_buffer, job.compress_settings, root_settings,
+                       is_additive=job.is_additive, container=True) as clip:
+        if clip.error == CLIP_ROOT_FAILED:
+            return f"{job.name} root buffer failed to compress."
+        if clip.error != CLIP_OK:
+            return f"{job.name} buffer failed to compress."
+        try:
+            with open(job.filepath, "wb") as file:
+                file.write(clip.main.view())
+        except OSError as error:
+            return f"{job.name}: {error}"
+    return None
+
+
+# Runs write_anim for submitted jobs in worker processes, or straight away without workers.
+# At most max_pending jobs wait on the workers, so sampling can't run ahead and keep every clip in memory.
+class ExportPool:
+    def __init__(self, workers=0, max_pending=None):
+        self.pool = None
+        if workers > 0:
+            # Spawned workers import this package without bpy, see __init__.py
+            self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.max_pending = max_pending if max_pending is not None else 2 * max(workers, 1)
+        self.pending = []       # (job, future)
+        self.error_list = []    # (job name, error message)
+
+    def submit(self, job):
+        if self.pool:
+            self.collect_done()
+            while len(self.pending) >= self.max_pending:
+                self.collect(*self.pending.pop(0))
+        if self.pool:
+            try:
+                self.pending.append((job, self.pool.submit(write_anim, job)))
+                return
+            except BrokenProcessPool:
+                self.pool = None
+        self.record(job, self.write(job))
+
+    # write_anim on this thread, with anything it raises reported as the job's error
+    @staticmethod
+    def write(job):
+        try:
+            return write_anim(job)
+        except Exception as exception:
+            return f"{job.name}: {exception}"
+
+    def collect_done(self):
+        still_pending = []
+        for job, future in self.pending:
+            if future.done():
+                self.collect(job, future)
+            else:
+                still_pending.append((job, future))
+        self.pending = still_pending
+
+    # Wait for one job's result
+    def collect(self, job, future):
+        try:
+            error = future.result()
+        except BrokenProcessPool:
+            # Worker couldn't start or died, write it on this thread instead
+            error = self.write(job)
+        except Exception as exception:
+            error = f"{job.name}: {exception}"
+        self.record(job, error)
+
+    def record(self, job, error):
+        # The sampled buffers aren't needed once the file is written
+        job.main_buffer = None
+        job.root_buffer = None
+        if error:
+            self.error_list.append((job.name, error))
+
+    # Wait for every job, returns a list of (job name, error message) for failed jobs
+    def finish(self):
+        for job, future in self.pending:
+            self.collect(job, future)
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+        error_list = self.error_list
+        self.pending = []
+        self.error_list = []
+        return error_list
@@ -2,10 +2,16 @@ import bpy
 import os
 from bpy_extras.io_utils import ExportHelper
 from bpy.props import (BoolProperty,
+                       EnumProperty,
+                       FloatProperty,
+                       IntProperty,
                        StringProperty,
                        CollectionProperty
                        )
-from .anim_export import anim_export
+from .anim_export import get_compress_settings, sample_anim
+from .anim_write import ExportPool
+from .compress_profiles import LEVEL_ITEMS, PROFILE_ITEMS
+from .export_cache import ExportCache, action_digest
 from ..ui.func_ops import filter_actions
 from .console_output import BatchProgress
 
@@ -26,15 +32,71 @@ class FrontiersAnimBatchExport(bpy.types.Operator, ExportHelper):
         default=True,
     )
 
+    bool_fast_sampling: BoolProperty(
+        name="Fast Sampling",
+        description="Evaluate each action's F-curves directly instead of updating the whole scene every frame. "
+                    "Rigs with constraints, drivers or NLA tracks are always sampled with scene updates",
+        default=True,
+    )
+
     bool_start_zero: BoolProperty(
         name="Sample From Frame 0",
         description="Enable to start sampling the animation from frame 0 regardless of the specified frame range. "
                     "Will not affect output frame range.\n\n"
                     "(NOTE: Will take longer if animation starts in middle of timeline, but useful for advanced users "
-                    "using features such as physics simulations)",
+                    "using features such as physics simulations. Frames before the range are skipped for baked "
+                    "simulations. Unbaked simulations are run again from their start frame for every action, bake "
+                    "them to skip that)",
         default=False,
     )
 
+    bool_skip_unchanged: BoolProperty(
+        name="Skip Unchanged Actions",
+        description="Skip actions that haven't changed since they were last exported to this folder. "
+                    "Actions on rigs with constraints, drivers or NLA tracks are always exported",
+        default=True,
+    )
+
+    enum_compress_profile: EnumProperty(
+        items=PROFILE_ITEMS,
+        name="Compression Profile",
+        description="How hard ACL works on the file size, and how much error each bone may have",
+        default="profile_standard",
+    )
+
+    enum_compress_level: EnumProperty(
+        items=LEVEL_ITEMS,
+        name="Compression Level",
+        description="Compression level of the Custom profile",
+        default="level_highest",
+    )
+
+    float_compress_precision: FloatProperty(
+        name="Precision",
+        description="Largest error allowed on any bone with the Custom profile, in Blender units",
+        default=0.001,
+        min=0.00001,
+        soft_max=0.1,
+        precision=5,
+        step=0.01,
+    )
+
+    string_precision_overrides: StringProperty(
+        name="Precision Overrides",
+        description="Per-bone precision on top of the profile's, as comma separated bone name=precision pairs. "
+                    "Names may use * wildcards, such as \"*Finger*=0.005, Hips=0.0001\"",
+        default="",
+    )
+
+    int_export_workers: IntProperty(
+        name="Compression Workers",
+        description="Number of background processes that compress and write finished actions while the next one is "
+                    "sampled. 0 compresses every action on Blender's thread",
+        default=4,
+        min=0,
+        soft_max=32,
+    )
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.bool_root_motion = False
@@ -57,6 +119,21 @@ class FrontiersAnimBatchExport(bpy.types.Operator, ExportHelper):
 
         ui_zero_row = ui_scene_box.row()
         ui_zero_row.prop(self, "bool_start_zero", )
+        ui_fast_row = ui_scene_box.row()
+        ui_fast_row.prop(self, "bool_fast_sampling", )
+        ui_skip_row = ui_scene_box.row()
+        ui_skip_row.prop(self, "bool_skip_unchanged", )
+        ui_workers_row = ui_scene_box.row()
+        ui_workers_row.prop(self, "int_export_workers", )
+        ui_profile_row = ui_scene_box.row()
+        ui_profile_row.label(text="Compression:")
+        ui_profile_row.prop(self, "enum_compress_profile", text="")
+        ui_custom_row = ui_scene_box.row(align=True)
+        ui_custom_row.enabled = self.enum_compress_profile == "profile_custom"
+        ui_custom_row.prop(self, "enum_compress_level", text="")
+        ui_custom_row.prop(self, "float_compress_precision")
+        ui_overrides_row = ui_scene_box.row()
+        ui_overrides_row.prop(self, "string_precision_overrides", text="Overrides")
 
         ui_bone_box = layout.box()
         ui_bone_box.label(text="Armature Settings", icon='ARMATURE_DATA')
@@ -71,8 +148,20 @@ class FrontiersAnimBatchExport(bpy.types.Operator, ExportHelper):
         frame_active = scene_active.frame_current
         action_active = arm_active.animation_data.action
         filtered_actions = filter_actions(bpy.data.actions, context)
+        try:
+            self.compress_settings = get_compress_settings(self, arm_active)
+        except ValueError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
 
         progress = BatchProgress(self, num_items=len(filtered_actions), method='EXPORT')
+        export_pool = ExportPool(workers=min(self.int_export_workers, len(filtered_actions) - 1))
+        export_cache = ExportCache(base_dir)
+        export_settings = (self.bool_yx_skel, self.bool_start_zero, self.bool_fast_sampling,
+                           self.enum_compress_profile, self.enum_compress_level, self.float_compress_precision,
+                           self.string_precision_overrides)
+        exported = []  # (action name, path, digest)
+        skipped_count = 0
 
         for i, action in enumerate(filtered_actions):
             progress.resume(item_num=i, name=action.name)
@@ -87,24 +176,45 @@ class FrontiersAnimBatchExport(bpy.types.Operator, ExportHelper):
             else:
                 self.bool_additive = False
 
-            # TODO: Implement uncompressed animation export
-            # if action.pxd_compress:
-                # self.bool_compress = True
-            # else:
-                # self.bool_compress = False
+            if action.pxd_compress:
+                self.bool_compress = True
+            else:
+                self.bool_compress = False
 
             action_path = f"{base_dir}\\{action.name}.anm.pxd"
             arm_active.animation_data.action = action
+
+            digest = action_digest(arm_active, action, export_settings)
+            if self.bool_skip_unchanged and export_cache.is_current(action.name, action_path, digest):
+                skipped_count += 1
+                continue
+            exported.append((action.name, action_path, digest))
+
             frame_rate = action.pxd_fps
-            if not anim_export(self,
-                               action_path,
-                               arm_active,
-                               action,
-                               round(action.frame_start),
-                               round(action.frame_end),
-                               frame_rate,
-                               ):
-                progress.update_error(name=action.name)
+            # Compression and writing run in the pool while the next action is sampled
+            export_pool.submit(sample_anim(self,
+                                           action_path,
+                                           arm_active,
+                                           action,
+                                           round(action.frame_start),
+                                           round(action.frame_end),
+                                           frame_rate,
+                                           ))
+
+        failed = set()
+        for name, error in export_pool.finish():
+            self.report({'WARNING'}, error)
+            progress.update_error(name=name)
+            failed.add(name)
+
+        for name, path, digest in exported:
+            if name in failed:
+                export_cache.forget(name)
+            else:
+                export_cache.record(name, path, digest)
+        export_cache.save()
+        if skipped_count:
+            self.report({'INFO'}, f"Skipped {skipped_count} unchanged actions.")
 
         progress.finish()
 
@@ -0,0 +1,125 @@
+"""
+Named ACL compression profiles and per-bone precision overrides for the exporters
+Kept free of bpy, the CompressSettings built here travel to worker processes with each export job
+"""
+
+
+import fnmatch
+import re
+import numpy as np
+
+from ..FrontiersAnimDecompress.process_buffer import (LEVEL_LOWEST,
+                                                       LEVEL_LOW,
+                                                       LEVEL_MEDIUM,
+                                                       LEVEL_HIGH,
+                                                       LEVEL_HIGHEST,
+                                                       CompressSettings
+                                                       )
+
+# Blender enum items for the compression level
+LEVEL_ITEMS = [
+    ("level_lowest", "Lowest", "Fastest compression, same as Medium in the current ACL version", LEVEL_LOWEST),
+    ("level_low", "Low", "Same as Medium in the current ACL version", LEVEL_LOW),
+    ("level_medium", "Medium", "Quick compression with slightly larger files", LEVEL_MEDIUM),
+    ("level_high", "High", "Slower compression, smaller files", LEVEL_HIGH),
+    ("level_highest", "Highest", "Slowest compression, smallest files", LEVEL_HIGHEST),
+]
+LEVELS = {identifier: value for identifier, name, description, value in LEVEL_ITEMS}
+
+# Bones where small errors go unnoticed, and bones every other bone's error adds onto.
+# Sets of name words, see bone_words, so "Ring_01_L" is a finger but "Spring_hair" and "Earring" aren't.
+DETAIL_BONES = frozenset(("finger", "thumb", "index", "middle", "ring", "pinky",
+                          "face", "eye", "eyelid", "brow", "eyebrow", "lid", "lip", "mouth", "cheek", "tongue", "jaw"))
+CORE_BONES = frozenset(("hips", "pelvis"))
+# Whole names, "root" alone would also catch bones like "Hair_root"
+CORE_NAMES = ("reference", "root")
+
+# Words of a bone name: runs of lowercase letters with an optional capital in front, capitals and digits
+NAME_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+# Lowercase words of a bone name split on separators, case changes and digits, "RingFinger01_L" gives
+# ["ring", "finger", "01", "l"]
+def bone_words(name):
+    return [word.lower() for word in NAME_WORD.findall(name)]
+
+
+class CompressProfile:
+    def __init__(self, name, description, level, precision, overrides=()):
+        self.name = name
+        self.description = description
+        self.level = level
+        self.precision = precision
+        # (bone name pattern or set of name words, precision), later entries win, see track_precisions
+        self.overrides = tuple(overrides)
+
+
+PROFILES = {
+    "profile_fast": CompressProfile("Fast Iteration",
+                                    "Medium level with looser precision, for quick preview exports",
+                                    LEVEL_MEDIUM, 0.005,
+                                    [(DETAIL_BONES, 0.02)]),
+    "profile_standard": CompressProfile("Standard",
+                                        "Highest level with 1mm precision on every bone, what exports have always used",
+                                        LEVEL_HIGHEST, 0.001),
+    "profile_shipping": CompressProfile("Shipping",
+                                        "Highest level with tighter precision on the root and hips, and looser "
+                                        "precision on fingers and face",
+                                        LEVEL_HIGHEST, 0.001,
+                                        [(DETAIL_BONES, 0.0025), (CORE_BONES, 0.0002)]
+                                        + [(name, 0.0002) for name in CORE_NAMES]),
+}
+
+# Blender enum items for the profile, with a last entry for a level and precision picked by hand
+PROFILE_ITEMS = [(identifier, profile.name, profile.description, i + 1)
+                 for i, (identifier, profile) in enumerate(PROFILES.items())]
+PROFILE_ITEMS.append(("profile_custom", "Custom", "Pick the compression level and precision", len(PROFILE_ITEMS) + 1))
+
+
+# Parse "pattern=precision" pairs separated by commas, such as "*Finger*=0.005, Hips=0.0001".
+# Raises ValueError on entries that aren't a pattern and a positive number.
+def parse_overrides(text):
+    overrides = []
+    for entry in text.split(","):
+        if not entry.strip():
+            continue
+        pattern, separator, value = entry.partition("=")
+        try:
+            precision = float(value)
+        except ValueError:
+            precision = 0.0
+        if not separator or not pattern.strip() or precision <= 0.0:
+            raise ValueError(f"Invalid precision override \"{entry.strip()}\", expected bone name=precision")
+        overrides.append((pattern.strip(), precision))
+    return overrides
+
+
+# Precision of every bone from (pattern, precision) overrides, 0 for bones that keep the default.
+# Patterns are case-insensitive fnmatch patterns of the whole name, or sets of words matching bones with any of
+# those words in their name.
+def track_precisions(bone_names, overrides):
+    precisions = np.zeros(len(bone_names), dtype=np.float32)
+    lower_names = [name.lower() for name in bone_names]
+    name_words = [set(bone_words(name)) for name in bone_names]
+    for pattern, precision in overrides:
+        if isinstance(pattern, str):
+            pattern = pattern.lower()
+            for b, name in enumerate(lower_names):
+                if fnmatch.fnmatchcase(name, pattern):
+                    precisions[b] = precision
+        else:
+            for b, words in enumerate(name_words):
+                if not words.isdisjoint(pattern):
+                    precisions[b] = precision
+    return precisions
+
+
+# CompressSettings for a profile, bone_names in track order. overrides are applied after the profile's own.
+# The custom profile takes level and precision, which are ignored by the named profiles.
+def compress_settings(profile, bone_names=(), overrides=(), level=LEVEL_HIGHEST, precision=0.001):
+    if profile in PROFILES:
+        level = PROFILES[profile].level
+        precision = PROFILES[profile].precision
+        overrides = PROFILES[profile].overrides + tuple(overrides)
+    track_precision = track_precisions(bone_names, overrides) if overrides and len(bone_names) else None
+    return CompressSettings(level, precision, track_precision=track_precision)
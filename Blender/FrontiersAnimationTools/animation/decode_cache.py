@@ -0,0 +1,114 @@
+"""
+On-disk cache of decompressed animations, so importing the same files again skips ACL decompression
+Entries are uncompressed .npz files named after the source path, size and modification time. Each one also records a
+hash of the compressed chunks it came from, and the least recently used entries are deleted once the cache outgrows
+its size cap
+Kept free of bpy so load_anim can use it from worker processes
+"""
+
+
+import hashlib
+import os
+import tempfile
+import time
+import numpy as np
+
+CACHE_VERSION = 1
+# Temporary files older than this were left by interrupted writes, newer ones may still be being written
+STALE_TEMP_AGE = 60 * 60
+
+
+def default_cache_dir():
+    return os.path.join(tempfile.gettempdir(), "FrontiersAnimationTools", "decode_cache")
+
+
+# Hash of the compressed chunks of a PXDFile, in case a file was replaced without its size or time changing
+def chunk_digest(pxd_file):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(pxd_file.main_chunk)
+    if pxd_file.root_chunk is not None:
+        digest.update(pxd_file.root_chunk)
+    return digest.hexdigest()
+
+
+class DecodeCache:
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+        self.directory = directory if directory else default_cache_dir()
+        self.max_size = max_size
+
+    # variant tells apart entries of the same file loaded with different settings
+    def entry_path(self, filepath, variant):
+        stat = os.stat(filepath)
+        key = f"{CACHE_VERSION}|{os.path.abspath(filepath)}|{stat.st_size}|{stat.st_mtime_ns}|{variant}"
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    # Cached (main, root) arrays, root is None if the entry has none. None if there's no valid entry.
+    def load(self, filepath, digest, variant):
+        try:
+            path = self.entry_path(filepath, variant)
+            with np.load(path, allow_pickle=False) as entry:
+                if str(entry["digest"]) != digest:
+                    return None
+                main = entry["main"]
+                root = entry["root"] if "root" in entry.files else None
+            # Modification time doubles as the last use for eviction
+            os.utime(path)
+            return main, root
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def store(self, filepath, digest, variant, main, root=None):
+        if self.max_size <= 0:
+            return
+        arrays = {"digest": np.array(digest), "main": main}
+        if root is not None:
+            arrays["root"] = root
+        # Would be evicted again straight away
+        if sum(array.nbytes for array in arrays.values()) > self.max_size:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.entry_path(filepath, variant)
+            # Written under a temporary name so other processes never load half an entry
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as entry_file:
+                np.savez(entry_file, **arrays)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+        self.evict()
+
+    # Delete temporary files left by interrupted writes, then the least recently used entries until the cache
+    # fits in max_size. Temporary files still being written count toward the size.
+    def evict(self):
+        entries = []
+        temp_size = 0
+        stale_time = time.time_ns() - STALE_TEMP_AGE * 1_000_000_000
+        try:
+            with os.scandir(self.directory) as scan:
+                for item in scan:
+                    if item.name.endswith(".npz"):
+                        stat = item.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+                    elif item.name.endswith(".tmp"):
+                        stat = item.stat()
+                        if stat.st_mtime_ns < stale_time:
+                            try:
+                                os.remove(item.path)
+                                continue
+                            except OSError:
+                                pass
+                        temp_size += stat.st_size
+        except OSError:
+            return
+
+        total_size = temp_size + sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another process already, or still open on Windows
+                continue
+            total_size -= size
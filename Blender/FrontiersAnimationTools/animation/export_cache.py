@@ -0,0 +1,130 @@
+"""
+Record of what a batch export last wrote to a folder, so actions that haven't changed since aren't sampled and
+compressed again
+The cache is a JSON file in the output folder, holding a content hash and the written file's size and time per action
+"""
+
+
+import hashlib
+import json
+import os
+import numpy as np
+
+from .pose_sample import animated_components, direct_sampling_blocker, transform_paths
+
+CACHE_NAME = ".pxd_export_cache.json"
+# Bump whenever exported files would come out differently for the same input, so old entries are ignored
+CACHE_VERSION = 3
+
+
+def _feed(digest, *values):
+    digest.update(repr(values).encode())
+
+
+# Every plain property of an RNA struct, used for F-curve modifiers which all have different settings
+def _feed_properties(digest, struct):
+    for prop in struct.bl_rna.properties:
+        if prop.type in {'POINTER', 'COLLECTION'} or prop.identifier == 'rna_type':
+            continue
+        value = getattr(struct, prop.identifier)
+        if getattr(prop, "is_array", False):
+            value = tuple(value)
+        _feed(digest, prop.identifier, value)
+
+
+def _feed_array(digest, collection, prop, width):
+    values = np.empty(len(collection) * width, dtype=np.float32)
+    collection.foreach_get(prop, values)
+    digest.update(values.tobytes())
+
+
+# Hash of everything that goes into an exported action: its F-curves and PXD settings, the armature's rest pose,
+# parenting and bone lengths, and the values of channels without F-curves. settings are the export options that
+# affect output.
+# Returns None if the pose also depends on the rest of the scene (constraints, drivers, NLA...) and can't be hashed.
+def action_digest(obj, action, settings):
+    if direct_sampling_blocker(obj, action) is not None:
+        return None
+
+    digest = hashlib.sha256()
+    _feed(digest, CACHE_VERSION, tuple(settings))
+    _feed(digest, action.pxd_fps, action.frame_start, action.frame_end, action.pxd_root, action.pxd_additive,
+          action.pxd_compress)
+
+    for fcurve in sorted(action.fcurves, key=lambda fc: (fc.data_path, fc.array_index)):
+        _feed(digest, fcurve.data_path, fcurve.array_index, fcurve.mute, fcurve.extrapolation)
+        points = fcurve.keyframe_points
+        for prop in ('co', 'handle_left', 'handle_right'):
+            _feed_array(digest, points, prop, 2)
+        _feed(digest, tuple((point.interpolation, point.easing) for point in points))
+        _feed_array(digest, points, 'back', 1)
+        _feed_array(digest, points, 'amplitude', 1)
+        _feed_array(digest, points, 'period', 1)
+        for modifier in fcurve.modifiers:
+            _feed_properties(digest, modifier)
+
+    for pbone in obj.pose.bones:
+        bone = pbone.bone
+        _feed(digest,
+              pbone.name,
+              bone.parent.name if bone.parent else None,
+              tuple(value for row in bone.matrix_local for value in row),
+              bone.length,  # Written into every track, matrix_local doesn't change when only the tail moves
+              bone.inherit_scale)
+
+    # Only components no F-curve covers, the others depend on the frame and on whatever was sampled last
+    paths = transform_paths(obj)
+    animated = animated_components(action, paths)
+    for path, (b, prop) in paths.items():
+        values = getattr(obj if b < 0 else obj.pose.bones[b], prop)
+        _feed(digest, path, tuple((i, value) for i, value in enumerate(values) if (path, i) not in animated))
+    return digest.hexdigest()
+
+
+class ExportCache:
+    def __init__(self, directory):
+        self.path = os.path.join(directory, CACHE_NAME)
+        self.entries = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                cache = json.load(cache_file)
+            if cache.get("version") == CACHE_VERSION:
+                self.entries = cache.get("actions", {})
+        except (OSError, ValueError):
+            # Missing or unreadable, everything gets exported
+            pass
+
+    # True if filepath is still the file written for this action when it last had this digest
+    def is_current(self, name, filepath, digest):
+        entry = self.entries.get(name)
+        if digest is None or entry is None or entry.get("digest") != digest:
+            return False
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+        return entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns
+
+    def record(self, name, filepath, digest):
+        if digest is None:
+            self.entries.pop(name, None)
+            return
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            self.entries.pop(name, None)
+            return
+        self.entries[name] = {"digest": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def forget(self, name):
+        self.entries.pop(name, None)
+
+    # Written to a temporary file first so an interrupted export never leaves a half written cache
+    def save(self):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as cache_file:
+                json.dump({"version": CACHE_VERSION, "actions": self.entries}, cache_file, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
@@ -0,0 +1,71 @@
+import bpy
+import numpy as np
+
+# Keyframe.interpolation enum value for 'LINEAR', foreach_set only takes the integer values
+INTERPOLATION_LINEAR = 1
+
+
+# Fill an F-curve in one go instead of one keyframe_insert call per frame
+def write_fcurve(action, data_path, index, frames, values, group="", cyclic=False):
+    # Channels without keys get no F-curve, an empty one would still count as animated
+    key_count = len(frames)
+    if not key_count:
+        return action.fcurves.find(data_path, index=index)
+
+    fcurve = action.fcurves.find(data_path, index=index)
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group)
+        # keyframe_insert adds this automatically for cyclic actions, fcurves.new does not
+        if cyclic:
+            fcurve.modifiers.new('CYCLES')
+
+    points = fcurve.keyframe_points
+    points.add(key_count)
+
+    co = np.empty((key_count, 2), dtype=np.float32)
+    co[:, 0] = frames
+    co[:, 1] = values
+    points.foreach_set('co', co.ravel())
+    points.foreach_set('interpolation', np.full(key_count, INTERPOLATION_LINEAR, dtype=np.int32))
+    fcurve.update()
+    return fcurve
+
+
+# Write location, rotation_quaternion and scale curves for every component of a transform.
+# key_mask is an optional (frame, 3) bool array choosing which frames get loc/rot/scale keys.
+def write_transform_fcurves(action, path_base, group, frames, loc, rot, scale, key_mask=None, cyclic=False):
+    frames = np.asarray(frames)
+    for c, (prop, values) in enumerate((('location', loc), ('rotation_quaternion', rot), ('scale', scale))):
+        if key_mask is None:
+            channel_frames = frames
+            channel_values = values
+        else:
+            channel_frames = frames[key_mask[:, c]]
+            channel_values = values[key_mask[:, c]]
+        for index in range(values.shape[-1]):
+            write_fcurve(action, f"{path_base}{prop}", index, channel_frames, channel_values[:, index],
+                         group=group, cyclic=cyclic)
+
+
+# Write pose bone curves from (frame, bone, n) arrays ordered like obj.pose.bones.
+# bones optionally lists the pose.bones index of every entry instead, for arrays covering only some bones.
+def write_pose_fcurves(action, obj, frames, loc, rot, scale, key_mask=None, cyclic=False, bones=None):
+    pose_bones = obj.pose.bones
+    if bones is None:
+        bones = range(len(pose_bones))
+    for b, bone in enumerate(bones):
+        pbone = pose_bones[bone]
+        write_transform_fcurves(action,
+                                f'pose.bones["{bpy.utils.escape_identifier(pbone.name)}"].',
+                                pbone.name,
+                                frames,
+                                loc[:, b],
+                                rot[:, b],
+                                scale[:, b],
+                                key_mask=None if key_mask is None else key_mask[:, b],
+                                cyclic=cyclic)
+
+
+# Write the armature object's own transform curves, used for root motion
+def write_object_fcurves(action, frames, loc, rot, scale, key_mask=None, cyclic=False):
+    write_transform_fcurves(action, "", "Object Transforms", frames, loc, rot, scale, key_mask=key_mask, cyclic=cyclic)
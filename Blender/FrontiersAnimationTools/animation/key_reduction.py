@@ -0,0 +1,76 @@
+"""
+Removal of keyframes that linear interpolation between their neighbours already reproduces
+Works on whole decoded clips as NumPy arrays, so imports only write the keys that matter
+"""
+
+
+import numpy as np
+
+
+# Which keys of one channel to keep so linear interpolation between them stays within tolerance of every key.
+# frames are (key,) frame numbers in increasing order, values (key, n) with every component checked together.
+# Channels that never move by more than tolerance keep only their first key.
+def reduce_channel(frames, values, tolerance):
+    key_count = len(frames)
+    keep = np.zeros(key_count, dtype=bool)
+    if not key_count:
+        return keep
+    keep[0] = True
+    if np.all(np.abs(values - values[0]) <= tolerance):
+        return keep
+    keep[-1] = True
+
+    # Douglas-Peucker: split every span at its worst key until nothing in it is further than tolerance
+    frames = np.asarray(frames, dtype=np.float64)
+    spans = [(0, key_count - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        factor = (frames[start + 1:end] - frames[start]) / (frames[end] - frames[start])
+        interpolated = values[start] + factor[:, None] * (values[end] - values[start])
+        error = np.abs(values[start + 1:end] - interpolated).max(axis=1)
+        worst = np.argmax(error)
+        if error[worst] > tolerance:
+            split = start + 1 + worst
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+    return keep
+
+
+# Reduce (frame, track, n) location, rotation and scale arrays, returns a (frame, track, 3) key mask for
+# write_pose_fcurves. key_mask limits reduction to frames that were keyed to begin with.
+def reduce_pose_keys(frames, loc, rot, scale, tolerance, key_mask=None):
+    frames = np.asarray(frames)
+    track_count = loc.shape[1]
+    if key_mask is None:
+        key_mask = np.ones((len(frames), track_count, 3), dtype=bool)
+    reduced = np.zeros_like(key_mask)
+
+    for c, values in enumerate((loc, rot, scale)):
+        # Channels that hold still over the whole clip need no splitting, find them all at once
+        channel_mask = key_mask[:, :, c]
+        first_key = np.argmax(channel_mask, axis=0)
+        first_values = values[first_key, np.arange(track_count)]
+        deviation = np.where(channel_mask[..., None], np.abs(values - first_values), 0.0).max(axis=(0, 2))
+        for track in range(track_count):
+            keyed = np.flatnonzero(channel_mask[:, track])
+            if not keyed.size:
+                continue
+            if deviation[track] <= tolerance:
+                reduced[keyed[0], track, c] = True
+                continue
+            reduced[keyed, track, c] = reduce_channel(frames[keyed], values[keyed, track], tolerance)
+    return reduced
+
+
+# Key mask keeping only the first frame of channels flagged static, (frame, track, 3) for write_pose_fcurves.
+# static is a (track, 3) bool array for location, rotation and scale. A static track can still come out moving
+# when its parent's scale moves, so flagged channels are only collapsed if their values really hold still.
+def static_key_mask(static, loc, rot, scale, tolerance=1e-6):
+    key_mask = np.ones(loc.shape[:2] + (3,), dtype=bool)
+    for c, values in enumerate((loc, rot, scale)):
+        still = static[:, c] & np.all(np.abs(values - values[:1]) <= tolerance, axis=(0, 2))
+        key_mask[1:, still, c] = False
+    return key_mask
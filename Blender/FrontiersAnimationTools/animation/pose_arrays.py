@@ -0,0 +1,239 @@
+"""
+NumPy helpers for working on whole PXD pose tables at once instead of one float at a time
+Nothing in here touches bpy or mathutils, so it can be used outside of Blender operators
+
+See FrontiersAnimDecompress/process_buffer.py for the layout of the decompressed buffer
+"""
+
+
+import math
+import struct
+import numpy as np
+
+RMS = 1 / math.sqrt(2)
+
+# Float offsets inside the 12 floats stored per track per frame.
+# Raw tables store rotation as XYZW, decoded tables store it as WXYZ like mathutils.Quaternion
+ROT = slice(0, 4)
+LOC = slice(4, 7)
+LENGTH = 7
+SCALE = slice(8, 11)
+TRACK_STRIDE = 12
+
+# Swaps XZ bone orientation to Blender's YX for tracks without a parent
+YX_ROOT_CORRECTION = np.array((0.5, -0.5, -0.5, -0.5), dtype=np.float32)
+# Reorients root motion from HE2's Y-up space to Blender's Z-up space
+ROOT_MOTION_CORRECTION = np.array((RMS, RMS, 0.0, 0.0), dtype=np.float32)
+# Inverses of the two corrections above, applied by the exporter
+YX_ROOT_EXPORT = np.array((0.5, 0.5, 0.5, 0.5), dtype=np.float32)
+ROOT_MOTION_EXPORT = np.array((RMS, -RMS, 0.0, 0.0), dtype=np.float32)
+IDENTITY_QUAT = np.array((1.0, 0.0, 0.0, 0.0), dtype=np.float32)
+
+
+# Hamilton product of WXYZ quaternion arrays, same as mathutils "a @ b". Broadcasts over leading axes.
+def quat_multiply(a, b):
+    aw, ax, ay, az = np.moveaxis(np.asarray(a), -1, 0)
+    bw, bx, by, bz = np.moveaxis(np.asarray(b), -1, 0)
+    return np.stack((
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    ), axis=-1)
+
+
+# Rotate XYZ vector arrays by WXYZ unit quaternion arrays, same as mathutils "q @ v". Broadcasts over leading axes.
+def quat_rotate(q, v):
+    q = np.asarray(q)
+    w = q[..., :1]
+    u = q[..., 1:]
+    t = 2.0 * np.cross(u, v)
+    return v + w * t + np.cross(u, t)
+
+
+def quat_normalize(q):
+    length = np.linalg.norm(q, axis=-1, keepdims=True)
+    return np.divide(q, length, out=np.zeros_like(q), where=length > 0.0)
+
+
+# (..., 3, 3) rotation matrices from WXYZ unit quaternions
+def quat_to_matrix(q):
+    w, x, y, z = np.moveaxis(np.asarray(q), -1, 0)
+    return np.stack((
+        np.stack((1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - z * w), 2.0 * (x * z + y * w)), axis=-1),
+        np.stack((2.0 * (x * y + z * w), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - x * w)), axis=-1),
+        np.stack((2.0 * (x * z - y * w), 2.0 * (y * z + x * w), 1.0 - 2.0 * (x * x + y * y)), axis=-1),
+    ), axis=-2)
+
+
+# WXYZ quaternions from (..., 3, 3) orthonormal rotation matrices, with w >= 0 like mathutils
+def matrix_to_quat(m):
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    # Four candidates scaled by 4w, 4x, 4y and 4z, use the one with the largest component to stay away from 0
+    candidates = np.stack((
+        np.stack((1.0 + m00 + m11 + m22, m[..., 2, 1] - m[..., 1, 2], m[..., 0, 2] - m[..., 2, 0], m[..., 1, 0] - m[..., 0, 1]), axis=-1),
+        np.stack((m[..., 2, 1] - m[..., 1, 2], 1.0 + m00 - m11 - m22, m[..., 0, 1] + m[..., 1, 0], m[..., 0, 2] + m[..., 2, 0]), axis=-1),
+        np.stack((m[..., 0, 2] - m[..., 2, 0], m[..., 0, 1] + m[..., 1, 0], 1.0 - m00 + m11 - m22, m[..., 1, 2] + m[..., 2, 1]), axis=-1),
+        np.stack((m[..., 1, 0] - m[..., 0, 1], m[..., 0, 2] + m[..., 2, 0], m[..., 1, 2] + m[..., 2, 1], 1.0 - m00 - m11 + m22), axis=-1),
+    ), axis=-2)
+    pick = np.argmax(np.stack((candidates[..., 0, 0], candidates[..., 1, 1], candidates[..., 2, 2], candidates[..., 3, 3]), axis=-1), axis=-1)
+    q = np.take_along_axis(candidates, pick[..., None, None], axis=-2)[..., 0, :]
+    q = quat_normalize(q)
+    return np.where(q[..., :1] < 0.0, -q, q)
+
+
+# (..., 4, 4) matrices from location, WXYZ rotation and scale arrays, same as mathutils.Matrix.LocRotScale
+def compose_matrices(loc, rot, scale):
+    loc = np.asarray(loc)
+    matrices = np.zeros(loc.shape[:-1] + (4, 4), dtype=np.float64)
+    matrices[..., :3, :3] = quat_to_matrix(rot) * np.asarray(scale)[..., None, :]
+    matrices[..., :3, 3] = loc
+    matrices[..., 3, 3] = 1.0
+    return matrices
+
+
+# Split (..., 4, 4) matrices into location, WXYZ rotation and scale arrays, same as mathutils.Matrix.decompose
+def decompose_matrices(matrices):
+    basis = matrices[..., :3, :3]
+    scale = np.linalg.norm(basis, axis=-2)
+    # Negative determinants flip every axis, as Blender's mat3_to_size does
+    scale = np.where(np.linalg.det(basis)[..., None] < 0.0, -scale, scale)
+    rotation = np.divide(basis, scale[..., None, :], out=np.zeros_like(basis), where=scale[..., None, :] != 0.0)
+    return matrices[..., :3, 3].copy(), matrix_to_quat(rotation), scale
+
+
+# Header of a decompressed buffer: duration, frame rate, frame count, track count
+def read_pose_header(buffer):
+    return struct.unpack_from('<ffII', buffer, 0)
+
+
+# Map a decompressed buffer to a (frame_count, track_count, 12) float32 array without copying it
+def read_pose_table(buffer):
+    duration, frame_rate, frame_count, track_count = read_pose_header(buffer)
+    table = np.frombuffer(buffer, dtype='<f4', count=frame_count * track_count * TRACK_STRIDE, offset=0x10)
+    return table.reshape(frame_count, track_count, TRACK_STRIDE)
+
+
+# New decompressed buffer for frame_count frames of track_count tracks, returned with a (frame, track, 12)
+# float32 view of its table so samplers can fill it in place
+def new_pose_buffer(duration, frame_rate, frame_count, track_count):
+    buffer = bytearray(0x10 + frame_count * track_count * TRACK_STRIDE * 4)
+    struct.pack_into('<ffII', buffer, 0, duration, frame_rate, frame_count, track_count)
+    return buffer, read_pose_table(buffer)
+
+
+# Swap 0.0 scales for 1.0, ACL writes zeroed scale for tracks that were never scaled
+def sanitize_scale(decoded):
+    scale = decoded[..., SCALE]
+    scale[np.all(scale == 0.0, axis=-1)] = 1.0
+
+
+# Convert raw skeletal tracks to Blender's convention in one go.
+# Output keeps the 12 float stride, but with WXYZ rotations and the axis swizzle applied.
+def decode_pose_table(table, use_yx=True, root_tracks=()):
+    decoded = np.empty(table.shape, dtype=np.float32)
+    if use_yx:
+        decoded[..., ROT] = table[..., [3, 2, 0, 1]]
+        decoded[..., LOC] = table[..., [6, 4, 5]]
+        decoded[..., SCALE] = table[..., [10, 8, 9]]
+    else:
+        decoded[..., ROT] = table[..., [3, 0, 1, 2]]
+        decoded[..., LOC] = table[..., LOC]
+        decoded[..., SCALE] = table[..., SCALE]
+    decoded[..., LENGTH] = table[..., LENGTH]
+    decoded[..., 11] = table[..., 11]
+    sanitize_scale(decoded)
+
+    root_tracks = np.asarray(root_tracks, dtype=np.intp)
+    if use_yx and root_tracks.size:
+        decoded[:, root_tracks, ROT] = quat_multiply(decoded[:, root_tracks, ROT], YX_ROOT_CORRECTION)
+    return decoded
+
+
+# Convert a raw root motion table (track count of 1) to the armature object's Z-up transform
+def decode_root_table(table):
+    decoded = np.empty(table.shape, dtype=np.float32)
+    decoded[..., ROT] = quat_multiply(ROOT_MOTION_CORRECTION, table[..., [3, 0, 1, 2]])
+    decoded[..., 4] = table[..., 4]
+    decoded[..., 5] = -table[..., 6]
+    decoded[..., 6] = table[..., 5]
+    decoded[..., LENGTH] = table[..., LENGTH]
+    decoded[..., SCALE] = table[..., SCALE]
+    decoded[..., 11] = table[..., 11]
+    sanitize_scale(decoded)
+    return decoded
+
+
+# Inverse of decode_pose_table for sampled poses. matrices are (frame, bone, 4, 4) armature space pose matrices,
+# scales (frame, bone, 3) basis scales and lengths (bone,) bone lengths. Parents are -1 for bones without one.
+# Transforms are made relative to the parent's unscaled pose matrix, and the basis scale is written as is.
+# Fills out, a (frame, bone, 12) raw table, or a new one if out is None.
+def encode_pose_table(matrices, scales, parents, lengths, use_yx=True, out=None):
+    matrices = np.asarray(matrices, dtype=np.float64)
+    scales = np.asarray(scales, dtype=np.float64)
+    if out is None:
+        out = np.empty(matrices.shape[:2] + (TRACK_STRIDE,), dtype=np.float32)
+
+    loc, rot, _ = decompose_matrices(matrices)
+    parents = np.asarray(parents)
+    has_parent = parents >= 0
+    parent_index = np.where(has_parent, parents, 0)
+    parent_rot = np.where(has_parent[:, None], rot[:, parent_index], IDENTITY_QUAT)
+    parent_loc = np.where(has_parent[:, None], loc[:, parent_index], 0.0)
+
+    inverse = parent_rot * (1.0, -1.0, -1.0, -1.0)
+    local_rot = quat_multiply(inverse, rot)
+    local_rot = np.where(local_rot[..., :1] < 0.0, -local_rot, local_rot)
+    local_loc = quat_rotate(inverse, loc - parent_loc)
+    lengths = np.where(has_parent, lengths, 0.0)
+
+    if use_yx:
+        if not np.all(has_parent):
+            local_rot[:, ~has_parent] = quat_multiply(local_rot[:, ~has_parent], YX_ROOT_EXPORT)
+        out[..., ROT] = local_rot[..., [2, 3, 1, 0]]
+        out[..., LOC] = local_loc[..., [1, 2, 0]]
+        out[..., LENGTH] = lengths * scales[..., 1]
+        out[..., SCALE] = scales[..., [1, 2, 0]]
+    else:
+        out[..., ROT] = local_rot[..., [1, 2, 3, 0]]
+        out[..., LOC] = local_loc
+        out[..., LENGTH] = lengths * scales[..., 0]
+        out[..., SCALE] = scales
+    out[..., 11] = 1.0
+    return out
+
+
+# Inverse of decode_root_table, from (frame, 3) locations, (frame, 4) WXYZ rotations and (frame, 3) scales of the
+# armature object. Fills out, a (frame, 1, 12) raw table, or a new one if out is None.
+def encode_root_table(loc, rot, scale, out=None):
+    if out is None:
+        out = np.empty((len(loc), 1, TRACK_STRIDE), dtype=np.float32)
+    loc = np.asarray(loc)
+    out[:, 0, ROT] = quat_multiply(ROOT_MOTION_EXPORT, rot)[..., [1, 2, 3, 0]]
+    out[:, 0, 4] = loc[..., 0]
+    out[:, 0, 5] = loc[..., 2]
+    out[:, 0, 6] = -loc[..., 1]
+    out[:, 0, LENGTH] = 0.0
+    out[:, 0, SCALE] = scale
+    out[:, 0, 11] = 1.0
+    return out
+
+
+# Pose of a raw table at a fractional frame, as (track, 12). Rotations are normalized lerps taking the short way
+# round, close to ACL's own interpolation. Used when the DLL can't sample compressed clips by itself.
+def sample_pose_table(table, frame, tracks=None):
+    if tracks is not None:
+        table = table[:, tracks]
+    frame = min(max(frame, 0.0), table.shape[0] - 1)
+    frame_a = int(frame)
+    frame_b = min(frame_a + 1, table.shape[0] - 1)
+    alpha = np.float32(frame - frame_a)
+
+    pose_a = table[frame_a]
+    pose_b = table[frame_b].copy()
+    flip = np.sum(pose_a[:, ROT] * pose_b[:, ROT], axis=-1) < 0.0
+    pose_b[flip, ROT] *= -1.0
+
+    pose = pose_a + (pose_b - pose_a) * alpha
+    pose[:, ROT] = quat_normalize(pose[:, ROT])
+    return pose
@@ -0,0 +1,281 @@
+import bpy
+import mathutils
+import numpy as np
+
+TRANSFORM_PROPS = ('location', 'rotation_quaternion', 'scale')
+
+
+# Data path of every transform property the samplers read, mapped to (pose.bones index, property name).
+# The index is -1 for the object's own transform.
+def transform_paths(obj):
+    paths = {}
+    for b, pbone in enumerate(obj.pose.bones):
+        path_base = f'pose.bones["{bpy.utils.escape_identifier(pbone.name)}"].'
+        for prop in TRANSFORM_PROPS:
+            paths[path_base + prop] = (b, prop)
+    for prop in TRANSFORM_PROPS:
+        paths[prop] = (-1, prop)
+    return paths
+
+
+# (data path, array index) of every component the action's unmuted F-curves animate, out of transform_paths
+def animated_components(action, paths):
+    return {(fcurve.data_path, fcurve.array_index) for fcurve in action.fcurves
+            if not fcurve.mute and fcurve.data_path in paths}
+
+
+# Check whether pose matrices can be rebuilt from the action's F-curves alone, without evaluating the scene.
+# Returns None if they can, otherwise the reason they can't.
+def direct_sampling_blocker(obj, action):
+    if action is None:
+        return "no active action"
+    if obj.data.pose_position != 'POSE':
+        return "armature is in rest position"
+
+    for anim_data in (obj.animation_data, obj.data.animation_data):
+        if not anim_data:
+            continue
+        if anim_data.drivers:
+            return "armature has drivers"
+        if any(not track.mute for track in anim_data.nla_tracks):
+            return "armature has NLA tracks"
+    if obj.animation_data.action_influence != 1.0 or obj.animation_data.action_blend_type != 'REPLACE':
+        return "action is blended"
+
+    for pbone in obj.pose.bones:
+        bone = pbone.bone
+        if pbone.constraints:
+            return f"bone \"{pbone.name}\" has constraints"
+        if pbone.rotation_mode != 'QUATERNION':
+            return f"bone \"{pbone.name}\" does not use quaternion rotation"
+        if bone.use_connect or not bone.use_inherit_rotation or not bone.use_local_location:
+            return f"bone \"{pbone.name}\" has unsupported parenting options"
+        if bone.inherit_scale not in ('FULL', 'ALIGNED'):
+            return f"bone \"{pbone.name}\" has unsupported scale inheritance"
+    return None
+
+
+# Reads the pose after a full scene update, works for any rig but evaluates everything in the scene
+class ScenePoseSampler:
+    needs_preroll = True
+
+    def __init__(self, obj):
+        self.obj = obj
+        bone_count = len(obj.pose.bones)
+        # foreach_get copies matrices column by column, read into these and transpose
+        self._matrices = np.empty((bone_count, 4, 4), dtype=np.float32)
+        self._scales = np.empty((bone_count, 3), dtype=np.float32)
+        self.location = None
+        self.rotation_quaternion = None
+        self.scale = None
+
+    # Evaluate a frame before the exported range only for the simulations it advances, nothing is read back
+    def preroll(self, frame):
+        bpy.context.scene.frame_set(frame)
+
+    def sample(self, frame):
+        bpy.context.scene.frame_set(frame)
+        self.location = self.obj.location.copy()
+        self.rotation_quaternion = self.obj.rotation_quaternion.copy()
+        self.scale = self.obj.scale.copy()
+
+    # Copy the sampled pose matrices into a (bone, 4, 4) array and basis scales into a (bone, 3) array
+    def read_pose(self, matrices, scales):
+        pose_bones = self.obj.pose.bones
+        pose_bones.foreach_get("matrix", self._matrices.ravel())
+        pose_bones.foreach_get("scale", self._scales.ravel())
+        matrices[:] = self._matrices.transpose(0, 2, 1)
+        scales[:] = self._scales
+
+
+# Evaluates the action's F-curves and rebuilds pose matrices the way Blender parents bones, skipping the depsgraph.
+# Only valid when direct_sampling_blocker returns None.
+class ActionPoseSampler:
+    needs_preroll = False  # Nothing in the rig depends on previous frames
+
+    def __init__(self, obj, action):
+        self.obj = obj
+        pose_bones = obj.pose.bones
+        bone_index = {pbone.name: b for b, pbone in enumerate(pose_bones)}
+
+        # Properties of channels without F-curves stay at their current values
+        self.bone_channels = [[list(pbone.location), list(pbone.rotation_quaternion), list(pbone.scale)]
+                              for pbone in pose_bones]
+        self.object_channels = [list(obj.location), list(obj.rotation_quaternion), list(obj.scale)]
+
+        path_map = {}
+        for path, (b, prop) in transform_paths(obj).items():
+            path_map[path] = (self.object_channels if b < 0 else self.bone_channels[b], TRANSFORM_PROPS.index(prop))
+
+        # (channel values, component, F-curve)
+        self.curves = []
+        for fcurve in action.fcurves:
+            if fcurve.mute or fcurve.data_path not in path_map:
+                continue
+            channels, c = path_map[fcurve.data_path]
+            if fcurve.array_index < len(channels[c]):
+                self.curves.append((channels[c], fcurve.array_index, fcurve))
+
+        # Rest matrices relative to the parent's rest matrix, as Blender's offs_bone
+        self.bones = []
+        for pbone in pose_bones:
+            bone = pbone.bone
+            if bone.parent:
+                parent = bone_index[bone.parent.name]
+                offset = bone.parent.matrix_local.inverted() @ bone.matrix_local
+            else:
+                parent = None
+                offset = bone.matrix_local.copy()
+            self.bones.append((parent, offset, bone.inherit_scale == 'ALIGNED'))
+
+        self.matrices = []
+        self.scales = []
+        self.location = None
+        self.rotation_quaternion = None
+        self.scale = None
+
+    def sample(self, frame):
+        for channel, index, fcurve in self.curves:
+            channel[index] = fcurve.evaluate(frame)
+
+        matrices = [None] * len(self.bones)
+        scales = []
+        # Resolve parents first, pose.bones isn't guaranteed to be in hierarchy order
+        pending = list(range(len(self.bones)))
+        while pending:
+            deferred = []
+            for b in pending:
+                parent, offset, is_aligned = self.bones[b]
+                if parent is not None and matrices[parent] is None:
+                    deferred.append(b)
+                    continue
+                loc, rot, scale = self.bone_channels[b]
+                basis = mathutils.Matrix.LocRotScale(mathutils.Vector(loc),
+                                                     mathutils.Quaternion(rot).normalized(),
+                                                     mathutils.Vector(scale))
+                if parent is None:
+                    matrices[b] = offset @ basis
+                else:
+                    matrices[b] = self.child_matrix(matrices[parent], offset, basis, is_aligned)
+            pending = deferred
+
+        for loc, rot, scale in self.bone_channels:
+            scales.append(mathutils.Vector(scale))
+
+        self.matrices = matrices
+        self.scales = scales
+        self.location = mathutils.Vector(self.object_channels[0])
+        self.rotation_quaternion = mathutils.Quaternion(self.object_channels[1])
+        self.scale = mathutils.Vector(self.object_channels[2])
+
+    # Same as ScenePoseSampler.read_pose
+    def read_pose(self, matrices, scales):
+        matrices[:] = self.matrices
+        scales[:] = self.scales
+
+    # Same as Blender's BKE_bone_parent_transform_calc_from_matrices followed by BKE_armature_mat_bone_to_pose
+    @staticmethod
+    def child_matrix(parent_matrix, offset, basis, is_aligned):
+        if not is_aligned:
+            return parent_matrix @ offset @ basis
+
+        # Parent scale is applied along the child's own axes instead of skewing them
+        post_scale = [parent_matrix.col[i].xyz.length for i in range(3)]
+        normalize = mathutils.Matrix.Diagonal([1.0 / s if s else 1.0 for s in post_scale] + [1.0])
+
+        matrix = parent_matrix @ normalize @ offset @ basis @ mathutils.Matrix.Diagonal(post_scale + [1.0])
+        matrix.translation = (parent_matrix @ offset) @ basis.translation
+        return matrix
+
+
+# Returns the sampler and, when use_direct was asked for but isn't possible, the reason for the caller to report
+def pose_sampler(obj, action, use_direct=True):
+    blocker = None
+    if use_direct:
+        blocker = direct_sampling_blocker(obj, action)
+        if blocker is None:
+            return ActionPoseSampler(obj, action), None
+    return ScenePoseSampler(obj), blocker
+
+
+# Point caches of the simulations in the scene that scene updates advance frame by frame
+def scene_point_caches(scene):
+    if scene.rigidbody_world and scene.rigidbody_world.enabled:
+        yield scene.rigidbody_world.point_cache
+    for obj in scene.objects:
+        for mod in obj.modifiers:
+            if mod.type in ('CLOTH', 'SOFT_BODY'):
+                yield mod.point_cache
+            elif mod.type == 'DYNAMIC_PAINT' and mod.canvas_settings:
+                for surface in mod.canvas_settings.canvas_surfaces:
+                    yield surface.point_cache
+        for psys in obj.particle_systems:
+            yield psys.point_cache
+
+
+def has_simulation_zone(node_group, checked=None):
+    if checked is None:
+        checked = set()
+    checked.add(node_group.name)
+    for node in node_group.nodes:
+        if node.bl_idname == 'GeometryNodeSimulationOutput':
+            return True
+        group = getattr(node, "node_tree", None)
+        if group and group.name not in checked and has_simulation_zone(group, checked):
+            return True
+    return False
+
+
+# Handlers that run on every scene update, and can keep state from one frame to the next
+HISTORY_HANDLERS = ('frame_change_pre', 'frame_change_post', 'depsgraph_update_pre', 'depsgraph_update_post')
+
+
+# True if a scripted driver in the scene runs Python beyond a simple expression, which may keep state between
+# frames through functions in the driver namespace
+def has_python_drivers(scene):
+    owners = [scene, scene.world]
+    for obj in scene.objects:
+        owners.append(obj)
+        owners.append(obj.data)
+        owners.append(getattr(obj.data, "shape_keys", None))
+    for owner in owners:
+        anim_data = getattr(owner, "animation_data", None) if owner else None
+        if not anim_data:
+            continue
+        for fcurve in anim_data.drivers:
+            driver = fcurve.driver
+            if driver.type == 'SCRIPTED' and not driver.is_simple_expression:
+                return True
+    return False
+
+
+# First frame scene sampling has to evaluate for simulations to reach start_frame in the same state as playback
+# from frame 0. Baked point caches are read back on any frame and unbaked ones only simulate from their own start
+# frame, so everything before that is skipped. Unbaked simulations still run again for every action, their state
+# at start_frame depends on the action. Update handlers and Python drivers may keep state nothing here can see,
+# so sampling with them starts from 0.
+def simulation_start(scene, start_frame):
+    if any(getattr(bpy.app.handlers, handlers) for handlers in HISTORY_HANDLERS) or has_python_drivers(scene):
+        return 0
+
+    first_frame = start_frame
+    for cache in scene_point_caches(scene):
+        if not cache.is_baked:
+            first_frame = min(first_frame, cache.frame_start)
+    for obj in scene.objects:
+        for mod in obj.modifiers:
+            if mod.type == 'FLUID' and mod.fluid_type == 'DOMAIN':
+                if not mod.domain_settings.has_cache_baked_data:
+                    first_frame = min(first_frame, mod.domain_settings.cache_frame_start)
+            elif mod.type == 'NODES' and mod.node_group and has_simulation_zone(mod.node_group):
+                # Simulation zones reset on the scene's first frame
+                first_frame = min(first_frame, scene.frame_start)
+    return max(first_frame, 0)
+
+
+# Frames a sampler has to evaluate before start_frame so the exported frames match playback from frame 0.
+# Empty unless use_start_zero is set and the sampler depends on earlier frames.
+def preroll_frames(sampler, start_frame, use_start_zero):
+    if not use_start_zero or not sampler.needs_preroll:
+        return range(start_frame, start_frame)
+    return range(simulation_start(bpy.context.scene, start_frame), start_frame)
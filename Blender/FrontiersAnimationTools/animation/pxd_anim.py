@@ -0,0 +1,434 @@
+"""
+Reading and writing of PXD animation files (.anm.pxd) and raw pose files (.anm.raw)
+Kept free of bpy so it can be used by the command-line converter as well as the Blender operators
+
+See bottom of file for struct of the raw pose file
+"""
+
+
+import mmap
+import os
+import struct
+import numpy as np
+from .pose_arrays import read_pose_header, read_pose_table
+
+NULL = 0
+RAW_MAGIC = b'PXDR'
+RAW_VERSION = 1
+RAW_FLAG_ADDITIVE = 1
+RAW_FLAG_ROOT = 2
+
+# Raw transform of a track before its first keyframe: XYZW rotation, location + length, scale + 1.0
+RAW_IDENTITY = np.array((0.0, 0.0, 0.0, 1.0,
+                         0.0, 0.0, 0.0, 0.0,
+                         1.0, 1.0, 1.0, 1.0), dtype=np.float32)
+
+
+# Uncompressed channels in the order each track entry lists them, with the number of floats used per key
+CHANNEL_WIDTHS = (3, 4, 3)  # Location, Rotation, Scale
+CHANNEL_SLICES = (slice(4, 7), slice(0, 4), slice(8, 11))  # Where each channel goes in a raw track
+# Key times of uncompressed channels are uint16 frame numbers
+UNCOMPRESSED_MAX_FRAMES = 0x10000
+
+
+# Parse the uncompressed track table at table_offset in buffer, the bytes of the whole file.
+# Every track comes back as a (location, rotation, scale) tuple of (frames, values) channels, the layout
+# build_uncompressed_chunk writes. frames are uint16 and values (key_count, width) float32, both views into buffer
+# unless copy is set.
+def read_uncompressed_tracks(buffer, track_count, table_offset, copy=False):
+    buffer = memoryview(buffer)
+    tracks = []
+    for track in range(track_count):
+        entry = struct.unpack_from('<9Q', buffer, table_offset + 0x48 * track)
+        channels = []
+        for c, width in enumerate(CHANNEL_WIDTHS):
+            key_count, frame_offset, data_offset = entry[3 * c:3 * c + 3]
+            if not key_count:
+                channels.append((np.empty(0, dtype='<u2'), np.empty((0, width), dtype='<f4')))
+                continue
+            frames = np.frombuffer(buffer, dtype='<u2', count=key_count, offset=frame_offset + 0x40)
+            values = np.frombuffer(buffer, dtype='<f4', count=key_count * 4, offset=data_offset + 0x40)
+            values = values.reshape(key_count, 4)[:, :width]
+            if copy:
+                frames, values = frames.copy(), values.copy()
+            channels.append((frames, values))
+        tracks.append(tuple(channels))
+    return tracks
+
+
+# Index of the latest key at or before every frame, -1 before the first one. Keys past the end are ignored.
+def carried_key_index(frames, frame_count):
+    key_index = np.full(frame_count, -1, dtype=np.intp)
+    in_range = np.flatnonzero(frames < frame_count)
+    key_index[frames[in_range]] = in_range
+    return np.maximum.accumulate(key_index)
+
+
+# Header of a PXD animation, parsed from a buffer holding at least the first 0x80 bytes of the file
+class PXDAnimParam:
+    def __init__(self, buffer):
+        self.name = str()
+        if len(buffer) < 0x80:
+            self.error = "Not a valid PXD animation file"
+            return
+        file_size = struct.unpack_from('<I', buffer, 8)[0]
+
+        magic, version, flag_additive, flag_compressed = struct.unpack_from('<4sIBB', buffer, 0x40)
+        if magic != b'NAXP':
+            self.error = f"Not a valid PXD animation file"
+            return
+        if version != 512:
+            self.error = "Unsupported PXD version"
+            return
+
+        if flag_additive == 1:
+            self.is_additive = True
+        else:
+            self.is_additive = False
+
+        if flag_compressed == 8:
+            self.is_compressed = True
+        else:
+            self.is_compressed = False
+
+        self.duration, self.frame_count, self.track_count, self.main_offset, self.root_offset = \
+            struct.unpack_from('<fIQQQ', buffer, 0x58)
+        if self.duration != 0.0:
+            self.frame_rate = (self.frame_count - 1) / self.duration
+        else:
+            self.frame_rate = 30.0
+        if self.main_offset:
+            self.main_offset += 0x40
+        else:
+            self.main_offset = None
+
+        if self.root_offset:
+            self.root_offset += 0x40
+
+        # Animations compressed with old FrontiersAnimDecompress had non-existent root chunk offsets beyond EOF
+        if (self.root_offset > (file_size - 0x40)) or (not self.root_offset):
+            self.root_offset = None
+
+        self.error = None
+
+
+class PXDFile:
+    """
+    PXD animation mapped into memory once instead of read with many small seeks and reads,
+    which are slow on network drives.
+    data, main_chunk and root_chunk are zero-copy views of the mapping and must not be used after close().
+    """
+
+    def __init__(self, filepath):
+        self._map = None
+        with open(filepath, "rb") as file:
+            # Empty files can't be mapped, they fail the header check instead
+            if os.fstat(file.fileno()).st_size:
+                self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self._map if self._map is not None else b"")
+        self.anim_param = PXDAnimParam(self.data)
+
+        # ACL chunks of compressed animations, root_chunk is None without root motion
+        self.main_chunk = None
+        self.root_chunk = None
+        if not self.anim_param.error and self.anim_param.is_compressed:
+            self.main_chunk = self.chunk(self.anim_param.main_offset)
+            if self.anim_param.root_offset is not None:
+                self.root_chunk = self.chunk(self.anim_param.root_offset)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # ACL chunks start with their own size. Missing or truncated chunks come back empty.
+    def chunk(self, offset):
+        if offset is None or offset + 4 > len(self.data):
+            return memoryview(b"")
+        chunk_size = struct.unpack_from('<I', self.data, offset)[0]
+        # ACL trusts the size in its own header, a short slice would have it read past the end of the file
+        if offset + chunk_size > len(self.data):
+            return memoryview(b"")
+        return self.data[offset:offset + chunk_size]
+
+    # Sparse key channels of an uncompressed track table, see read_uncompressed_tracks
+    def tracks(self, track_count, table_offset, copy=False):
+        return read_uncompressed_tracks(self.data, track_count, table_offset, copy=copy)
+
+    def close(self):
+        if self._map is None:
+            return
+        try:
+            for view in (self.main_chunk, self.root_chunk, self.data):
+                if view is not None:
+                    view.release()
+            self._map.close()
+        except BufferError:
+            # Arrays still point into the mapping, it's unmapped once they're freed
+            pass
+        self._map = None
+        self.main_chunk = None
+        self.root_chunk = None
+
+
+# Fill tracks from read_uncompressed_tracks into a dense (frame_count, track_count, 12) raw table.
+# Tracks hold their last keyframe until the next one, and RAW_IDENTITY before their first.
+def densify_tracks(tracks, frame_count):
+    table = np.tile(RAW_IDENTITY, (frame_count, len(tracks), 1))
+    for track, channels in enumerate(tracks):
+        for (frames, values), channel_slice in zip(channels, CHANNEL_SLICES):
+            key_index = carried_key_index(frames, frame_count)
+            keyed = key_index >= 0
+            table[keyed, track, channel_slice] = values[key_index[keyed]]
+    return table
+
+
+# Which (frame, track, location/rotation/scale) entries of tracks from read_uncompressed_tracks have a keyframe
+def track_key_mask(tracks, frame_count):
+    key_mask = np.zeros((frame_count, len(tracks), 3), dtype=bool)
+    for track, channels in enumerate(tracks):
+        for c, (frames, values) in enumerate(channels):
+            key_mask[frames[frames < frame_count], track, c] = True
+    return key_mask
+
+
+# Which frames of (frame, track, n) channel values need a key so that both holding the last key and interpolating
+# linearly between keys give back every frame: the first frame, and frames that differ from either neighbour.
+def changed_key_mask(values, tolerance=0.0):
+    changed = np.any(np.abs(values[1:] - values[:-1]) > tolerance, axis=-1)
+    key_mask = np.zeros(values.shape[:2], dtype=bool)
+    key_mask[:1] = True
+    key_mask[1:] |= changed
+    key_mask[:-1] |= changed
+    return key_mask
+
+
+# Split a raw table into per-track (frames, values) channels for write_pxd_anim_uncompressed.
+# With changed_only, channels only get keys where changed_key_mask needs them, otherwise every frame is keyed.
+def raw_table_to_tracks(table, changed_only=True, tolerance=0.0):
+    # Key times are stored as uint16, longer clips would wrap around
+    if table.shape[0] > UNCOMPRESSED_MAX_FRAMES:
+        raise ValueError(f"Uncompressed animations hold at most {UNCOMPRESSED_MAX_FRAMES} frames, "
+                         f"this one has {table.shape[0]}")
+    frames = np.arange(table.shape[0], dtype=np.uint16)
+    # Locations and scales keep their fourth float, bone length and 1.0
+    channel_values = [table[:, :, 4:8], table[:, :, 0:4], table[:, :, 8:12]]
+    if changed_only:
+        key_masks = [changed_key_mask(values, tolerance) for values in channel_values]
+    tracks = []
+    for track in range(table.shape[1]):
+        channels = []
+        for c, values in enumerate(channel_values):
+            if changed_only:
+                keyed = key_masks[c][:, track]
+                channels.append((frames[keyed], values[keyed, track]))
+            else:
+                channels.append((frames, values[:, track]))
+        tracks.append(tuple(channels))
+    return tracks
+
+
+# Prefix a raw table with the header expected by the DLL's compress function
+def raw_table_to_buffer(table, duration, frame_rate):
+    header = struct.pack('<ffII', duration, frame_rate, table.shape[0], table.shape[1])
+    return header + np.ascontiguousarray(table, dtype='<f4').tobytes()
+
+
+# BINA offset table entry, stores the distance to the previous pointer divided by 4
+def encode_offset(delta):
+    delta >>= 2
+    if delta < 0x40:
+        return struct.pack('>B', 0x40 | delta)
+    elif delta < 0x4000:
+        return struct.pack('>H', 0x8000 | delta)
+    else:
+        return struct.pack('>I', 0xC0000000 | delta)
+
+
+# Write the BINA/DATA/PXAN container around already laid out chunk data.
+# chunk_data starts at 0x80 in the file, pointers lists offsets (relative to 0x40) of every pointer inside it.
+def write_pxd_container(file, chunk_data, pointers, duration, frame_count, track_count, root_offset,
+                        is_additive=False, is_compressed=True):
+    pointers = [0x10, 0x28] + ([0x30] if root_offset else []) + list(pointers)
+    offset_table = bytearray()
+    prev_pointer = 0
+    for pointer in sorted(pointers):
+        offset_table += encode_offset(pointer - prev_pointer)
+        prev_pointer = pointer
+    offset_table += NULL.to_bytes(-len(offset_table) % 4, 'little')
+
+    file_size = 0x80 + len(chunk_data) + len(offset_table)
+
+    # BINA
+    bin_magic = bytes('BINA210L', 'ascii')
+    file.write(bin_magic)
+    file.write(struct.pack('<i', file_size))
+    file.write(struct.pack('<i', 1))
+
+    # DATA
+    data_magic = bytes('DATA', 'ascii')
+    file.write(data_magic)
+    file.write(struct.pack('<i', file_size - 0x10))
+    file.write(struct.pack('<i', file_size - 0x40 - len(offset_table)))
+    file.write(struct.pack('<i', 0))
+
+    file.write(struct.pack('<i', len(offset_table)))
+    file.write(struct.pack('<i', 0x18))
+    file.write(NULL.to_bytes(24, 'little'))
+
+    # PXAN
+    pxan_magic = bytes('NAXP', 'ascii')
+    file.write(pxan_magic)
+    file.write(struct.pack('<i', 0x200))
+    if is_additive:
+        file.write(struct.pack('<B', 1))
+    else:
+        file.write(struct.pack('<B', 0))
+
+    if is_compressed:
+        file.write(struct.pack('<B', 8))
+    else:
+        file.write(struct.pack('<B', 0))
+
+    file.write(NULL.to_bytes(2, 'little'))
+    file.write(NULL.to_bytes(4, 'little'))
+
+    file.write(struct.pack('<i', 0x18))
+    file.write(struct.pack('<i', 0))
+    file.write(struct.pack('<f', duration))
+    file.write(struct.pack('<i', frame_count))
+
+    file.write(struct.pack('<i', track_count))
+    file.write(struct.pack('<i', 0))
+    file.write(struct.pack('<q', 0x40))
+
+    # Root offset
+    file.write(struct.pack('<q', root_offset))
+    file.write(struct.pack('<q', 0))
+
+    file.write(chunk_data)
+    file.write(offset_table)
+
+
+# Write a PXD animation with ACL compressed main and (optional) root motion chunks
+def write_pxd_anim(file, main_chunk, root_chunk, duration, frame_count, track_count, is_additive=False):
+    main_buffer_size = len(main_chunk)
+    root_buffer_size = len(root_chunk) if root_chunk is not None else 0
+
+    # Compressed track
+    chunk_data = bytearray(main_chunk)
+    if root_buffer_size:
+        chunk_data += NULL.to_bytes(0x10 - main_buffer_size % 0x10, 'little')
+        root_offset = 0x40 + len(chunk_data)
+        # Root track
+        chunk_data += root_chunk
+        chunk_data += NULL.to_bytes(4 - root_buffer_size % 4, 'little')
+    else:
+        root_offset = 0
+        chunk_data += NULL.to_bytes(4 - main_buffer_size % 4, 'little')
+
+    write_pxd_container(file, chunk_data, [], duration, frame_count, track_count, root_offset,
+                        is_additive=is_additive, is_compressed=True)
+
+
+# Lay out an uncompressed track table at chunk_offset (relative to 0x40) the way read_uncompressed_tracks reads it.
+# Every track is a (location, rotation, scale) tuple of (frames, values) channels, values are stored 0x10 bytes apart.
+def build_uncompressed_chunk(tracks, chunk_offset):
+    table = bytearray(0x48 * len(tracks))
+    data = bytearray()
+    pointers = []
+    data_offset = chunk_offset + len(table)
+
+    for track, channels in enumerate(tracks):
+        entry_offset = 0x48 * track
+        for c, (frames, values) in enumerate(channels):
+            key_count = len(frames)
+            values = np.asarray(values, dtype='<f4')
+            padded_values = np.zeros((key_count, 4), dtype='<f4')
+            padded_values[:, :values.shape[-1]] = values.reshape(key_count, values.shape[-1])
+
+            frame_pointer = data_offset + len(data)
+            data += np.asarray(frames, dtype='<u2').tobytes()
+            data += NULL.to_bytes(-len(data) % 0x10, 'little')
+            value_pointer = data_offset + len(data)
+            data += padded_values.tobytes()
+
+            struct.pack_into('<QQQ', table, entry_offset + 0x18 * c, key_count, frame_pointer, value_pointer)
+            pointers.append(chunk_offset + entry_offset + 0x18 * c + 0x8)
+            pointers.append(chunk_offset + entry_offset + 0x18 * c + 0x10)
+
+    return table + data, pointers
+
+
+# Write a PXD animation with uncompressed key tables, see build_uncompressed_chunk for the track layout
+def write_pxd_anim_uncompressed(file, main_tracks, root_tracks, duration, frame_count, is_additive=False):
+    chunk_data, pointers = build_uncompressed_chunk(main_tracks, 0x40)
+    if root_tracks:
+        chunk_data += NULL.to_bytes(-len(chunk_data) % 0x10, 'little')
+        root_offset = 0x40 + len(chunk_data)
+        root_data, root_pointers = build_uncompressed_chunk(root_tracks, root_offset)
+        chunk_data += root_data
+        pointers += root_pointers
+    else:
+        root_offset = 0
+
+    write_pxd_container(file, chunk_data, pointers, duration, frame_count, len(main_tracks), root_offset,
+                        is_additive=is_additive, is_compressed=False)
+
+
+def write_raw_pose(file, main_buffer, root_buffer=None, is_additive=False):
+    flags = 0
+    if is_additive:
+        flags |= RAW_FLAG_ADDITIVE
+    if root_buffer is not None:
+        flags |= RAW_FLAG_ROOT
+    file.write(struct.pack('<4sIII', RAW_MAGIC, RAW_VERSION, flags, 0))
+    file.write(main_buffer)
+    if root_buffer is not None:
+        file.write(root_buffer)
+
+
+class RawPose:
+    def __init__(self, file):
+        data = file.read()
+        if len(data) < 0x20:
+            self.error = "Not a valid raw pose file"
+            return
+        magic, version, flags, reserved = struct.unpack_from('<4sIII', data, 0)
+        if magic != RAW_MAGIC:
+            self.error = "Not a valid raw pose file"
+            return
+        if version != RAW_VERSION:
+            self.error = "Unsupported raw pose version"
+            return
+        self.is_additive = bool(flags & RAW_FLAG_ADDITIVE)
+
+        main_buffer = memoryview(data)[0x10:]
+        self.duration, self.frame_rate, self.frame_count, self.track_count = read_pose_header(main_buffer)
+        try:
+            self.main_table = read_pose_table(main_buffer)
+            if flags & RAW_FLAG_ROOT:
+                self.root_table = read_pose_table(main_buffer[0x10 + self.main_table.nbytes:])
+            else:
+                self.root_table = None
+        except (struct.error, ValueError):
+            # Tables run past the end of the file
+            self.error = "Raw pose file is truncated"
+            return
+        self.error = None
+
+
+"""
+# ------------------------------------
+# ------- Raw pose file struct -------
+# ------------------------------------
+
+magic       # char[4], 'PXDR'
+version     # uint32, 1
+flags       # uint32, 1 = additive, 2 = root motion table follows the main table
+reserved    # uint32, always 0
+
+main_table  # decompressed buffer struct, see FrontiersAnimDecompress/process_buffer.py
+root_table  # decompressed buffer struct with a track count of 1, only present with flag 2
+"""
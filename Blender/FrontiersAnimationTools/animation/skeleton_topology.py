@@ -0,0 +1,138 @@
+"""
+Bone hierarchy of an armature flattened into index arrays, built once per armature instead of walking
+parent_recursive for every bone on every frame
+Only reads the armature when built, the transform helpers are plain NumPy
+"""
+
+
+import numpy as np
+
+from .pose_arrays import decompose_matrices, quat_multiply, quat_normalize, quat_rotate
+
+
+class SkeletonTopology:
+    def __init__(self, obj):
+        pose_bones = obj.pose.bones
+        bone_count = len(pose_bones)
+
+        # Track order is pose.bones order, same as the track order of the PXD skeleton
+        self.names = [pbone.name for pbone in pose_bones]
+        self.index = {name: b for b, name in enumerate(self.names)}
+        self.parents = np.full(bone_count, -1, dtype=np.int32)
+        for b, pbone in enumerate(pose_bones):
+            if pbone.parent:
+                self.parents[b] = self.index[pbone.parent.name]
+
+        # Rest pose matrix_local of every bone, (bone, 4, 4)
+        self.rest_matrices = np.array([pbone.bone.matrix_local for pbone in pose_bones], dtype=np.float64)
+        self.rest_matrices = self.rest_matrices.reshape(bone_count, 4, 4)
+
+        # basis_transforms only reproduces convert_local_to_pose for the parenting options the skeleton importer sets
+        self.supports_basis_transforms = all(pbone.bone.inherit_scale == 'ALIGNED'
+                                             and pbone.bone.use_inherit_rotation
+                                             and pbone.bone.use_local_location
+                                             for pbone in pose_bones)
+
+        self.depths = np.zeros(bone_count, dtype=np.int32)
+        for b in range(bone_count):
+            parent = self.parents[b]
+            while parent >= 0:
+                self.depths[b] += 1
+                parent = self.parents[parent]
+
+        # Parents always come before their children, stable so siblings keep pose.bones order
+        self.order = np.argsort(self.depths, kind='stable').astype(np.int32)
+        self.roots = np.flatnonzero(self.parents < 0)
+        # pose.bones index of every bone, only differs from its own index in a subset
+        self.bones = np.arange(bone_count, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.names)
+
+    # Topology of only the listed bones and everything above them, the bones needed to work out their transforms.
+    # Bones keep pose.bones order, bones maps them back to their pose.bones and track index.
+    def subset(self, bones):
+        needed = np.zeros(len(self.names), dtype=bool)
+        for b in bones:
+            while b >= 0 and not needed[b]:
+                needed[b] = True
+                b = self.parents[b]
+        kept = np.flatnonzero(needed)
+        remap = np.full(len(self.names), -1, dtype=np.int32)
+        remap[kept] = np.arange(len(kept))
+
+        topology = object.__new__(SkeletonTopology)
+        topology.names = [self.names[b] for b in kept]
+        topology.index = {name: b for b, name in enumerate(topology.names)}
+        topology.parents = np.where(self.parents[kept] >= 0, remap[self.parents[kept]], -1).astype(np.int32)
+        topology.rest_matrices = self.rest_matrices[kept]
+        topology.supports_basis_transforms = self.supports_basis_transforms
+        topology.depths = self.depths[kept]
+        topology.order = np.argsort(topology.depths, kind='stable').astype(np.int32)
+        topology.roots = np.flatnonzero(topology.parents < 0)
+        topology.bones = self.bones[kept]
+        return topology
+
+    # Identity local transforms shaped (frame_count, bone, n), for bones without a track
+    def identity_pose(self, frame_count):
+        bone_count = len(self.names)
+        loc = np.zeros((frame_count, bone_count, 3), dtype=np.float32)
+        rot = np.zeros((frame_count, bone_count, 4), dtype=np.float32)
+        rot[..., 0] = 1.0
+        scale = np.ones((frame_count, bone_count, 3), dtype=np.float32)
+        return loc, rot, scale
+
+    # Accumulate parent-relative tracks down the hierarchy in one forward pass, batched over leading axes.
+    # Arrays are (..., bone, n) with WXYZ rotations. Locations are unaffected by parent scale, so the
+    # output is the unscaled global location and rotation plus the product of every scale up the chain.
+    def global_transforms(self, loc, rot, scale):
+        rot = quat_normalize(np.asarray(rot, dtype=np.float64))
+        loc = np.asarray(loc, dtype=np.float64)
+        scale = np.asarray(scale, dtype=np.float64)
+
+        global_loc = np.empty_like(loc)
+        global_rot = np.empty_like(rot)
+        global_scale = np.empty_like(scale)
+        for b in self.order:
+            parent = self.parents[b]
+            if parent < 0:
+                global_loc[..., b, :] = loc[..., b, :]
+                global_rot[..., b, :] = rot[..., b, :]
+                global_scale[..., b, :] = scale[..., b, :]
+            else:
+                parent_rot = global_rot[..., parent, :]
+                global_loc[..., b, :] = global_loc[..., parent, :] + quat_rotate(parent_rot, loc[..., b, :])
+                global_rot[..., b, :] = quat_multiply(parent_rot, rot[..., b, :])
+                global_scale[..., b, :] = global_scale[..., parent, :] * scale[..., b, :]
+        return global_loc, quat_normalize(global_rot), global_scale
+
+    # Same as Bone.convert_local_to_pose(matrix, matrix_local, parent_matrix, parent_matrix_local, invert=True)
+    # for every bone, with each bone's parent_matrix taken from the input. matrices are (..., bone, 4, 4) pose
+    # space matrices, returns the matrix_basis location, WXYZ rotation and scale arrays.
+    def basis_transforms(self, matrices):
+        matrices = np.asarray(matrices, dtype=np.float64)
+        basis = np.empty_like(matrices)
+
+        roots = self.parents < 0
+        basis[..., roots, :, :] = np.linalg.inv(self.rest_matrices[roots]) @ matrices[..., roots, :, :]
+
+        children = np.flatnonzero(~roots)
+        if children.size:
+            parent_matrices = matrices[..., self.parents[children], :, :]
+            # Rest transform relative to the parent's rest transform
+            offsets = np.linalg.inv(self.rest_matrices[self.parents[children]]) @ self.rest_matrices[children]
+
+            # Aligned scale inheritance: parent rotation, with parent scale applied along the child's own axes
+            post_scale = np.linalg.norm(parent_matrices[..., :3, :3], axis=-2)
+            parent_normalized = parent_matrices.copy()
+            parent_normalized[..., :3, :3] /= np.where(post_scale != 0.0, post_scale, 1.0)[..., None, :]
+            rotscale = parent_normalized @ offsets
+            loc_mat = parent_matrices @ offsets
+
+            child_matrices = matrices[..., children, :, :]
+            child_basis = np.linalg.inv(rotscale) @ child_matrices
+            child_basis[..., :3, :3] /= np.where(post_scale != 0.0, post_scale, 1.0)[..., None, :]
+            child_basis[..., :3, 3] = (np.linalg.inv(loc_mat) @ child_matrices[..., :, 3:])[..., :3, 0]
+            basis[..., children, :, :] = child_basis
+
+        return decompose_matrices(basis)
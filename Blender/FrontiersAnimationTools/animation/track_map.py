@@ -0,0 +1,71 @@
+"""
+Matching of animation tracks to armature bones by name, using the bone names of the PXD skeleton (.skl.pxd) the
+animation was made for
+Remap arrays are built once per skeleton file and armature and reused by later imports
+Kept free of bpy, the importer passes in the armature's bone names
+"""
+
+
+import glob
+import os
+import numpy as np
+
+from ..skeleton.pxd_skeleton import read_skeleton
+
+# (skeleton path, size, modification time, bone names) -> TrackMap
+_track_map_cache = {}
+
+
+class TrackMap:
+    def __init__(self, bones=None, track_count=0, error=None):
+        # Track index of every bone in pose.bones order, -1 for bones without a track
+        self.bones = bones
+        # Number of tracks the skeleton has, animations made for it have as many
+        self.track_count = track_count
+        self.error = error
+
+    # Bones in order, the mapping the skeleton importer's bone order gives
+    @classmethod
+    def by_order(cls, bone_count):
+        return cls(np.arange(bone_count, dtype=np.int32), bone_count)
+
+    # Track index of every bone, each bone takes the track of the same name
+    @classmethod
+    def by_names(cls, track_names, bone_names):
+        track_index = {name: t for t, name in enumerate(track_names)}
+        bones = np.array([track_index.get(name, -1) for name in bone_names], dtype=np.int32)
+        return cls(bones, len(track_names))
+
+    @property
+    def unmatched_count(self):
+        return int(np.count_nonzero(self.bones < 0))
+
+    # Track index of the listed bones, -1 where they have no track among the first track_count
+    def tracks(self, bones, track_count):
+        tracks = self.bones[bones]
+        return np.where(tracks < track_count, tracks, -1)
+
+
+# TrackMap of the skeleton file at skeleton_path onto bone_names, only read and built again when the file changes
+def skeleton_track_map(skeleton_path, bone_names):
+    try:
+        stat = os.stat(skeleton_path)
+    except OSError as error:
+        return TrackMap(error=str(error))
+    key = (os.path.abspath(skeleton_path), stat.st_size, stat.st_mtime_ns, tuple(bone_names))
+    track_map = _track_map_cache.get(key)
+    if track_map is None:
+        skeleton = read_skeleton(skeleton_path)
+        if skeleton.error:
+            return TrackMap(error=skeleton.error)
+        track_map = TrackMap.by_names(skeleton.names, bone_names)
+        _track_map_cache[key] = track_map
+    return track_map
+
+
+# The skeleton next to an animation, if there's exactly one .skl.pxd in its folder
+def find_skeleton(anim_path):
+    skeletons = glob.glob(os.path.join(glob.escape(os.path.dirname(anim_path)), "*.skl.pxd"))
+    if len(skeletons) == 1:
+        return skeletons[0]
+    return None
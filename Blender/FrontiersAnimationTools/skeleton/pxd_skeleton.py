@@ -0,0 +1,61 @@
+"""
+Reading of PXD skeleton files (.skl.pxd)
+Kept free of bpy so the animation importer can match tracks to bones by name without importing the skeleton
+"""
+
+
+import struct
+
+SKELETON_MAGIC = b'KSXP'
+SKELETON_VERSION = 512
+SKELETON_CONST = 104
+
+
+# Bones of a PXD skeleton in track order. Transforms are as stored in the file: XYZ positions and XYZW rotations
+# relative to the parent, parents are -1 for root bones.
+class PXDSkeleton:
+    def __init__(self, buffer):
+        self.error = None
+        self.names = []
+        self.parents = []
+        self.positions = []
+        self.rotations = []
+
+        buffer = memoryview(buffer)
+        if len(buffer) < 0x90:
+            self.error = "Not a valid PXD skeleton file"
+            return
+        magic, version, const = struct.unpack_from('<4sII', buffer, 0x40)
+        if magic != SKELETON_MAGIC:
+            self.error = "Not a valid PXD skeleton file"
+            return
+        if version != SKELETON_VERSION or const != SKELETON_CONST:
+            self.error = "Wrong PXD version"
+            return
+
+        parenting_offset, = struct.unpack_from('<I', buffer, 0x48)
+        bone_count, = struct.unpack_from('<I', buffer, 0x50)
+        name_table, = struct.unpack_from('<I', buffer, 0x68)
+        pos_offset, = struct.unpack_from('<I', buffer, 0x88)
+
+        for x in range(bone_count):
+            self.parents.append(struct.unpack_from('<h', buffer, parenting_offset + 0x40 + x * 0x2)[0])
+            name_offset, = struct.unpack_from('<I', buffer, name_table + 0x40 + x * 0x10)
+            self.names.append(read_zero_term_string(buffer, name_offset + 0x40))
+            self.positions.append(struct.unpack_from('<fff', buffer, pos_offset + 0x40 + x * 0x30))
+            self.rotations.append(struct.unpack_from('<ffff', buffer, pos_offset + 0x40 + x * 0x30 + 0x10))
+
+    def __len__(self):
+        return len(self.names)
+
+
+def read_skeleton(filepath):
+    with open(filepath, "rb") as skel_file:
+        return PXDSkeleton(skel_file.read())
+
+
+def read_zero_term_string(buffer, offset):
+    end = offset
+    while end < len(buffer) and buffer[end] != 0:
+        end += 1
+    return bytes(buffer[offset:end]).decode('utf-8')
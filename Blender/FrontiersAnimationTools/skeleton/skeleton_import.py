@@ -2,9 +2,7 @@
 # https://github.com/Turk645/Hedgehog-Engine-2-Mesh-Blender-Importer
 
 import bpy
-import io
 import os
-import struct
 import mathutils
 from bpy_extras.io_utils import ImportHelper
 from bpy.props import (BoolProperty,
@@ -13,6 +11,7 @@ from bpy.props import (BoolProperty,
                        EnumProperty,
                        CollectionProperty
                        )
+from .pxd_skeleton import read_skeleton
 
 
 class HedgehogSkeletonImport(bpy.types.Operator, ImportHelper):
@@ -118,22 +117,16 @@ class HedgehogSkeletonImport(bpy.types.Operator, ImportHelper):
     def execute(self, context):
         bpy.ops.object.select_all(action='DESELECT')
         for file in self.files:
-            skel_file = open(os.path.join(os.path.dirname(self.filepath), file.name), "rb")
-            if not self.skel_check(skel_file):
+            skeleton = read_skeleton(os.path.join(os.path.dirname(self.filepath), file.name))
+            if skeleton.error:
+                self.report({'ERROR'}, f"{file.name}: {skeleton.error}")
                 return {'CANCELLED'}
 
             skel_name = file.name
             for ext in [".skl", ".pxd"]:
                 skel_name = skel_name.replace(ext, "")
 
-            skel_file.seek(0x48)
-            skel_parenting_offset = int.from_bytes(skel_file.read(4), byteorder='little') + 0x40
-            skel_file.seek(4, 1)
-            skel_parenting_count = int.from_bytes(skel_file.read(4), byteorder='little')
-            skel_file.seek(0x68)
-            skel_name_table = int.from_bytes(skel_file.read(4), byteorder='little') + 0x40
-            skel_file.seek(0x88)
-            skel_pos_offset = int.from_bytes(skel_file.read(4), byteorder='little') + 0x40
+            skel_parenting_count = len(skeleton)
 
             armature_data = bpy.data.armatures.new(f"{skel_name}_skeleton")
             armature_obj = bpy.data.objects.new(f"{skel_name}_skeleton", armature_data)
@@ -149,20 +142,14 @@ class HedgehogSkeletonImport(bpy.types.Operator, ImportHelper):
 
             skel_table = []
             for x in range(skel_parenting_count):
-                skel_file.seek(skel_parenting_offset + x * 0x2)
-                bone_parent = int.from_bytes(skel_file.read(2), byteorder='little', signed=True)
-                skel_file.seek(skel_name_table + x * 0x10)
-                skel_name_offset = int.from_bytes(skel_file.read(4), byteorder='little') + 0x40
-                skel_file.seek(skel_name_offset)
-                bone_name = read_zero_term_string(skel_file)
-                skel_file.seek(skel_pos_offset + x * 0x30)
-                tmp_vec = struct.unpack('<fff', skel_file.read(4 * 3))
+                bone_parent = skeleton.parents[x]
+                bone_name = skeleton.names[x]
+                tmp_vec = skeleton.positions[x]
                 if self.use_yx_orientation:
                     bone_vec = (tmp_vec[2], tmp_vec[0], tmp_vec[1])
                 else:
                     bone_vec = (tmp_vec[0], tmp_vec[1], tmp_vec[2])
-                skel_file.seek(4, 1)
-                temp_rot = struct.unpack('<ffff', skel_file.read(4 * 4))
+                temp_rot = skeleton.rotations[x]
                 if self.use_yx_orientation:
                     bone_rot = (temp_rot[3], temp_rot[2], temp_rot[0], temp_rot[1])
                 else:
@@ -229,9 +216,6 @@ class HedgehogSkeletonImport(bpy.types.Operator, ImportHelper):
 
             utils_set_mode('OBJECT')
 
-            skel_file.close()
-            del skel_file
-
         return {'FINISHED'}
 
     def menu_func_import(self, context):
@@ -241,30 +225,6 @@ class HedgehogSkeletonImport(bpy.types.Operator, ImportHelper):
             icon='OUTLINER_OB_ARMATURE'
         )
 
-    def skel_check(self, file):
-        file.seek(0x40, 0)
-        magic = file.read(4)
-        version = int.from_bytes(file.read(4), byteorder='little')
-        const = int.from_bytes(file.read(4), byteorder='little')
-        if magic != b'KSXP':
-            self.report({'ERROR'}, f"{file.name}: Not a valid PXD skeleton file")
-            return False
-        if version != 512 or const != 104:
-            self.report({'ERROR'}, f"{file.name}: Wrong PXD version")
-            return False
-        file.seek(0, 0)
-        return True
-
-
-def read_zero_term_string(file):
-    temp_bytes = []
-    while True:
-        b = file.read(1)
-        if b is None or b[0] == 0:
-            return bytes(temp_bytes).decode('utf-8')
-        else:
-            temp_bytes.append(b[0])
-
 
 def utils_set_mode(mode):
     if bpy.ops.object.mode_set.poll():
@@ -1,9 +1,7 @@
 #include <vector>
 #include <string>
-#include <sstream>
-#include <ostream>
+#include <cstring>
 #include <iostream>
-#include <fstream>
 
 #include "acl/compression/compress.h"
 #include "acl/compression/compression_settings.h"
@@ -25,41 +23,67 @@ struct quat
 	float x, y, z, w;
 };
 
+// Floats per track per frame in decompressed output: rotation xyzw, translation xyz + w, scale xyz + w
+constexpr uint32_t track_stride = 12;
+
 struct frontiers_writer final : public track_writer
 {
-	explicit frontiers_writer(std::vector<rtm::qvvf>& Transforms_) : Transforms(Transforms_) {}
+	explicit frontiers_writer(float* Transforms_) : Transforms(Transforms_) {}
 
-	std::vector<rtm::qvvf>& Transforms;
+	// Start of the current frame in the output buffer, which doesn't have to be aligned for rtm types
+	float* Transforms;
 
 	//////////////////////////////////////////////////////////////////////////
 	// Called by the decoder to write out a quaternion rotation value for a specified bone index.
 	void RTM_SIMD_CALL write_rotation(uint32_t TrackIndex, rtm::quatf_arg0 Rotation)
 	{
-		Transforms[TrackIndex].rotation = Rotation;
+		rtm::quat_store(Rotation, Transforms + TrackIndex * track_stride);
 	}
 
 	//////////////////////////////////////////////////////////////////////////
 	// Called by the decoder to write out a translation value for a specified bone index.
 	void RTM_SIMD_CALL write_translation(uint32_t TrackIndex, rtm::vector4f_arg0 Translation)
 	{
-		Transforms[TrackIndex].translation = Translation;
+		rtm::vector_store(Translation, Transforms + TrackIndex * track_stride + 4);
 	}
 
 	//////////////////////////////////////////////////////////////////////////
 	// Called by the decoder to write out a scale value for a specified bone index.
 	void RTM_SIMD_CALL write_scale(uint32_t TrackIndex, rtm::vector4f_arg0 Scale)
 	{
-		Transforms[TrackIndex].scale = Scale;
+		rtm::vector_store(Scale, Transforms + TrackIndex * track_stride + 8);
 	}
 };
 
-struct anim_output
+// Same as frontiers_writer, but for decompress_track: writes to one transform whichever track it's given
+struct single_track_writer final : public track_writer
+{
+	explicit single_track_writer(float* Transform_) : Transform(Transform_) {}
+
+	float* Transform;
+
+	void RTM_SIMD_CALL write_rotation(uint32_t TrackIndex, rtm::quatf_arg0 Rotation)
+	{
+		rtm::quat_store(Rotation, Transform);
+	}
+
+	void RTM_SIMD_CALL write_translation(uint32_t TrackIndex, rtm::vector4f_arg0 Translation)
+	{
+		rtm::vector_store(Translation, Transform + 4);
+	}
+
+	void RTM_SIMD_CALL write_scale(uint32_t TrackIndex, rtm::vector4f_arg0 Scale)
+	{
+		rtm::vector_store(Scale, Transform + 8);
+	}
+};
+
+struct anim_header
 {
-	float sample_rate;
 	float duration;
+	float sample_rate;
 	uint32_t frame_count;
-	uint32_t bone_count;
-	std::vector<std::vector<rtm::qvvf>> all_tracks;
+	uint32_t track_count;
 };
 
 struct python_buffer
@@ -68,80 +92,421 @@ struct python_buffer
 	size_t data_buffer_size;
 };
 
+// Buffers handed to Python are allocated with new[], Python passes them back here once it's done with them
+extern "C" __declspec(dllexport) void free_buffer(unsigned char* buffer)
+{
+	delete[] buffer;
+}
+
+static anim_header read_header(const compressed_tracks& compressed_anim)
+{
+	anim_header header;
+	header.duration = compressed_anim.get_duration();
+	header.sample_rate = compressed_anim.get_sample_rate();
+	header.frame_count = compressed_anim.get_num_samples_per_track();
+	header.track_count = compressed_anim.get_num_tracks();
+	return header;
+}
+
+// Sample frames [frame_start, frame_end) straight into buffer_out, one frame after another
+static void decompress_frames(decompression_context<default_transform_decompression_settings>& context, const anim_header& header,
+	uint32_t frame_start, uint32_t frame_end, float* buffer_out)
+{
+	for (uint32_t sample_index = frame_start; sample_index < frame_end; ++sample_index)
+	{
+		const float sample_time = rtm::scalar_min(float(sample_index) / header.sample_rate, header.duration);
+
+		frontiers_writer writer(buffer_out + size_t(sample_index - frame_start) * header.track_count * track_stride);
+		context.seek(sample_time, acl::sample_rounding_policy::none);
+		context.decompress_tracks(writer);
+	}
+}
+
 extern "C" __declspec(dllexport) python_buffer decompress(const char* buffer_in)
 {
 	decompression_context<default_transform_decompression_settings> context;
 	error_result result;
 
+	python_buffer python_out;
+	python_out.data_buffer = nullptr;
+	python_out.data_buffer_size = 0;
+
 	const compressed_tracks* compressed_anim = make_compressed_tracks(buffer_in, &result);
 
-	if (!context.initialize(*compressed_anim))
+	if (compressed_anim == nullptr || !context.initialize(*compressed_anim))
 	{
 		std::cout << "Failed to read animation file" << result.c_str() << std::endl;
-		python_buffer fail;
-		fail.data_buffer = nullptr;
-		fail.data_buffer_size = 0;
-		return fail;
+		return python_out;
 	}
 
-	std::vector<rtm::qvvf> raw_local_pose_transforms;
+	// Sampled straight into the buffer handed to Python, no intermediate copies
+	const anim_header header = read_header(*compressed_anim);
+	const size_t buffer_out_size = sizeof(anim_header) + size_t(header.frame_count) * header.track_count * track_stride * sizeof(float);
+	unsigned char* buffer_out = new unsigned char[buffer_out_size];
+
+	std::memcpy(buffer_out, &header, sizeof(anim_header));
+	decompress_frames(context, header, 0, header.frame_count, (float*)(buffer_out + sizeof(anim_header)));
 
-	for (uint32_t i = 0; i < compressed_anim->get_num_tracks(); i++)
+	python_out.data_buffer = buffer_out;
+	python_out.data_buffer_size = buffer_out_size;
+
+	return python_out;
+}
+
+// Streaming decompression, for reading long clips a window of frames at a time into memory owned by the caller.
+// The compressed data is copied on open, so the caller's buffer may be freed straight after.
+// Streams come from an ACL allocator since the decompression context is over-aligned for plain new.
+static ansi_allocator stream_allocator;
+
+struct anim_stream
+{
+	decompression_context<default_transform_decompression_settings> context;
+	void* compressed_data = nullptr;
+	size_t compressed_size = 0;
+	anim_header header;
+	uint32_t position = 0;
+};
+
+extern "C" __declspec(dllexport) anim_stream* stream_open(const char* buffer_in)
+{
+	error_result result;
+	const compressed_tracks* compressed_in = make_compressed_tracks(buffer_in, &result);
+	if (compressed_in == nullptr)
+	{
+		std::cout << "Failed to read animation file" << result.c_str() << std::endl;
+		return nullptr;
+	}
+
+	anim_stream* stream = allocate_type<anim_stream>(stream_allocator);
+	stream->compressed_size = compressed_in->get_size();
+	stream->compressed_data = stream_allocator.allocate(stream->compressed_size, alignof(compressed_tracks));
+	std::memcpy(stream->compressed_data, buffer_in, stream->compressed_size);
+
+	const compressed_tracks* compressed_anim = make_compressed_tracks(stream->compressed_data, &result);
+	if (compressed_anim == nullptr || !stream->context.initialize(*compressed_anim))
 	{
-		raw_local_pose_transforms.push_back(rtm::qvvf());
+		std::cout << "Failed to read animation file" << result.c_str() << std::endl;
+		stream_allocator.deallocate(stream->compressed_data, stream->compressed_size);
+		deallocate_type(stream_allocator, stream);
+		return nullptr;
 	}
 
-	frontiers_writer writer(raw_local_pose_transforms);
+	stream->header = read_header(*compressed_anim);
+	return stream;
+}
+
+extern "C" __declspec(dllexport) anim_header stream_header(const anim_stream* stream)
+{
+	if (stream == nullptr)
+		return anim_header{};
+	return stream->header;
+}
+
+// Move the stream to frame, returns the frame it ended up on
+extern "C" __declspec(dllexport) uint32_t stream_seek(anim_stream* stream, uint32_t frame)
+{
+	if (stream == nullptr)
+		return 0;
+	stream->position = frame < stream->header.frame_count ? frame : stream->header.frame_count;
+	return stream->position;
+}
+
+// Decompress frames [position, frame_end) into buffer_out, which holds buffer_size bytes, and advance past them.
+// Returns the number of frames written, fewer than requested if the clip or the buffer runs out.
+extern "C" __declspec(dllexport) uint32_t stream_decompress(anim_stream* stream, uint32_t frame_end, unsigned char* buffer_out, size_t buffer_size)
+{
+	if (stream == nullptr || buffer_out == nullptr)
+		return 0;
+	const size_t frame_size = size_t(stream->header.track_count) * track_stride * sizeof(float);
+	if (frame_end > stream->header.frame_count)
+		frame_end = stream->header.frame_count;
+	if (frame_end <= stream->position || frame_size == 0)
+		return 0;
+
+	uint32_t frame_count = frame_end - stream->position;
+	if (frame_count > buffer_size / frame_size)
+		frame_count = uint32_t(buffer_size / frame_size);
+
+	decompress_frames(stream->context, stream->header, stream->position, stream->position + frame_count, (float*)buffer_out);
+	stream->position += frame_count;
+	return frame_count;
+}
+
+// Sample the listed tracks at any time in seconds, interpolating between frames, into buffer_out as one
+// 12 float transform per listed track in list order. A null track list samples every track in track order.
+// Doesn't move the stream position. Returns the number of tracks written.
+extern "C" __declspec(dllexport) uint32_t stream_sample(anim_stream* stream, float sample_time, const uint32_t* track_list, uint32_t track_list_size,
+	unsigned char* buffer_out, size_t buffer_size)
+{
+	if (stream == nullptr || buffer_out == nullptr)
+		return 0;
+	const size_t transform_size = track_stride * sizeof(float);
+	const uint32_t track_count = track_list == nullptr ? stream->header.track_count : track_list_size;
+	if (size_t(track_count) * transform_size > buffer_size)
+		return 0;
 
-	std::vector<std::vector<rtm::qvvf>> all_tracks;
+	sample_time = rtm::scalar_clamp(sample_time, 0.0f, stream->header.duration);
+	stream->context.seek(sample_time, acl::sample_rounding_policy::none);
 
-	for (uint32_t sample_index = 0; sample_index < compressed_anim->get_num_samples_per_track(); ++sample_index)
+	if (track_list == nullptr)
 	{
-		const float sample_time = rtm::scalar_min(float(sample_index) / compressed_anim->get_sample_rate(), compressed_anim->get_duration());
+		frontiers_writer writer((float*)buffer_out);
+		stream->context.decompress_tracks(writer);
+		return track_count;
+	}
 
-		context.seek(sample_time, acl::sample_rounding_policy::none);
-		context.decompress_tracks(writer);
-		all_tracks.push_back(writer.Transforms);
+	for (uint32_t i = 0; i < track_list_size; i++)
+	{
+		if (track_list[i] >= stream->header.track_count)
+			return i;
+
+		single_track_writer writer((float*)buffer_out + size_t(i) * track_stride);
+		stream->context.decompress_track(track_list[i], writer);
 	}
+	return track_list_size;
+}
+
+// How each sub-track is stored in the compressed clip, the same values ACL packs into its sub-track types
+enum sub_track_type : uint8_t
+{
+	sub_track_default = 0,	// Never changes from the identity, or the clip's default scale
+	sub_track_constant = 1,	// Never changes
+	sub_track_animated = 2,
+};
+
+// Write translation, rotation and scale sub-track types for every track into types_out, 3 bytes per track in that
+// order, the order of the channels of uncompressed PXD tracks. Returns the number of tracks written.
+extern "C" __declspec(dllexport) uint32_t stream_track_types(const anim_stream* stream, uint8_t* types_out, size_t buffer_size)
+{
+	if (stream == nullptr || types_out == nullptr)
+		return 0;
+	const uint32_t track_count = stream->header.track_count;
+	if (size_t(track_count) * 3 > buffer_size)
+		return 0;
+
+	const compressed_tracks& compressed_anim = *make_compressed_tracks(stream->compressed_data);
+	const acl_impl::transform_tracks_header& transform_header = acl_impl::get_transform_tracks_header(compressed_anim);
+	const bool has_scale = acl_impl::get_tracks_header(compressed_anim).get_has_scale();
+
+	// 16 sub-tracks of 2 bits per entry, first track in the highest bits. Rotations, translations then scales.
+	const acl_impl::packed_sub_track_types* sub_track_types = transform_header.get_sub_track_types();
+	const uint32_t entry_count = (track_count + acl_impl::k_num_sub_tracks_per_packed_entry - 1) / acl_impl::k_num_sub_tracks_per_packed_entry;
+	const acl_impl::packed_sub_track_types* rotation_types = sub_track_types;
+	const acl_impl::packed_sub_track_types* translation_types = rotation_types + entry_count;
+	const acl_impl::packed_sub_track_types* scale_types = translation_types + entry_count;
+
+	for (uint32_t track = 0; track < track_count; track++)
+	{
+		const uint32_t entry = track / acl_impl::k_num_sub_tracks_per_packed_entry;
+		const uint32_t shift = 30 - 2 * (track % acl_impl::k_num_sub_tracks_per_packed_entry);
+		types_out[track * 3 + 0] = uint8_t((translation_types[entry].types >> shift) & 3);
+		types_out[track * 3 + 1] = uint8_t((rotation_types[entry].types >> shift) & 3);
+		types_out[track * 3 + 2] = has_scale ? uint8_t((scale_types[entry].types >> shift) & 3) : uint8_t(sub_track_default);
+	}
+	return track_count;
+}
+
+// Conversion stream_decode applies to every transform on its way out, so Python gets Blender's convention directly
+enum decode_orientation : uint32_t
+{
+	orientation_raw = 0,			// HE2's own axes with XYZW rotations, same as stream_decompress
+	orientation_xz = 1,				// WXYZ rotations, axes unchanged, for skeletons kept in HE2's XZ bone orientation
+	orientation_yx = 2,				// WXYZ rotations swizzled for Blender's YX bone orientation, root tracks get the YX root correction
+	orientation_root_motion = 3,	// Root motion track as the armature object's Z-up transform
+};
 
-	anim_output output;
+enum decode_layout : uint32_t
+{
+	layout_qvv = 0,			// 12 floats per track: rotation, translation + length, scale + w
+	layout_matrices = 1,	// 16 floats per track: row-major 4x4 of translation @ rotation @ scale
+	layout_planes = 2,		// Every translation of the window, then every rotation, then every scale: 3 + 4 + 3 floats per track
+};
+
+struct decode_options
+{
+	uint32_t orientation;
+	uint32_t layout;
+	uint32_t sanitize_scale;		// Swap all zero scales for 1.0, ACL writes them for tracks that were never scaled
+	uint32_t root_track_count;
+	const uint32_t* root_tracks;	// Tracks of bones without a parent, out of range indices are ignored
+};
 
-	output.duration = compressed_anim->get_duration();
-	output.sample_rate = compressed_anim->get_sample_rate();
-	output.frame_count = compressed_anim->get_num_samples_per_track();
-	output.bone_count = compressed_anim->get_num_tracks();
-	output.all_tracks = all_tracks;
+static const float yx_root_correction[4] = { 0.5f, -0.5f, -0.5f, -0.5f };
+static const float root_motion_correction[4] = { 0.70710678f, 0.70710678f, 0.0f, 0.0f };
 
-	// String to hold data instead of file
-	std::ostringstream data_string(std::ios::binary);
+// Hamilton product of WXYZ quaternions
+static void quat_multiply_wxyz(const float* a, const float* b, float* out)
+{
+	out[0] = a[0] * b[0] - a[1] * b[1] - a[2] * b[2] - a[3] * b[3];
+	out[1] = a[0] * b[1] + a[1] * b[0] + a[2] * b[3] - a[3] * b[2];
+	out[2] = a[0] * b[2] - a[1] * b[3] + a[2] * b[0] + a[3] * b[1];
+	out[3] = a[0] * b[3] + a[1] * b[2] - a[2] * b[1] + a[3] * b[0];
+}
 
-	data_string.write((char*)&output.duration, sizeof(float));
-	data_string.write((char*)&output.sample_rate, sizeof(float));
-	data_string.write((char*)&output.frame_count, sizeof(uint32_t));
-	data_string.write((char*)&output.bone_count, sizeof(uint32_t));
+static void store3(float* out, float x, float y, float z)
+{
+	out[0] = x;
+	out[1] = y;
+	out[2] = z;
+}
 
-	for (uint32_t i = 0; i < output.all_tracks.size(); i++)
+// Convert one raw 12 float transform, same as decode_pose_table and decode_root_table in pose_arrays.py
+static void decode_transform(const float* raw, const decode_options& options, bool is_root, float* decoded)
+{
+	switch (options.orientation)
+	{
+	case orientation_xz:
+	{
+		const float rotation[4] = { raw[3], raw[0], raw[1], raw[2] };
+		std::memcpy(decoded, rotation, sizeof(rotation));
+		store3(decoded + 4, raw[4], raw[5], raw[6]);
+		store3(decoded + 8, raw[8], raw[9], raw[10]);
+		break;
+	}
+	case orientation_yx:
+	{
+		const float rotation[4] = { raw[3], raw[2], raw[0], raw[1] };
+		if (is_root)
+			quat_multiply_wxyz(rotation, yx_root_correction, decoded);
+		else
+			std::memcpy(decoded, rotation, sizeof(rotation));
+		store3(decoded + 4, raw[6], raw[4], raw[5]);
+		store3(decoded + 8, raw[10], raw[8], raw[9]);
+		break;
+	}
+	case orientation_root_motion:
 	{
-		data_string.write((char*)output.all_tracks[i].data(), sizeof rtm::qvvf * output.all_tracks[i].size());
+		const float rotation[4] = { raw[3], raw[0], raw[1], raw[2] };
+		quat_multiply_wxyz(root_motion_correction, rotation, decoded);
+		store3(decoded + 4, raw[4], -raw[6], raw[5]);
+		store3(decoded + 8, raw[8], raw[9], raw[10]);
+		break;
+	}
+	default:
+		std::memcpy(decoded, raw, track_stride * sizeof(float));
+		break;
 	}
+	decoded[7] = raw[7];
+	decoded[11] = raw[11];
 
-	std::string binary_string = data_string.str();
-	size_t buffer_out_size = binary_string.size();
+	if (options.sanitize_scale && decoded[8] == 0.0f && decoded[9] == 0.0f && decoded[10] == 0.0f)
+		store3(decoded + 8, 1.0f, 1.0f, 1.0f);
+}
 
-	unsigned char* buffer_out = new unsigned char[buffer_out_size];
+// Row-major translation @ rotation @ scale matrix of a decoded transform, like mathutils.Matrix.LocRotScale
+static void store_matrix(const float* decoded, bool is_xyzw, float* out)
+{
+	const float w = is_xyzw ? decoded[3] : decoded[0];
+	const float x = is_xyzw ? decoded[0] : decoded[1];
+	const float y = is_xyzw ? decoded[1] : decoded[2];
+	const float z = is_xyzw ? decoded[2] : decoded[3];
+	const float rotation[3][3] = {
+		{ 1.0f - 2.0f * (y * y + z * z), 2.0f * (x * y - z * w), 2.0f * (x * z + y * w) },
+		{ 2.0f * (x * y + z * w), 1.0f - 2.0f * (x * x + z * z), 2.0f * (y * z - x * w) },
+		{ 2.0f * (x * z - y * w), 2.0f * (y * z + x * w), 1.0f - 2.0f * (x * x + y * y) },
+	};
+	for (int row = 0; row < 3; row++)
+	{
+		for (int column = 0; column < 3; column++)
+			out[row * 4 + column] = rotation[row][column] * decoded[8 + column];
+		out[row * 4 + 3] = decoded[4 + row];
+	}
+	out[12] = 0.0f;
+	out[13] = 0.0f;
+	out[14] = 0.0f;
+	out[15] = 1.0f;
+}
 
-	std::copy(binary_string.begin(), binary_string.end(), buffer_out);
+// stream_decompress with every transform converted as options asks before it's written to buffer_out.
+// Returns the number of frames written, fewer than requested if the clip or the buffer runs out.
+extern "C" __declspec(dllexport) uint32_t stream_decode(anim_stream* stream, uint32_t frame_end, const decode_options* options,
+	unsigned char* buffer_out, size_t buffer_size)
+{
+	if (stream == nullptr || options == nullptr || buffer_out == nullptr)
+		return 0;
+	const uint32_t track_count = stream->header.track_count;
+	const uint32_t track_floats = options->layout == layout_matrices ? 16 : options->layout == layout_planes ? 10 : track_stride;
+	const size_t frame_size = size_t(track_count) * track_floats * sizeof(float);
+	if (frame_end > stream->header.frame_count)
+		frame_end = stream->header.frame_count;
+	if (frame_end <= stream->position || frame_size == 0)
+		return 0;
+
+	uint32_t frame_count = frame_end - stream->position;
+	if (frame_count > buffer_size / frame_size)
+		frame_count = uint32_t(buffer_size / frame_size);
+
+	std::vector<uint8_t> is_root(track_count, 0);
+	for (uint32_t i = 0; i < options->root_track_count; i++)
+	{
+		if (options->root_tracks[i] < track_count)
+			is_root[options->root_tracks[i]] = 1;
+	}
 
-	python_buffer python_out;
+	// Planes are laid out for the frames actually written
+	float* out = (float*)buffer_out;
+	const size_t transform_count = size_t(frame_count) * track_count;
+	float* translation_plane = out;
+	float* rotation_plane = translation_plane + transform_count * 3;
+	float* scale_plane = rotation_plane + transform_count * 4;
+	const bool is_xyzw = options->orientation == orientation_raw;
 
-	python_out.data_buffer = buffer_out;
-	python_out.data_buffer_size = buffer_out_size;
+	std::vector<float> raw_frame(size_t(track_count) * track_stride);
+	for (uint32_t frame = 0; frame < frame_count; frame++)
+	{
+		decompress_frames(stream->context, stream->header, stream->position + frame, stream->position + frame + 1, raw_frame.data());
+		for (uint32_t track = 0; track < track_count; track++)
+		{
+			float decoded[track_stride];
+			decode_transform(raw_frame.data() + size_t(track) * track_stride, *options, is_root[track] != 0, decoded);
+
+			const size_t transform = size_t(frame) * track_count + track;
+			switch (options->layout)
+			{
+			case layout_matrices:
+				store_matrix(decoded, is_xyzw, out + transform * 16);
+				break;
+			case layout_planes:
+				std::memcpy(translation_plane + transform * 3, decoded + 4, 3 * sizeof(float));
+				std::memcpy(rotation_plane + transform * 4, decoded, 4 * sizeof(float));
+				std::memcpy(scale_plane + transform * 3, decoded + 8, 3 * sizeof(float));
+				break;
+			default:
+				std::memcpy(out + transform * track_stride, decoded, track_stride * sizeof(float));
+				break;
+			}
+		}
+	}
 
-	return python_out;
+	stream->position += frame_count;
+	return frame_count;
+}
+
+extern "C" __declspec(dllexport) void stream_close(anim_stream* stream)
+{
+	if (stream == nullptr)
+		return;
+	stream_allocator.deallocate(stream->compressed_data, stream->compressed_size);
+	deallocate_type(stream_allocator, stream);
 }
 
+// Settings compress_with_options takes from Python. Tracks without their own precision or shell distance, and tracks
+// whose entry is 0 or less, use the defaults.
+struct compress_options
+{
+	uint32_t level;					// compression_level8
+	float precision;				// Largest error allowed on a bone, in units
+	float shell_distance;			// Distance from a bone at which the error is measured
+	uint32_t track_setting_count;	// Entries in track_precision and track_shell_distance
+	const float* track_precision;
+	const float* track_shell_distance;
+};
+
+static const compress_options default_compress_options = { uint32_t(compression_level8::highest), 0.001f, 3.f, 0, nullptr, nullptr };
+
 #pragma optimize("", off) 
-track_array_qvvf load_tracks(const char*& buffer, ansi_allocator& allocator, uint32_t sample_count, float sample_rate, uint32_t track_count)
+track_array_qvvf load_tracks(const char*& buffer, ansi_allocator& allocator, uint32_t sample_count, float sample_rate, uint32_t track_count,
+	const compress_options& options)
 {
 	track_array_qvvf raw_track_list(allocator, track_count);
 
@@ -157,8 +522,15 @@ track_array_qvvf load_tracks(const char*& buffer, ansi_allocator& allocator, uin
 
 		track_desc_transformf desc;
 		desc.output_index = i;
-		desc.precision = 0.001f;
-		desc.shell_distance = 3.f;
+		desc.precision = options.precision;
+		desc.shell_distance = options.shell_distance;
+		if (i < options.track_setting_count)
+		{
+			if (options.track_precision != nullptr && options.track_precision[i] > 0.f)
+				desc.precision = options.track_precision[i];
+			if (options.track_shell_distance != nullptr && options.track_shell_distance[i] > 0.f)
+				desc.shell_distance = options.track_shell_distance[i];
+		}
 		track_qvvf raw_track = track_qvvf::make_reserve(desc, allocator, sample_count, sample_rate);
 		for (uint32_t j = 0; j < sample_count; j++)
 		{
@@ -169,20 +541,18 @@ track_array_qvvf load_tracks(const char*& buffer, ansi_allocator& allocator, uin
 	return raw_track_list;
 }
 #pragma optimize("", on) 
-extern "C" __declspec(dllexport) python_buffer compress(const char* buffer_in)
+// Compress a raw buffer into compressed tracks owned by allocator, nullptr if ACL refuses it
+static compressed_tracks* compress_tracks(ansi_allocator& allocator, const char* buffer_in, const compress_options& options)
 {
-	ansi_allocator allocator;
-
-	float duration = *(float*)&buffer_in[0];
 	float sample_rate = *(float*)&buffer_in[4];
 	uint32_t sample_count = *(uint32_t*)&buffer_in[8];
 	uint32_t track_count = *(uint32_t*)&buffer_in[0xC];
 
-	track_array_qvvf raw_track_list = load_tracks(buffer_in, allocator, sample_count, sample_rate, track_count);
+	track_array_qvvf raw_track_list = load_tracks(buffer_in, allocator, sample_count, sample_rate, track_count, options);
 
 	compression_settings settings;
 
-	settings.level = compression_level8::highest;
+	settings.level = options.level <= uint32_t(compression_level8::highest) ? compression_level8(options.level) : compression_level8::highest;
 	settings.rotation_format = rotation_format8::quatf_drop_w_variable;
 	settings.translation_format = vector_format8::vector3f_variable;
 	settings.scale_format = vector_format8::vector3f_variable;
@@ -192,37 +562,205 @@ extern "C" __declspec(dllexport) python_buffer compress(const char* buffer_in)
 
 	output_stats stats;
 	compressed_tracks* out_compressed_tracks = nullptr;
-	compressed_tracks* root_out_compressed_tracks = nullptr;
 
 	error_result result = compress_track_list(allocator, raw_track_list, settings, out_compressed_tracks, stats);
 	if (out_compressed_tracks == nullptr)
-	{
 		std::cout << "Failed to compress anim: " << result.c_str() << std::endl;
-		python_buffer fail;
-		fail.data_buffer = nullptr;
-		fail.data_buffer_size = 0;
-		return fail;
-	}
-	
-	// String to hold data instead of file
-	std::ostringstream data_string(std::ios::binary);
+	return out_compressed_tracks;
+}
 
-	data_string.write((char*)out_compressed_tracks, out_compressed_tracks->get_size());
-	
-	std::string binary_string = data_string.str();
-	size_t buffer_out_size = binary_string.size();
+// Copy compressed tracks into a buffer for Python and free them, an empty buffer for nullptr
+static python_buffer to_python_buffer(ansi_allocator& allocator, compressed_tracks* tracks)
+{
+	python_buffer python_out;
+	python_out.data_buffer = nullptr;
+	python_out.data_buffer_size = 0;
+	if (tracks == nullptr)
+		return python_out;
 
+	size_t buffer_out_size = tracks->get_size();
 	unsigned char* buffer_out = new unsigned char[buffer_out_size];
 
-	std::copy(binary_string.begin(), binary_string.end(), buffer_out);
-
-	// std::cout << "Wrote file" << std::endl;
-
-	python_buffer python_out;
+	std::memcpy(buffer_out, tracks, buffer_out_size);
+	allocator.deallocate(tracks, buffer_out_size);
 
 	python_out.data_buffer = buffer_out;
 	python_out.data_buffer_size = buffer_out_size;
+	return python_out;
+}
 
+// Compress a raw buffer with the level and per-track precision in options
+extern "C" __declspec(dllexport) python_buffer compress_with_options(const char* buffer_in, const compress_options* options)
+{
+	if (options == nullptr)
+		options = &default_compress_options;
+
+	ansi_allocator allocator;
+	return to_python_buffer(allocator, compress_tracks(allocator, buffer_in, *options));
+}
+
+struct clip_options
+{
+	uint32_t is_additive;
+	uint32_t write_container;	// Return the whole .anm.pxd file in main instead of the two chunks
+};
+
+enum clip_error : uint32_t
+{
+	clip_ok = 0,
+	clip_main_failed = 1,
+	clip_root_failed = 2,
+};
+
+struct clip_buffers
+{
+	python_buffer main;		// Main chunk, or the whole file with write_container
+	python_buffer root;		// Root motion chunk, empty without root motion or with write_container
+	uint32_t error;			// clip_error
+};
+
+// BINA offset table entry, stores the distance to the previous pointer divided by 4
+static void append_offset(std::vector<uint8_t>& table, uint32_t delta)
+{
+	delta >>= 2;
+	if (delta < 0x40)
+	{
+		table.push_back(uint8_t(0x40 | delta));
+	}
+	else if (delta < 0x4000)
+	{
+		table.push_back(uint8_t(0x80 | (delta >> 8)));
+		table.push_back(uint8_t(delta));
+	}
+	else
+	{
+		table.push_back(uint8_t(0xC0 | (delta >> 24)));
+		table.push_back(uint8_t(delta >> 16));
+		table.push_back(uint8_t(delta >> 8));
+		table.push_back(uint8_t(delta));
+	}
+}
+
+template<typename T>
+static void write_value(unsigned char* out, size_t offset, T value)
+{
+	std::memcpy(out + offset, &value, sizeof(T));
+}
+
+// Same BINA/DATA/PXAN layout write_pxd_anim in pxd_anim.py writes for compressed animations
+static python_buffer write_container(const compressed_tracks* main_tracks, const compressed_tracks* root_tracks,
+	const anim_header& header, bool is_additive)
+{
+	const uint32_t main_size = main_tracks->get_size();
+	std::vector<uint8_t> chunk_data((const uint8_t*)main_tracks, (const uint8_t*)main_tracks + main_size);
+	uint64_t root_offset = 0;
+	if (root_tracks != nullptr)
+	{
+		const uint32_t root_size = root_tracks->get_size();
+		chunk_data.resize(chunk_data.size() + 0x10 - main_size % 0x10, 0);
+		root_offset = 0x40 + chunk_data.size();
+		chunk_data.insert(chunk_data.end(), (const uint8_t*)root_tracks, (const uint8_t*)root_tracks + root_size);
+		chunk_data.resize(chunk_data.size() + 4 - root_size % 4, 0);
+	}
+	else
+	{
+		chunk_data.resize(chunk_data.size() + 4 - main_size % 4, 0);
+	}
+
+	// Pointers to the main chunk, the PXAN data and the root chunk
+	std::vector<uint8_t> offset_table;
+	append_offset(offset_table, 0x10);
+	append_offset(offset_table, 0x28 - 0x10);
+	if (root_offset)
+		append_offset(offset_table, 0x30 - 0x28);
+	offset_table.resize(offset_table.size() + (4 - offset_table.size() % 4) % 4, 0);
+
+	const uint32_t file_size = uint32_t(0x80 + chunk_data.size() + offset_table.size());
+	python_buffer python_out;
+	python_out.data_buffer = new unsigned char[file_size];
+	python_out.data_buffer_size = file_size;
+	unsigned char* out = python_out.data_buffer;
+	std::memset(out, 0, 0x80);
+
+	// BINA
+	std::memcpy(out, "BINA210L", 8);
+	write_value<int32_t>(out, 0x8, file_size);
+	write_value<int32_t>(out, 0xC, 1);
+
+	// DATA
+	std::memcpy(out + 0x10, "DATA", 4);
+	write_value<int32_t>(out, 0x14, file_size - 0x10);
+	write_value<int32_t>(out, 0x18, int32_t(file_size - 0x40 - offset_table.size()));
+	write_value<int32_t>(out, 0x20, int32_t(offset_table.size()));
+	write_value<int32_t>(out, 0x24, 0x18);
+
+	// PXAN
+	std::memcpy(out + 0x40, "NAXP", 4);
+	write_value<int32_t>(out, 0x44, 0x200);
+	write_value<uint8_t>(out, 0x48, is_additive ? 1 : 0);
+	write_value<uint8_t>(out, 0x49, 8);
+	write_value<int32_t>(out, 0x50, 0x18);
+	write_value<float>(out, 0x58, header.duration);
+	write_value<int32_t>(out, 0x5C, header.frame_count);
+	write_value<int32_t>(out, 0x60, header.track_count);
+	write_value<int64_t>(out, 0x68, 0x40);
+	write_value<int64_t>(out, 0x70, root_offset);
+
+	std::memcpy(out + 0x80, chunk_data.data(), chunk_data.size());
+	std::memcpy(out + 0x80 + chunk_data.size(), offset_table.data(), offset_table.size());
 	return python_out;
 }
 
+// Compress the main tracks and, when root_in isn't null, the root motion track of one clip with a single allocator.
+// Null options use the defaults of compress.
+extern "C" __declspec(dllexport) clip_buffers compress_clip(const char* main_in, const char* root_in,
+	const compress_options* main_options, const compress_options* root_options, const clip_options* options)
+{
+	clip_buffers out = {};
+	ansi_allocator allocator;
+
+	compressed_tracks* main_tracks = compress_tracks(allocator, main_in, main_options ? *main_options : default_compress_options);
+	if (main_tracks == nullptr)
+	{
+		out.error = clip_main_failed;
+		return out;
+	}
+
+	compressed_tracks* root_tracks = nullptr;
+	if (root_in != nullptr)
+	{
+		root_tracks = compress_tracks(allocator, root_in, root_options ? *root_options : default_compress_options);
+		if (root_tracks == nullptr)
+		{
+			allocator.deallocate(main_tracks, main_tracks->get_size());
+			out.error = clip_root_failed;
+			return out;
+		}
+	}
+
+	if (options != nullptr && options->write_container)
+	{
+		anim_header header;
+		header.duration = *(const float*)&main_in[0];
+		header.sample_rate = *(const float*)&main_in[4];
+		header.frame_count = *(const uint32_t*)&main_in[8];
+		header.track_count = *(const uint32_t*)&main_in[0xC];
+		out.main = write_container(main_tracks, root_tracks, header, options->is_additive != 0);
+
+		allocator.deallocate(main_tracks, main_tracks->get_size());
+		if (root_tracks != nullptr)
+			allocator.deallocate(root_tracks, root_tracks->get_size());
+		return out;
+	}
+
+	out.main = to_python_buffer(allocator, main_tracks);
+	out.root = to_python_buffer(allocator, root_tracks);
+	return out;
+}
+
+// Highest level and 1mm precision on every bone
+extern "C" __declspec(dllexport) python_buffer compress(const char* buffer_in)
+{
+	return compress_with_options(buffer_in, &default_compress_options);
+}
+
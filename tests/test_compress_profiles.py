@@ -0,0 +1,59 @@
+"""
+Bone matching of the compression profiles, run from the repository root with
+    python -m unittest discover tests
+"""
+
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Blender"))
+
+from FrontiersAnimationTools.animation.compress_profiles import (bone_words,
+                                                                 compress_settings,
+                                                                 parse_overrides,
+                                                                 track_precisions,
+                                                                 )
+
+
+class BoneWordsTest(unittest.TestCase):
+    def test_splits_separators_case_and_digits(self):
+        self.assertEqual(bone_words("RingFinger01_L"), ["ring", "finger", "01", "l"])
+        self.assertEqual(bone_words("Spring_hair.R"), ["spring", "hair", "r"])
+        self.assertEqual(bone_words("HIPSBone"), ["hips", "bone"])
+        self.assertEqual(bone_words("EyeLid_U_L"), ["eye", "lid", "u", "l"])
+
+
+class ProfilePrecisionTest(unittest.TestCase):
+    def precisions(self, profile, names):
+        return dict(zip(names, compress_settings(profile, names).track_precision.tolist()))
+
+    def test_detail_bones_match(self):
+        names = ["Ring1_L", "Index_01_R", "LeftHandThumb2", "Eye_L", "EyeLid_U", "Lip_Upper", "Jaw", "Brow.L"]
+        for name, precision in self.precisions("profile_shipping", names).items():
+            self.assertAlmostEqual(precision, 0.0025, msg=name)
+        for name, precision in self.precisions("profile_fast", names).items():
+            self.assertAlmostEqual(precision, 0.02, msg=name)
+
+    def test_unrelated_bones_do_not_match(self):
+        names = ["Spring_hair", "Earring_L", "Slide_01", "SpringBone", "Skirt_middleman",
+                 "Eyeglass", "Clip_R", "Indexer", "Hair_root", "Torso"]
+        for profile in ("profile_shipping", "profile_fast"):
+            for name, precision in self.precisions(profile, names).items():
+                self.assertEqual(precision, 0.0, msg=f"{profile} {name}")
+
+    def test_core_bones_match(self):
+        names = ["Reference", "Root", "Hips", "Pelvis_Ctrl"]
+        for name, precision in self.precisions("profile_shipping", names).items():
+            self.assertAlmostEqual(precision, 0.0002, msg=name)
+
+    def test_user_overrides_match_whole_names(self):
+        precisions = track_precisions(["Hips", "Hips_Ctrl", "Finger1_L"], parse_overrides("hips=0.0001, *finger*=0.005"))
+        self.assertAlmostEqual(float(precisions[0]), 0.0001)
+        self.assertEqual(float(precisions[1]), 0.0)
+        self.assertAlmostEqual(float(precisions[2]), 0.005)
+
+
+if __name__ == "__main__":
+    unittest.main()
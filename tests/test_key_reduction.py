@@ -0,0 +1,79 @@
+"""
+Keyframe reduction of decoded channels, run from the repository root with
+    python -m unittest discover tests
+"""
+
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Blender"))
+
+from FrontiersAnimationTools.animation.key_reduction import reduce_channel, reduce_pose_keys
+
+
+def interpolate_kept(frames, values, keep):
+    return np.stack([np.interp(frames, frames[keep], values[keep, c]) for c in range(values.shape[1])], axis=1)
+
+
+class ReduceChannelTest(unittest.TestCase):
+    def test_linear_ramp_keeps_endpoints(self):
+        frames = np.arange(10)
+        values = np.stack((frames * 0.5, frames * -2.0), axis=1)
+        self.assertEqual(np.flatnonzero(reduce_channel(frames, values, 1e-6)).tolist(), [0, 9])
+
+    def test_still_channel_keeps_first_key(self):
+        frames = np.arange(8)
+        values = np.full((8, 3), 2.0) + np.linspace(0.0, 1e-4, 8)[:, None]
+        self.assertEqual(np.flatnonzero(reduce_channel(frames, values, 1e-3)).tolist(), [0])
+
+    def test_moving_last_key_is_kept(self):
+        frames = np.arange(6)
+        values = np.zeros((6, 1))
+        values[-1] = 1.0
+        self.assertEqual(np.flatnonzero(reduce_channel(frames, values, 0.01)).tolist(), [0, 4, 5])
+
+    def test_spike_against_tolerance(self):
+        frames = np.arange(9)
+        values = np.zeros((9, 1))
+        values[4] = 0.5
+        self.assertTrue(reduce_channel(frames, values, 0.1)[4])
+        # Below tolerance the whole channel holds still
+        self.assertEqual(np.flatnonzero(reduce_channel(frames, values, 0.6)).tolist(), [0])
+
+    def test_kept_keys_stay_within_tolerance(self):
+        rng = np.random.default_rng(3)
+        frames = np.arange(0, 120, 2)
+        values = np.cumsum(rng.normal(scale=0.1, size=(len(frames), 4)), axis=0)
+        for tolerance in (0.001, 0.05, 0.2):
+            keep = reduce_channel(frames, values, tolerance)
+            self.assertTrue(keep[0] and keep[-1])
+            error = np.abs(interpolate_kept(frames, values, keep) - values).max()
+            self.assertLessEqual(error, tolerance + 1e-9)
+
+    def test_no_keys(self):
+        self.assertEqual(reduce_channel(np.arange(0), np.empty((0, 3)), 0.1).size, 0)
+
+
+class ReducePoseKeysTest(unittest.TestCase):
+    def test_only_keyed_frames_are_kept(self):
+        frames = np.arange(5)
+        loc = np.zeros((5, 2, 3))
+        loc[:, 1, 0] = (0.0, 1.0, 2.0, 5.0, 5.0)
+        rot = np.tile((1.0, 0.0, 0.0, 0.0), (5, 2, 1))
+        scale = np.ones((5, 2, 3))
+        key_mask = np.ones((5, 2, 3), dtype=bool)
+        key_mask[1, 1, 0] = False
+
+        reduced = reduce_pose_keys(frames, loc, rot, scale, 1e-4, key_mask=key_mask)
+        self.assertEqual(np.flatnonzero(reduced[:, 0, 0]).tolist(), [0])
+        self.assertEqual(np.flatnonzero(reduced[:, 1, 0]).tolist(), [0, 2, 3, 4])
+        self.assertFalse(np.any(reduced & ~key_mask))
+        self.assertEqual(np.flatnonzero(reduced[:, 1, 1]).tolist(), [0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Round trips between Blender poses and raw pose tables, run from the repository root with
+    python -m unittest discover tests
+"""
+
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Blender"))
+
+from FrontiersAnimationTools.animation.pose_arrays import (LENGTH, LOC, ROT, SCALE,
+                                                           compose_matrices,
+                                                           decode_pose_table,
+                                                           decode_root_table,
+                                                           encode_pose_table,
+                                                           encode_root_table,
+                                                           quat_normalize,
+                                                           )
+
+PARENTS = np.array((-1, 0, 1, 1, -1, 4, 2))
+
+
+def random_rotations(rng, shape):
+    return quat_normalize(rng.normal(size=shape + (4,)))
+
+
+def assert_same_rotation(actual, expected):
+    # q and -q are the same rotation
+    dot = np.abs(np.sum(actual * expected, axis=-1))
+    np.testing.assert_allclose(dot, 1.0, atol=1e-5)
+
+
+class PoseTableRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        frame_count, bone_count = 5, len(PARENTS)
+        self.loc = rng.uniform(-2.0, 2.0, (frame_count, bone_count, 3))
+        self.rot = random_rotations(rng, (frame_count, bone_count))
+        self.scales = rng.uniform(0.5, 2.0, (frame_count, bone_count, 3))
+        self.lengths = rng.uniform(0.1, 1.0, bone_count)
+
+        # Pose matrices from parent-relative transforms, with an unrelated scale on top to check that
+        # only the parent's rotation and location are taken out
+        local = compose_matrices(self.loc, self.rot, np.ones_like(self.loc))
+        unscaled = np.empty_like(local)
+        for b, parent in enumerate(PARENTS):
+            unscaled[:, b] = local[:, b] if parent < 0 else unscaled[:, parent] @ local[:, b]
+        self.matrices = unscaled.copy()
+        self.matrices[..., :3, :3] *= rng.uniform(0.5, 2.0, (frame_count, bone_count, 1, 3))
+
+    def round_trip(self, use_yx):
+        table = encode_pose_table(self.matrices, self.scales, PARENTS, self.lengths, use_yx=use_yx)
+        self.assertEqual(table.shape, self.loc.shape[:2] + (12,))
+        np.testing.assert_array_equal(table[..., 11], 1.0)
+        return table, decode_pose_table(table, use_yx=use_yx, root_tracks=np.flatnonzero(PARENTS < 0))
+
+    def check_decoded(self, decoded):
+        np.testing.assert_allclose(decoded[..., LOC], self.loc, atol=1e-5)
+        assert_same_rotation(decoded[..., ROT], self.rot)
+        np.testing.assert_allclose(decoded[..., SCALE], self.scales, rtol=1e-6)
+
+    def test_xz_round_trip(self):
+        table, decoded = self.round_trip(use_yx=False)
+        self.check_decoded(decoded)
+        expected_lengths = np.where(PARENTS >= 0, self.lengths, 0.0) * self.scales[..., 0]
+        np.testing.assert_allclose(table[..., LENGTH], expected_lengths, rtol=1e-6)
+
+    def test_yx_round_trip(self):
+        table, decoded = self.round_trip(use_yx=True)
+        self.check_decoded(decoded)
+        expected_lengths = np.where(PARENTS >= 0, self.lengths, 0.0) * self.scales[..., 1]
+        np.testing.assert_allclose(table[..., LENGTH], expected_lengths, rtol=1e-6)
+
+    def test_yx_swaps_axes(self):
+        # Blender's Y axis is the raw X axis
+        matrices = compose_matrices(np.array([[[0.0, 1.0, 0.0]]]), np.array([[[1.0, 0.0, 0.0, 0.0]]]),
+                                    np.ones((1, 1, 3)))
+        matrices = np.concatenate((np.eye(4)[None, None], matrices), axis=1)
+        table = encode_pose_table(matrices, np.ones((1, 2, 3)), (-1, 0), (0.0, 0.0), use_yx=True)
+        np.testing.assert_allclose(table[0, 1, LOC], (1.0, 0.0, 0.0), atol=1e-6)
+
+    def test_writes_into_out(self):
+        out = np.zeros(self.loc.shape[:2] + (12,), dtype=np.float32)
+        table = encode_pose_table(self.matrices, self.scales, PARENTS, self.lengths, out=out)
+        self.assertIs(table, out)
+        self.assertTrue(np.all(out[..., 11] == 1.0))
+
+    def test_zero_scale_decodes_as_one(self):
+        table, _ = self.round_trip(use_yx=True)
+        table[0, 2, SCALE] = 0.0
+        decoded = decode_pose_table(table, use_yx=True)
+        np.testing.assert_array_equal(decoded[0, 2, SCALE], 1.0)
+
+
+class RootTableRoundTripTest(unittest.TestCase):
+    def test_round_trip(self):
+        rng = np.random.default_rng(11)
+        loc = rng.uniform(-5.0, 5.0, (6, 3))
+        rot = random_rotations(rng, (6,))
+        scale = rng.uniform(0.5, 2.0, (6, 3))
+
+        table = encode_root_table(loc, rot, scale)
+        self.assertEqual(table.shape, (6, 1, 12))
+        decoded = decode_root_table(table)[:, 0]
+        np.testing.assert_allclose(decoded[:, LOC], loc, atol=1e-5)
+        assert_same_rotation(decoded[:, ROT], rot)
+        np.testing.assert_allclose(decoded[:, SCALE], scale, rtol=1e-6)
+
+    def test_z_up_to_y_up(self):
+        table = encode_root_table(np.array([[1.0, 2.0, 3.0]]), np.array([[1.0, 0.0, 0.0, 0.0]]), np.ones((1, 3)))
+        np.testing.assert_allclose(table[0, 0, LOC], (1.0, 3.0, -2.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
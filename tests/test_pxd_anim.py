@@ -0,0 +1,105 @@
+"""
+Writing and reading back uncompressed PXD animations, run from the repository root with
+    python -m unittest discover tests
+"""
+
+
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Blender"))
+
+from FrontiersAnimationTools.animation.pxd_anim import (UNCOMPRESSED_MAX_FRAMES,
+                                                        PXDFile,
+                                                        densify_tracks,
+                                                        raw_table_to_tracks,
+                                                        write_pxd_anim_uncompressed,
+                                                        )
+
+
+def random_table(rng, frame_count, track_count):
+    table = rng.uniform(-1.0, 1.0, (frame_count, track_count, 12)).astype(np.float32)
+    # Bone lengths aren't stored with uncompressed keys
+    table[..., 7] = 0.0
+    table[..., 11] = 1.0
+    return table
+
+
+class UncompressedRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.table = random_table(rng, 9, 4)
+        # Held and repeated poses, so changed-only channels have gaps between their keys
+        self.table[3:6, 1] = self.table[2, 1]
+        self.table[:, 2, 0:4] = self.table[0, 2, 0:4]
+        self.table[5:, 3, 8:12] = self.table[4, 3, 8:12]
+        self.root_table = random_table(rng, 9, 1)
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filepath = os.path.join(directory.name, "test.anm.pxd")
+
+    def write(self, changed_only, root=True, is_additive=False):
+        main_tracks = raw_table_to_tracks(self.table, changed_only=changed_only)
+        root_tracks = raw_table_to_tracks(self.root_table, changed_only=changed_only) if root else None
+        with open(self.filepath, "wb") as file:
+            write_pxd_anim_uncompressed(file, main_tracks, root_tracks, 8 / 30, len(self.table),
+                                        is_additive=is_additive)
+        return main_tracks
+
+    def read(self):
+        pxd_file = PXDFile(self.filepath)
+        self.addCleanup(pxd_file.close)
+        anim_param = pxd_file.anim_param
+        self.assertIsNone(anim_param.error)
+        self.assertFalse(anim_param.is_compressed)
+        self.assertEqual((anim_param.frame_count, anim_param.track_count), self.table.shape[:2])
+        return pxd_file, anim_param
+
+    def test_every_frame_keyed(self):
+        self.write(changed_only=False)
+        pxd_file, anim_param = self.read()
+        tracks = pxd_file.tracks(anim_param.track_count, anim_param.main_offset, copy=True)
+        for channels in tracks:
+            for frames, values in channels:
+                self.assertEqual(frames.tolist(), list(range(len(self.table))))
+        np.testing.assert_array_equal(densify_tracks(tracks, anim_param.frame_count), self.table)
+
+    def test_changed_keys_only(self):
+        written = self.write(changed_only=True)
+        pxd_file, anim_param = self.read()
+        tracks = pxd_file.tracks(anim_param.track_count, anim_param.main_offset, copy=True)
+        for written_channels, read_channels in zip(written, tracks):
+            for (written_frames, written_values), (frames, values) in zip(written_channels, read_channels):
+                np.testing.assert_array_equal(frames, written_frames)
+                np.testing.assert_array_equal(values, written_values[:, :values.shape[1]])
+        # Rotation of the still track is only keyed once
+        self.assertEqual(len(tracks[2][1][0]), 1)
+        np.testing.assert_array_equal(densify_tracks(tracks, anim_param.frame_count), self.table)
+
+    def test_root_track(self):
+        self.write(changed_only=True, is_additive=True)
+        pxd_file, anim_param = self.read()
+        self.assertTrue(anim_param.is_additive)
+        self.assertIsNotNone(anim_param.root_offset)
+        root_tracks = pxd_file.tracks(1, anim_param.root_offset, copy=True)
+        np.testing.assert_array_equal(densify_tracks(root_tracks, anim_param.frame_count), self.root_table)
+
+    def test_without_root_track(self):
+        self.write(changed_only=True, root=False)
+        _, anim_param = self.read()
+        self.assertFalse(anim_param.is_additive)
+        self.assertIsNone(anim_param.root_offset)
+
+    def test_too_many_frames(self):
+        table = np.zeros((UNCOMPRESSED_MAX_FRAMES + 1, 1, 12), dtype=np.float32)
+        with self.assertRaises(ValueError):
+            raw_table_to_tracks(table)
+
+
+if __name__ == "__main__":
+    unittest.main()